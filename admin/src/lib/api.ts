@@ -25,6 +25,30 @@ function buildUrl(path: string): string {
   return `${baseUrl}${path}`;
 }
 
+// Fetches every page of a keyset-paginated list, following X-Next-Cursor.
+export async function apiFetchAll<T>(
+  path: string,
+  params: Record<string, string> = {},
+  init?: RequestInit
+): Promise<ApiResponse<T[]>> {
+  const rows: T[] = [];
+  let cursor: string | null = null;
+  for (;;) {
+    const query = new URLSearchParams({ limit: '500', ...params });
+    if (cursor) query.set('cursor', cursor);
+    const res = await fetch(buildUrl(`${path}?${query}`), init);
+    const data = await res.json().catch(() => ({}));
+    if (!res.ok) {
+      return { ok: false, status: res.status, url: res.url, data: data as T[] };
+    }
+    rows.push(...(data as T[]));
+    cursor = res.headers.get('X-Next-Cursor');
+    if (!cursor) {
+      return { ok: true, status: res.status, url: res.url, data: rows };
+    }
+  }
+}
+
 function getAuthHeaders(): Record<string, string> {
   const token =
     typeof window !== 'undefined' ? localStorage.getItem('access_token') : null;
@@ -50,7 +74,7 @@ export function updateMenuItem(id: number, payload: Partial<{ name: string; desc
   return apiFetch<any>(buildUrl(`/admin/menu/items/${id}`), { method: 'PATCH', headers: getAuthHeaders(), body: JSON.stringify(payload) });
 }
 
-export function getAdminOrders() { return apiFetch<any[]>(buildUrl('/api/admin/orders/'), { headers: getAuthHeaders() }); }
+export function getAdminOrders() { return apiFetchAll<any>('/api/admin/orders/', {}, { headers: getAuthHeaders() }); }
 export function getAdminOrdersTally() { return apiFetch<any>(buildUrl('/api/admin/orders/tally'), { headers: getAuthHeaders() }); }
 export function updateAdminOrderStatus(orderId: number, status: string) {
   return apiFetch<any>(buildUrl(`/api/admin/orders/${orderId}/status`), { method: 'PATCH', headers: getAuthHeaders(), body: JSON.stringify({ status }) });
@@ -65,7 +89,7 @@ export function createAdminOrder(payload: any) {
   return apiFetch<any>(buildUrl('/api/admin/orders/'), { method: 'POST', headers: getAuthHeaders(), body: JSON.stringify(payload) });
 }
 
-export function getCustomers() { return apiFetch<any[]>(buildUrl('/api/admin/customers/'), { headers: getAuthHeaders() }); }
+export function getCustomers() { return apiFetchAll<any>('/api/admin/customers/', {}, { headers: getAuthHeaders() }); }
 export function createCustomer(payload: any) {
   return apiFetch<any>(buildUrl('/api/admin/customers/'), { method: 'POST', headers: getAuthHeaders(), body: JSON.stringify(payload) });
 }
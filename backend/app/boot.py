@@ -0,0 +1,253 @@
+"""
+Startup phases and the fast-boot mode for scale-to-zero hosts.
+
+Every startup phase is timed. The timings are logged once startup completes
+and exported on /metrics as ``app_startup_phase_seconds``.
+
+By default the startup hook does all the work before the server accepts
+connections. With ``FAST_BOOT=true`` it returns at once and the work is split:
+
+* warm-up, on a background thread: the migration check (one query on an
+  up-to-date schema, see app.db_migrations) and the tally check. ``/health``
+  and ``/metrics`` answer straight away; other requests wait for warm-up.
+* deferred, after the first request has been served: the demo seed, the
+  ``stripe`` import, the order event listener, the idempotency key purger
+  and the Stripe inbox worker.
+
+With several worker processes (app.serve) every worker runs startup. The
+migrations, the tally check and the seed hold ``startup_lock`` so only one
+worker at a time does them. The others then find nothing left to do.
+"""
+import asyncio
+import logging
+import threading
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterator, Optional
+
+from sqlalchemy import text
+
+from .config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# app.main imports this module first, so this is close to when imports began.
+IMPORTS_STARTED = time.perf_counter()
+
+# Requests that never wait for warm-up.
+UNGATED_PATHS = {"/health", "/metrics"}
+# Run the deferred phases anyway if no request arrives this long after warm-up.
+DEFERRED_FALLBACK_SECONDS = 30.0
+# pg_advisory_lock key shared by every worker of this app.
+STARTUP_LOCK_KEY = zlib.crc32(b"foodbiz:startup")
+STARTUP_LOCK_POLL_SECONDS = 0.5
+
+
+class BootState:
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.ready = threading.Event()
+        self.error: Optional[BaseException] = None
+        self._deferred_lock = threading.Lock()
+        self._deferred_started = False
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - started, 4)
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.phases.items())
+
+    @property
+    def deferred_started(self) -> bool:
+        return self._deferred_started
+
+    def claim_deferred(self) -> bool:
+        with self._deferred_lock:
+            if self._deferred_started:
+                return False
+            self._deferred_started = True
+            return True
+
+
+state = BootState()
+
+
+@contextmanager
+def startup_lock(engine) -> Iterator[None]:
+    """
+    Serialize once-only startup work across worker processes: a session
+    advisory lock on Postgres, an flock on a file next to the SQLite database.
+    """
+    if engine.dialect.name.startswith("postgres"):
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            # Poll rather than block in pg_advisory_lock: a waiting statement
+            # holds a snapshot, and the holder's CREATE INDEX CONCURRENTLY
+            # waits for every older snapshot to end, so the two would deadlock.
+            while not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": STARTUP_LOCK_KEY}).scalar():
+                time.sleep(STARTUP_LOCK_POLL_SECONDS)
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": STARTUP_LOCK_KEY})
+        return
+
+    database = engine.url.database
+    if fcntl is None or not database or database == ":memory:":
+        yield
+        return
+    with open(f"{database}.startup-lock", "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def warm_up() -> None:
+    """Work that must finish before requests touch the database."""
+    from .db import SessionLocal, engine
+    from .db_migrations import reset_database, run_migrations
+    from .tally import ensure_initialized as ensure_tally_initialized
+
+    with ExitStack() as stack:
+        # Time spent waiting for another worker's startup shows up here.
+        with state.phase("startup_lock"):
+            stack.enter_context(startup_lock(engine))
+
+        with state.phase("migrations"):
+            if settings.RESET_DB_ON_STARTUP:
+                reset_database(engine)
+            run_migrations(engine)
+
+        with state.phase("tally"):
+            # Not deferrable: order writes increment an empty tally, which would
+            # then look initialized and never be rebuilt.
+            db = SessionLocal()
+            try:
+                ensure_tally_initialized(db)
+            finally:
+                db.close()
+
+
+def run_deferred() -> None:
+    """Work the first request doesn't need."""
+    if settings.SEED_DEMO_DATA:
+        from .cache import PUBLIC_MENU_KEY, public_cache
+        from .db import SessionLocal, engine
+        from .seed import seed_demo_menu_if_empty
+
+        with state.phase("seed"), startup_lock(engine):
+            db = SessionLocal()
+            try:
+                if seed_demo_menu_if_empty(db):
+                    public_cache.invalidate(PUBLIC_MENU_KEY)
+            finally:
+                db.close()
+
+    if settings.STRIPE_SECRET_KEY or settings.STRIPE_WEBHOOK_SECRET:
+        with state.phase("stripe_import"):
+            try:
+                import stripe  # noqa: F401  (warms the import for the first checkout)
+            except ImportError:
+                pass
+
+    from .order_events import listener as order_events_listener
+
+    with state.phase("order_events"):
+        order_events_listener.start()
+
+    from .idempotency import purger as idempotency_purger
+
+    with state.phase("idempotency_purge"):
+        idempotency_purger.start()
+
+    if settings.STRIPE_WEBHOOK_SECRET:
+        from .stripe_inbox import worker as stripe_inbox_worker
+
+        with state.phase("stripe_inbox"):
+            stripe_inbox_worker.start()
+
+
+def _run_deferred_once() -> None:
+    if not state.claim_deferred():
+        return
+    try:
+        run_deferred()
+    except Exception:
+        logger.exception("Deferred startup work failed")
+    logger.info("Deferred startup phases done: %s", state.summary())
+
+
+def _warm_up_in_background() -> None:
+    try:
+        warm_up()
+    except BaseException as exc:
+        state.error = exc
+        logger.exception("Startup warm-up failed; requests will get 503 until restart")
+        return
+    finally:
+        state.ready.set()
+    logger.info("Warm-up done: %s", state.summary())
+    timer = threading.Timer(DEFERRED_FALLBACK_SECONDS, _run_deferred_once)
+    timer.daemon = True
+    timer.start()
+
+
+def startup() -> None:
+    """Called from the app's startup hook."""
+    state.phases["imports"] = round(time.perf_counter() - IMPORTS_STARTED, 4)
+    if settings.FAST_BOOT:
+        threading.Thread(target=_warm_up_in_background, name="boot-warm-up", daemon=True).start()
+        return
+
+    warm_up()
+    state.ready.set()
+    run_deferred()
+    state.claim_deferred()
+    logger.info("Startup phases: %s", state.summary())
+
+
+async def _send_json(send, status: int, body: bytes) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class FastBootMiddleware:
+    """Holds requests until warm-up finishes, then kicks off the deferred work."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in UNGATED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        while not state.ready.is_set():
+            await asyncio.sleep(0.01)
+        if state.error is not None:
+            await _send_json(send, 503, b'{"detail":"Service failed to start"}')
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if not state.deferred_started:
+                threading.Thread(target=_run_deferred_once, name="boot-deferred", daemon=True).start()
@@ -0,0 +1,140 @@
+"""
+In-process cache for serialized public responses.
+
+Entries hold the rendered JSON body plus a content-hash ETag. Admin writes
+bump the entry's version via ``invalidate``; a build that started before an
+invalidation is served to its caller but never stored. Concurrent misses for
+the same key wait on a per-key lock so only one of them rebuilds.
+
+Reads happen on the event loop (the public routes are async); ``invalidate``
+may be called from sync routes running in the threadpool.
+
+Each entry also keeps its body compressed in every encoding asked for so far,
+so a hot public response is compressed once per rebuild, not per request.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from .compression import compress, negotiate
+from .config import settings
+
+PUBLIC_MENU_KEY = "public_menu"
+PUBLIC_SETTINGS_KEY = "public_settings"
+
+
+@dataclass(frozen=True)
+class CachedBody:
+    body: bytes
+    etag: str
+    version: int
+    built_at: float
+    encoded: Dict[str, bytes] = field(default_factory=dict, compare=False)
+
+    def body_for(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.body
+        body = self.encoded.get(encoding)
+        if body is None:
+            body = self.encoded[encoding] = compress(self.body, encoding)
+        return body
+
+
+def render_json(data: Any) -> bytes:
+    """Render data exactly as FastAPI's default JSONResponse would."""
+    return json.dumps(
+        jsonable_encoder(data),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def _etag_for(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class ResponseCache:
+    def __init__(self, ttl_seconds: float):
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[str, CachedBody] = {}
+        self._versions: Dict[str, int] = {}
+        self._build_locks: Dict[str, asyncio.Lock] = {}
+
+    def _fresh(self, key: str) -> Optional[CachedBody]:
+        entry = self._entries.get(key)
+        if entry is None or entry.version != self._versions.get(key, 0):
+            return None
+        if self._ttl > 0 and time.monotonic() - entry.built_at > self._ttl:
+            return None
+        return entry
+
+    def _build_lock(self, key: str) -> asyncio.Lock:
+        lock = self._build_locks.get(key)
+        if lock is None:
+            lock = self._build_locks[key] = asyncio.Lock()
+        return lock
+
+    async def get_or_build(self, key: str, builder: Callable[[], Awaitable[bytes]]) -> CachedBody:
+        entry = self._fresh(key)
+        if entry is not None:
+            return entry
+
+        async with self._build_lock(key):
+            # Another request may have rebuilt the entry while we waited.
+            entry = self._fresh(key)
+            if entry is not None:
+                return entry
+
+            version = self._versions.get(key, 0)
+            body = await builder()
+            entry = CachedBody(body=body, etag=_etag_for(body), version=version, built_at=time.monotonic())
+            with self._lock:
+                if self._versions.get(key, 0) == version:
+                    self._entries[key] = entry
+            return entry
+
+    def invalidate(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+                self._entries.pop(key, None)
+
+
+public_cache = ResponseCache(ttl_seconds=settings.PUBLIC_CACHE_TTL_SECONDS)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison per RFC 9110: W/"x" matches "x".
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+async def cached_json_response(
+    request: Request, key: str, builder: Callable[[], Awaitable[bytes]]
+) -> Response:
+    """Serve a cached JSON body, answering 304 when the client's ETag still matches."""
+    entry = await public_cache.get_or_build(key, builder)
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    encoding = None
+    if settings.COMPRESSION_ENABLED and len(entry.body) >= settings.COMPRESSION_MIN_SIZE:
+        encoding = negotiate(request.headers.get("accept-encoding"))
+    if encoding is not None:
+        # Same weak ETag as app.compression gives responses it compresses.
+        headers["ETag"] = "W/" + entry.etag
+    if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=entry.body_for(encoding), media_type="application/json", headers=headers)
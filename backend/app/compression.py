@@ -0,0 +1,188 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+``CompressionMiddleware`` compresses dynamic responses (the JSON APIs, the
+order export) on the way out: brotli when the client accepts it and the
+``brotli`` package is installed, otherwise gzip. It leaves alone:
+
+* bodies smaller than ``minimum_size``, where the headers cost more than
+  compression saves;
+* ``text/event-stream``, whose events must reach the client as they are sent;
+* responses that already have a Content-Encoding. These are precompressed
+  static files (see app.static_files) and cached public responses (see
+  app.cache), which are compressed once instead of on every request;
+* partial content, and types that are already compressed (images).
+
+Streaming responses are compressed chunk by chunk, and each chunk is flushed,
+so the order export still starts before its query finishes. A compressed
+response's strong ETag is made weak (``W/"..."``), as it no longer names the
+exact bytes. app.cache compares ETags weakly, so revalidation still gets 304.
+"""
+import zlib
+from typing import Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+# Levels for compressing per request, where speed matters as much as size.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+# Levels for precompressing static files once, at build time.
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+EXCLUDED_TYPES = ("text/event-stream",)
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    """Encodings we can produce, most preferred first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: Optional[str], offered: Tuple[str, ...] = None) -> Optional[str]:
+    """
+    The best of ``offered`` (default: ``supported_encodings()``) for an
+    Accept-Encoding header, or None for identity. Higher q-values win, ties
+    go to the earlier offer; ``q=0`` rules an encoding out and ``*`` covers
+    any encoding not named.
+    """
+    if not accept_encoding:
+        return None
+    offered = supported_encodings() if offered is None else offered
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        coding, q = coding.strip(), 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            weights[coding] = q
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in offered:
+        q = weights.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compressible(content_type: Optional[str]) -> bool:
+    content_type = (content_type or "").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith(EXCLUDED_TYPES)
+
+
+class Compressor:
+    """Incremental gzip or brotli encoder."""
+
+    def __init__(self, encoding: str, level: Optional[int] = None):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY if level is None else level)
+        else:
+            # wbits 31: a gzip header and trailer around the deflate stream.
+            self._zlib = zlib.compressobj(GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool = False) -> bytes:
+        """Encode ``data`` and flush it out, ending the stream when ``final``."""
+        if self.encoding == "br":
+            out = self._brotli.process(data) if data else b""
+            return out + (self._brotli.finish() if final else self._brotli.flush())
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    return Compressor(encoding, level).compress(data, final=True)
+
+
+def add_vary(headers: MutableHeaders) -> None:
+    vary = headers.get("vary", "")
+    if "accept-encoding" not in vary.lower():
+        headers["Vary"] = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+
+
+def weaken_etag(headers: MutableHeaders) -> None:
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = "W/" + etag
+
+
+class CompressionMiddleware:
+    """Pure ASGI, so streaming responses stay streamed."""
+
+    def __init__(self, app, minimum_size: int = 1024, exclude_paths: Tuple[str, ...] = ()):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        start = None
+        compressor: Optional[Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress.
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+            if compressor is not None:
+                more_body = message.get("more_body", False)
+                body = compressor.compress(message.get("body", b""), final=not more_body)
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            headers = MutableHeaders(scope=start)
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            eligible = (
+                start["status"] not in (204, 206, 304)
+                and "content-encoding" not in headers
+                and compressible(headers.get("content-type"))
+            )
+            if eligible:
+                add_vary(headers)
+            if not eligible or encoding is None or (not more_body and len(body) < self.minimum_size):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            compressor = Compressor(encoding)
+            body = compressor.compress(body, final=not more_body)
+            headers["Content-Encoding"] = encoding
+            weaken_etag(headers)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
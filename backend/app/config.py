@@ -12,6 +12,17 @@ class Settings(BaseSettings):
     # pydantic v1 BaseSettings will read the first matching env var in order.
     DB_URL: str = "sqlite:///./project_genesis.db"
 
+    # Connection pool. Ignored for in-memory SQLite, which shares one connection.
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # seconds; Render Postgres drops idle connections
+    DB_POOL_PRE_PING: bool = True
+    # Abort any single SQL statement running longer than this. 0 disables it.
+    DB_STATEMENT_TIMEOUT_MS: int = 15000
+    # Use SQLite's write-ahead log so reads don't block writers (file databases only).
+    SQLITE_WAL: bool = True
+
     # Comma-separated allowed CORS origins.
     # Leave empty to allow only localhost:3000 + localhost:3001 (dev default).
     # In production set to: "https://yourdomain.com,https://www.yourdomain.com,https://admin.yourdomain.com"
@@ -21,10 +32,65 @@ class Settings(BaseSettings):
     # NEVER set to true in production.
     RESET_DB_ON_STARTUP: bool = False
 
+    # Scale-to-zero hosts: start serving at once and do the database warm-up
+    # in the background (see app.boot). /health answers immediately; other
+    # requests wait for warm-up. Seeding and Stripe start after the first request.
+    FAST_BOOT: bool = False
+
+    # Worker processes for `python -m app.serve`; 0 = one per usable CPU.
+    WEB_CONCURRENCY: int = 0
+
+    # Menu photo uploads (app.photos): largest accepted file, and threads
+    # rendering the resized variants (0 = one per variant, up to the usable CPUs).
+    PHOTO_MAX_UPLOAD_MB: int = 15
+    PHOTO_WORKERS: int = 0
+    # Where uploaded photos are stored; must be persistent storage (a mounted
+    # disk) in production, where uploads are refused until it is set. Empty =
+    # backend/media/menu_photos, for development.
+    PHOTO_DIR: str = ""
+
+    # Rows per transaction when a migration backfills an existing table.
+    MIGRATION_BATCH_SIZE: int = 5000
+
     # Set to true in demo/dev to seed a starter menu when DB has no menu data.
     # Seeding is skipped automatically if existing menu data is present.
     SEED_DEMO_DATA: bool = False
 
+    # Upper bound on how long a cached public menu/settings response is served.
+    # Admin writes invalidate the cache immediately in the process that handled
+    # them; the TTL bounds staleness in any other worker processes. 0 = no TTL.
+    PUBLIC_CACHE_TTL_SECONDS: int = 30
+
+    # gzip/brotli for responses of at least COMPRESSION_MIN_SIZE bytes, when the
+    # client accepts it. Static files are precompressed at build time instead
+    # (python -m app.static_files).
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+
+    # Serve the admin order, customer and menu week lists from column-projected
+    # queries encoded straight to JSON (orjson if installed), skipping pydantic
+    # validation. Same bytes as the default path; see app.serialization.
+    FAST_SERIALIZATION: bool = False
+
+    # Live order feed (GET /api/admin/orders/events). Idle streams get a
+    # keep-alive comment this often; events stay resumable for the retention.
+    ORDER_FEED_KEEPALIVE_SECONDS: float = 15.0
+    ORDER_EVENTS_RETENTION_HOURS: int = 72
+
+    # How long an Idempotency-Key on POST /api/public/orders/ replays the
+    # original response. Expired keys are purged in the background.
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24
+
+    # Request/SQL metrics served at GET /metrics in Prometheus text format.
+    # When METRICS_TOKEN is set, scrapes must send "Authorization: Bearer <token>".
+    # In production metrics stay off until a token is set.
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: str = ""
+
+    # Development aid: add X-Query-Count (and X-Query-Repeated on suspected
+    # N+1s) to every response and log repeated SQL. Ignored in production.
+    QUERY_AUDIT: bool = False
+
     # Stripe — leave empty to run without Stripe (checkout endpoints will return 503)
     STRIPE_SECRET_KEY: str = ""
     STRIPE_WEBHOOK_SECRET: str = ""
@@ -32,6 +98,14 @@ class Settings(BaseSettings):
         "http://localhost:3000/order/success?session_id={CHECKOUT_SESSION_ID}"
     )
     STRIPE_CANCEL_URL: str = "http://localhost:3000/order/cancel"
+    # Override the Stripe API host, e.g. http://localhost:12111 for stripe-mock.
+    STRIPE_API_BASE: str = ""
+
+    # Webhook inbox worker: events are acknowledged on receipt and applied by
+    # a background worker that retries failures with exponential backoff.
+    STRIPE_INBOX_BATCH_SIZE: int = 50
+    STRIPE_INBOX_POLL_SECONDS: float = 5.0
+    STRIPE_INBOX_MAX_ATTEMPTS: int = 8
 
     class Config:
         # Allow DB_URL to also be satisfied by the Render-injected DATABASE_URL env var
@@ -50,6 +124,13 @@ class Settings(BaseSettings):
             return ["http://localhost:3000", "http://localhost:3001"]
         return [o.strip() for o in raw.split(",") if o.strip()]
 
+    @property
+    def metrics_exposed(self) -> bool:
+        """Whether to collect and serve /metrics: never unauthenticated in production."""
+        if not self.METRICS_ENABLED:
+            return False
+        return bool(self.METRICS_TOKEN) or os.getenv("NODE_ENV") != "production"
+
 
 settings = Settings()
 
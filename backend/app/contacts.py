@@ -0,0 +1,289 @@
+"""
+Customer contact normalization and the ``customer_contacts`` search index.
+
+Phones are kept as digits only. The country code is dropped from 11-digit
+North American numbers, so "620-262-1073", "(620) 262-1073" and
+"+1 620 262 1073" are all "6202621073". Emails are trimmed and lowercased.
+
+Every customer has one ``customer_contacts`` row per phone (primary and
+additional), per email, and per word of their name (lowercased, accents
+removed). The admin customer search does prefix matching on that table's
+(kind, value) index instead of scanning ``customers``.
+
+Customers whose phones turn out to be the same number once normalized are
+only merged on request, by an operator::
+
+    python -m app.contacts merge --dry-run   # list what would be merged
+    python -m app.contacts merge             # merge, printing each merged row
+"""
+import argparse
+import json
+import re
+import sys
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, delete, func, select, update
+from sqlalchemy.orm import Session
+
+from .db import dialect_insert
+from .models import Customer, CustomerContact, Order
+
+PHONE = "phone"
+EMAIL = "email"
+NAME = "name"
+
+_NON_DIGIT = re.compile(r"\D")
+_NAME_SEPARATOR = re.compile(r"[^0-9a-z]+")
+# Characters people type around a phone number; anything else makes it a name.
+_PHONE_QUERY = re.compile(r"^[\d\s().+-]+$")
+
+
+def normalize_phone(raw: Optional[str]) -> str:
+    raw = (raw or "").strip()
+    digits = _NON_DIGIT.sub("", raw)
+    if not digits:
+        return raw
+    if len(digits) == 11 and digits.startswith("1"):
+        return digits[1:]
+    return digits
+
+
+def normalize_email(raw: Optional[str]) -> Optional[str]:
+    email = (raw or "").strip().lower()
+    return email or None
+
+
+def name_terms(name: Optional[str]) -> List[str]:
+    folded = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode().lower()
+    return [term for term in _NAME_SEPARATOR.split(folded) if term]
+
+
+def normalize_list(values: Iterable[str], normalize, exclude: Optional[str] = None) -> List[str]:
+    """Normalize, drop blanks and duplicates (and ``exclude``), keep the order."""
+    seen, result = {exclude} if exclude else set(), []
+    for value in values or []:
+        value = normalize(value)
+        if value and value not in seen:
+            seen.add(value)
+            result.append(value)
+    return result
+
+
+def contact_values(
+    name: Optional[str],
+    phone: Optional[str],
+    email: Optional[str],
+    additional_phones: Sequence[str] = (),
+    additional_emails: Sequence[str] = (),
+) -> List[Tuple[str, str, bool]]:
+    """(kind, value, is_primary) for one customer's already-normalized contacts."""
+    rows, seen = [], set()
+
+    def add(kind: str, value: Optional[str], is_primary: bool) -> None:
+        if value and (kind, value) not in seen:
+            seen.add((kind, value))
+            rows.append((kind, value, is_primary))
+
+    add(PHONE, phone, True)
+    for value in additional_phones:
+        add(PHONE, value, False)
+    add(EMAIL, email, True)
+    for value in additional_emails:
+        add(EMAIL, value, False)
+    for term in name_terms(name):
+        add(NAME, term, True)
+    return rows
+
+
+def sync_contacts(db: Session, customer: Customer) -> None:
+    """Replace ``customer``'s index rows with its current contacts. Flushes the customer."""
+    db.flush()
+    db.execute(delete(CustomerContact).where(CustomerContact.customer_id == customer.id))
+    rows = contact_values(
+        customer.name,
+        customer.phone,
+        customer.email,
+        json.loads(customer.additional_phones or "[]"),
+        json.loads(customer.additional_emails or "[]"),
+    )
+    if rows:
+        db.execute(
+            CustomerContact.__table__.insert(),
+            [{"customer_id": customer.id, "kind": kind, "value": value, "is_primary": primary}
+             for kind, value, primary in rows],
+        )
+
+
+def add_missing_contacts(db: Session, customer_id: int, name: str, phone: str, email: Optional[str]) -> None:
+    """Insert a new customer's index rows; a no-op for rows that already exist."""
+    rows = contact_values(name, phone, email)
+    stmt = dialect_insert(db, CustomerContact).values(
+        [{"customer_id": customer_id, "kind": kind, "value": value, "is_primary": primary}
+         for kind, value, primary in rows]
+    )
+    db.execute(stmt.on_conflict_do_nothing(index_elements=["customer_id", "kind", "value"]))
+
+
+def _prefix_match(db: Session, prefix: str):
+    value = CustomerContact.value
+    if db.get_bind().dialect.name.startswith("postgres"):
+        # Served by the text_pattern_ops index.
+        return value.startswith(prefix, autoescape=True)
+    # SQLite only uses an index for LIKE in narrow cases; a range over the
+    # BINARY-collated values always can.
+    return and_(value >= prefix, value < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def phone_query_digits(q: str) -> Optional[str]:
+    """The digits to look for when ``q`` is (part of) a phone number, else None."""
+    q = q.strip()
+    if not _PHONE_QUERY.match(q):
+        return None
+    digits = _NON_DIGIT.sub("", q)
+    if q.startswith("+1"):
+        digits = digits[1:]
+    return digits
+
+
+def phone_customer_ids(db: Session, prefix: str):
+    """Subquery of customers with a phone (primary or additional) starting with ``prefix``."""
+    return select(CustomerContact.customer_id).where(CustomerContact.kind == PHONE, _prefix_match(db, prefix))
+
+
+def _search_terms(q: str) -> List[Tuple[Tuple[str, ...], str]]:
+    """(kinds, prefix) pairs a customer must all match for query ``q``."""
+    q = q.strip()
+    digits = phone_query_digits(q)
+    if digits is not None:
+        return [((PHONE,), digits)] if digits else []
+    if "@" in q:
+        return [((EMAIL,), q.lower())]
+    terms = name_terms(q)
+    if len(terms) == 1:
+        # "maria" also finds maria.lopez@example.com.
+        return [((NAME, EMAIL), terms[0])]
+    return [((NAME,), term) for term in terms]
+
+
+def search_customer_ids(db: Session, q: str, limit: int, before_id: Optional[int] = None) -> List[int]:
+    """
+    Ids of customers matching every term of ``q`` by prefix, newest (highest
+    id) first, at most ``limit`` of them and all below ``before_id``.
+    """
+    terms = _search_terms(q)
+    if not terms:
+        return []
+
+    (kinds, prefix), rest = terms[0], terms[1:]
+    query = select(CustomerContact.customer_id).where(
+        CustomerContact.kind.in_(kinds), _prefix_match(db, prefix)
+    )
+    for other_kinds, other_prefix in rest:
+        query = query.where(
+            CustomerContact.customer_id.in_(
+                select(CustomerContact.customer_id).where(
+                    CustomerContact.kind.in_(other_kinds), _prefix_match(db, other_prefix)
+                )
+            )
+        )
+    if before_id is not None:
+        query = query.where(CustomerContact.customer_id < before_id)
+    query = query.distinct().order_by(CustomerContact.customer_id.desc()).limit(limit)
+    return list(db.execute(query).scalars())
+
+
+
+def phone_duplicates(db: Session) -> List[Tuple[Customer, List[Customer]]]:
+    """
+    Customers sharing a phone once normalized, as (survivor, duplicates).
+    The survivor is whoever stores the number in canonical form, else the
+    lowest id.
+    """
+    by_phone: Dict[str, List[Tuple[int, str]]] = defaultdict(list)
+    for customer_id, phone in db.execute(select(Customer.id, Customer.phone).order_by(Customer.id)):
+        by_phone[normalize_phone(phone)].append((customer_id, phone))
+
+    groups = []
+    for phone, members in sorted(by_phone.items()):
+        if len(members) < 2:
+            continue
+        survivor_id = next((customer_id for customer_id, raw in members if raw == phone), members[0][0])
+        survivor = db.get(Customer, survivor_id)
+        duplicates = [db.get(Customer, customer_id) for customer_id, _ in members if customer_id != survivor_id]
+        groups.append((survivor, duplicates))
+    return groups
+
+
+def merge_customers(db: Session, survivor: Customer, duplicates: Sequence[Customer]) -> None:
+    """
+    Move the duplicates' orders to ``survivor``, keep their phones and emails
+    as its extras, delete them and normalize the survivor's phone. Flushes;
+    the caller commits.
+    """
+    phones = json.loads(survivor.additional_phones or "[]")
+    emails = json.loads(survivor.additional_emails or "[]")
+    for duplicate in duplicates:
+        phones += [duplicate.phone, *json.loads(duplicate.additional_phones or "[]")]
+        emails += [duplicate.email, *json.loads(duplicate.additional_emails or "[]")]
+
+    duplicate_ids = [duplicate.id for duplicate in duplicates]
+    db.execute(update(Order).where(Order.customer_id.in_(duplicate_ids)).values(customer_id=survivor.id))
+    db.execute(delete(CustomerContact).where(CustomerContact.customer_id.in_(duplicate_ids)))
+    for duplicate in duplicates:
+        db.delete(duplicate)
+    db.flush()
+
+    survivor.phone = normalize_phone(survivor.phone)
+    survivor.additional_phones = json.dumps(normalize_list(phones, normalize_phone, survivor.phone))
+    survivor.additional_emails = json.dumps(
+        normalize_list([email for email in emails if email], normalize_email, survivor.email)
+    )
+    sync_contacts(db, survivor)
+
+
+def _describe(customer: Customer) -> dict:
+    return {column.name: getattr(customer, column.name) for column in Customer.__table__.columns}
+
+
+def main(argv=None) -> int:
+    from .db import SessionLocal
+
+    parser = argparse.ArgumentParser(prog="python -m app.contacts", description="Customer contact maintenance.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    merge = subcommands.add_parser("merge", help="merge customers whose phones are the same number")
+    merge.add_argument("--dry-run", action="store_true", help="only list what would be merged")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        groups = phone_duplicates(db)
+        for survivor, duplicates in groups:
+            order_counts = dict(
+                db.execute(
+                    select(Order.customer_id, func.count())
+                    .where(Order.customer_id.in_([duplicate.id for duplicate in duplicates]))
+                    .group_by(Order.customer_id)
+                ).all()
+            )
+            print(f"{normalize_phone(survivor.phone)}: keep customer {survivor.id} ({survivor.name})")
+            for duplicate in duplicates:
+                # The full row, so a merge can be undone by hand.
+                print(
+                    f"  merge customer {duplicate.id}, {order_counts.get(duplicate.id, 0)} order(s): "
+                    f"{json.dumps(_describe(duplicate), default=str)}"
+                )
+            if not args.dry_run:
+                merge_customers(db, survivor, duplicates)
+                db.commit()
+        merged = sum(len(duplicates) for _, duplicates in groups)
+        verb = "would merge" if args.dry_run else "merged"
+        print(f"{verb} {merged} customer(s) into {len(groups)}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
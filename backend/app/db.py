@@ -1,9 +1,157 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from datetime import timezone
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from .config import settings
 
-engine = create_engine(settings.DATABASE_URL)
+
+class PoolStats:
+    """Counters for how long requests wait to check a connection out of the pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, waited: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+class _TimedCheckout:
+    # Pools are re-instantiated on dispose(), so stats live on the class.
+    stats: PoolStats
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    stats = PoolStats()
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    stats = PoolStats()
+
+
+def _async_url(url):
+    """Swap in the asyncio driver for the configured database."""
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    if url.get_backend_name() == "postgresql":
+        return url.set(drivername="postgresql+psycopg")
+    return url
+
+
+def _engine_kwargs(url, poolclass) -> dict:
+    kwargs = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return kwargs
+
+    kwargs.update(
+        poolclass=poolclass,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+    if url.get_backend_name() == "postgresql" and settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        # Both psycopg and psycopg2 pass libpq options through on connect.
+        kwargs["connect_args"] = {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+    if url.get_backend_name() == "sqlite" and settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        # How long to wait for another connection's write lock (sqlite3 defaults
+        # to 5s, which concurrent checkouts can exceed). Same budget as a statement.
+        kwargs["connect_args"] = {"timeout": settings.DB_STATEMENT_TIMEOUT_MS / 1000}
+    return kwargs
+
+
+def _install_sqlite_statement_timeout(engine, timeout_ms: int) -> None:
+    """
+    Emulate Postgres' statement_timeout on SQLite.
+
+    A progress handler polls a per-connection deadline that is armed before
+    each statement; returning non-zero makes SQLite abort the statement with
+    "interrupted". Works for both the sync driver and aiosqlite.
+    """
+    timeout = timeout_ms / 1000
+
+    @event.listens_for(engine, "connect")
+    def _arm_progress_handler(dbapi_connection, connection_record):
+        state = connection_record.info["statement_deadline"] = {"at": None}
+
+        def _check_deadline():
+            deadline = state["at"]
+            return 1 if deadline is not None and time.monotonic() > deadline else 0
+
+        if hasattr(dbapi_connection, "run_async"):
+            dbapi_connection.run_async(lambda raw: raw.set_progress_handler(_check_deadline, 10000))
+        else:
+            dbapi_connection.set_progress_handler(_check_deadline, 10000)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_deadline(conn, cursor, statement, parameters, context, executemany):
+        state = conn.info.get("statement_deadline")
+        if state is not None:
+            state["at"] = time.monotonic() + timeout
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _clear_deadline(conn, cursor, statement, parameters, context, executemany):
+        state = conn.info.get("statement_deadline")
+        if state is not None:
+            state["at"] = None
+
+
+def _install_sqlite_wal(engine) -> None:
+    """
+    Put file-backed SQLite databases in WAL mode.
+
+    In the default rollback-journal mode a long read blocks every writer, so
+    admin list/tally requests made concurrent checkouts fail with "database
+    is locked". WAL lets readers and a writer proceed together.
+    """
+
+    @event.listens_for(engine, "connect")
+    def _set_journal_mode(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
+
+_url = make_url(settings.DATABASE_URL)
+engine = create_engine(_url, **_engine_kwargs(_url, InstrumentedQueuePool))
+# Async engine for the public hot paths: requests awaiting the database don't
+# hold a threadpool thread. Same database, models and schemas as ``engine``.
+async_engine = create_async_engine(_async_url(_url), **_engine_kwargs(_url, InstrumentedAsyncQueuePool))
+if _url.get_backend_name() == "sqlite" and settings.DB_STATEMENT_TIMEOUT_MS > 0:
+    _install_sqlite_statement_timeout(engine, settings.DB_STATEMENT_TIMEOUT_MS)
+    _install_sqlite_statement_timeout(async_engine.sync_engine, settings.DB_STATEMENT_TIMEOUT_MS)
+
+if _url.get_backend_name() == "sqlite" and _url.database not in (None, "", ":memory:") and settings.SQLITE_WAL:
+    _install_sqlite_wal(engine)
+    _install_sqlite_wal(async_engine.sync_engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False)
 Base = declarative_base()
 
 def get_db():
@@ -12,3 +160,67 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """
+    Async counterpart of ``get_db``.
+
+    Routes share their query logic with the sync code by passing a function
+    that takes a plain ``Session`` to ``AsyncSession.run_sync``.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def dialect_insert(db, model):
+    """
+    Return an INSERT construct for ``model`` that supports ``on_conflict_do_*``.
+
+    Postgres and SQLite share the ON CONFLICT syntax, but SQLAlchemy exposes it
+    through dialect-specific ``insert`` functions.
+    """
+    if db.get_bind().dialect.name.startswith("postgres"):
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def utc_naive(value):
+    """
+    Timestamps are stored as naive UTC (``DateTime`` without a zone). Convert
+    an aware value, e.g. from a column still typed TIMESTAMPTZ, to match.
+    """
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def pool_status(use_async: bool = False) -> dict:
+    """Live connection pool figures for the admin pool endpoint."""
+    pool = async_engine.pool if use_async else engine.pool
+    stats = getattr(pool, "stats", None) or PoolStats()
+    status = {
+        "pool_class": type(pool).__name__,
+        "size": None,
+        "checked_out": None,
+        "checked_in": None,
+        "overflow": None,
+        "max_overflow": None,
+    }
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(0, pool.overflow()),
+            max_overflow=settings.DB_MAX_OVERFLOW,
+        )
+    checkouts = stats.checkouts
+    status.update(
+        checkouts=checkouts,
+        checkout_timeouts=stats.timeouts,
+        wait_seconds_total=round(stats.wait_seconds_total, 6),
+        wait_seconds_avg=round(stats.wait_seconds_total / checkouts, 6) if checkouts else 0.0,
+        wait_seconds_max=round(stats.wait_seconds_max, 6),
+    )
+    return status
@@ -1,9 +1,33 @@
+"""
+Versioned schema migrations.
+
+Each migration is a numbered, idempotent step. Once it succeeds its version is
+recorded in ``schema_migrations``, so startup reads ``MAX(version)`` and a fully
+migrated database costs that one query: no table introspection, no backfills.
+
+Backfills run once, in primary-key ranges of ``MIGRATION_BATCH_SIZE`` rows with
+a transaction per range, so a large table is never locked in one long UPDATE.
+
+New migrations are appended with the next version number; never renumber or
+edit one that has shipped. Run them by hand with::
+
+    python -m app.db_migrations status
+    python -m app.db_migrations migrate
+    python -m app.db_migrations indexes   # missing, invalid and unused indexes
+"""
+import argparse
 import logging
-from typing import Any
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
 
-from sqlalchemy import text
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, bindparam, func, select, text
 from sqlalchemy.engine import Engine
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import DBAPIError, IntegrityError, SQLAlchemyError
+
+from .config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -11,18 +35,55 @@ logger = logging.getLogger(__name__)
 DEFAULTS = {
     "postgresql": {
         "datetime_type": "TIMESTAMPTZ",
+        # Matches the models' naive DateTime: UTC without a zone, as
+        # datetime.utcnow() compares against. Use it for new timestamp columns.
+        "naive_datetime_type": "TIMESTAMP",
         "current_timestamp": "NOW()",
+        # Clause for a column added to an existing table that defaults to now.
+        "added_timestamp_default": "NOT NULL DEFAULT NOW()",
         "false": "FALSE",
         "true": "TRUE",
     },
     "sqlite": {
         "datetime_type": "DATETIME",
+        "naive_datetime_type": "DATETIME",
         "current_timestamp": "CURRENT_TIMESTAMP",
+        # SQLite can't ALTER TABLE ADD a column with an expression default (or
+        # NOT NULL without one), so the column stays nullable and is backfilled.
+        "added_timestamp_default": "",
         "false": "0",
         "true": "1",
     },
 }
 
+# Kept out of Base.metadata so drop_all/create_all never touch the bookkeeping.
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Engine, str], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str):
+    def register(fn: Callable[[Engine, str], None]):
+        if MIGRATIONS and version != MIGRATIONS[-1].version + 1:
+            raise ValueError(f"Migration {name} must be numbered {MIGRATIONS[-1].version + 1}")
+        MIGRATIONS.append(Migration(version, name, fn))
+        return fn
+
+    return register
+
 
 def _dialect_name(engine: Engine) -> str:
     return "postgresql" if engine.dialect.name.startswith("postgres") else "sqlite"
@@ -69,118 +130,760 @@ def _table_exists(conn: Any, dialect: str, table_name: str) -> bool:
     return row is not None
 
 
-def _safe_execute(conn: Any, statement: str) -> bool:
-    try:
-        conn.execute(text(statement))
-        return True
-    except SQLAlchemyError:
-        logger.exception("Migration statement failed: %s", statement)
-        return False
+@contextmanager
+def _begin(engine: Engine) -> Iterator[Any]:
+    with engine.begin() as conn:
+        if _dialect_name(engine) == "postgresql":
+            # DDL waits on locks and backfills may outlast DB_STATEMENT_TIMEOUT_MS.
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+        yield conn
 
 
-def ensure_legacy_compat_columns(engine: Engine) -> None:
-    """Run idempotent, dialect-aware schema/data compatibility migrations."""
-    dialect = _dialect_name(engine)
+def _add_missing_columns(engine: Engine, dialect: str, table_name: str, additions) -> set[str]:
+    """
+    Add each ``(column, DDL)`` pair the table lacks. Returns the columns added;
+    an absent table is left for create_all.
+    """
+    added = set()
+    with _begin(engine) as conn:
+        if not _table_exists(conn, dialect, table_name):
+            return added
+        existing = _column_names(conn, dialect, table_name)
+        for column_name, statement in additions:
+            if column_name not in existing:
+                conn.execute(text(statement))
+                added.add(column_name)
+    return added
+
+
+def _drop_time_zone(engine: Engine, dialect: str, table_name: str, columns: List[str]) -> None:
+    """
+    Turn ``TIMESTAMPTZ`` columns back into naive UTC ``TIMESTAMP`` on Postgres,
+    where an earlier migration added them with the zone the model doesn't
+    declare. Rewrites the table under an exclusive lock.
+    """
+    if dialect != "postgresql":
+        return
+    with _begin(engine) as conn:
+        zoned = conn.execute(
+            text(
+                """
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = :table_name
+                  AND data_type = 'timestamp with time zone'
+                """
+            ),
+            {"table_name": table_name},
+        ).scalars()
+        for column_name in sorted(set(zoned) & set(columns)):
+            logger.info("Converting %s.%s to TIMESTAMP (UTC)", table_name, column_name)
+            conn.execute(
+                text(
+                    f"ALTER TABLE {table_name} ALTER COLUMN {column_name} "
+                    f"TYPE TIMESTAMP USING {column_name} AT TIME ZONE 'UTC'"
+                )
+            )
+
+
+def _backfill(engine: Engine, table_name: str, assignments: str, where: str) -> int:
+    """
+    ``UPDATE table SET assignments WHERE where`` in id ranges, one transaction
+    per range. ``where`` must exclude rows already done so a retry resumes.
+    """
+    batch_size = max(1, settings.MIGRATION_BATCH_SIZE)
+    with engine.connect() as conn:
+        low, high = conn.execute(text(f"SELECT MIN(id), MAX(id) FROM {table_name}")).one()
+    if low is None:
+        return 0
+
+    updated = 0
+    for start in range(low, high + 1, batch_size):
+        with _begin(engine) as conn:
+            result = conn.execute(
+                text(f"UPDATE {table_name} SET {assignments} WHERE id >= :start AND id < :end AND ({where})"),
+                {"start": start, "end": start + batch_size},
+            )
+            updated += max(result.rowcount, 0)
+    if updated:
+        logger.info("Backfilled %d %s rows", updated, table_name)
+    return updated
+
+
+@migration(1, "create_tables")
+def _create_tables(engine: Engine, dialect: str) -> None:
+    from . import models  # noqa: F401  (registers every table on Base.metadata)
+    from .db import Base
+
+    Base.metadata.create_all(bind=engine)
+
+
+@migration(2, "menu_weeks_compat_columns")
+def _menu_weeks_columns(engine: Engine, dialect: str) -> None:
     defaults = DEFAULTS[dialect]
+    added = _add_missing_columns(
+        engine,
+        dialect,
+        "menu_weeks",
+        [
+            (
+                "week_start_date",
+                f"ALTER TABLE menu_weeks ADD COLUMN week_start_date {defaults['datetime_type']} {defaults['added_timestamp_default']}",
+            ),
+            (
+                "is_published",
+                f"ALTER TABLE menu_weeks ADD COLUMN is_published BOOLEAN NOT NULL DEFAULT {defaults['false']}",
+            ),
+            (
+                "selling_days",
+                "ALTER TABLE menu_weeks ADD COLUMN selling_days VARCHAR NOT NULL DEFAULT 'Mon,Wed,Fri'",
+            ),
+            ("status", "ALTER TABLE menu_weeks ADD COLUMN status VARCHAR NOT NULL DEFAULT 'OPEN'"),
+            (
+                "published",
+                f"ALTER TABLE menu_weeks ADD COLUMN published BOOLEAN NOT NULL DEFAULT {defaults['false']}",
+            ),
+            ("starts_at", f"ALTER TABLE menu_weeks ADD COLUMN starts_at {defaults['datetime_type']}"),
+        ],
+    )
+    # A flag added next to its legacy twin starts out false; copy the twin.
+    for new, old in [("published", "is_published"), ("is_published", "published")]:
+        if new in added and old not in added:
+            _backfill(engine, "menu_weeks", f"{new} = {old}", f"{new} <> {old}")
 
-    try:
-        with engine.begin() as conn:
-            if _table_exists(conn, dialect, "menu_weeks"):
-                week_cols = _column_names(conn, dialect, "menu_weeks")
-                week_additions = [
-                    (
-                        "week_start_date",
-                        f"ALTER TABLE menu_weeks ADD COLUMN week_start_date {defaults['datetime_type']} NOT NULL DEFAULT {defaults['current_timestamp']}",
-                    ),
-                    (
-                        "is_published",
-                        f"ALTER TABLE menu_weeks ADD COLUMN is_published BOOLEAN NOT NULL DEFAULT {defaults['false']}",
-                    ),
-                    (
-                        "selling_days",
-                        "ALTER TABLE menu_weeks ADD COLUMN selling_days VARCHAR NOT NULL DEFAULT 'Mon,Wed,Fri'",
-                    ),
-                    (
-                        "status",
-                        "ALTER TABLE menu_weeks ADD COLUMN status VARCHAR NOT NULL DEFAULT 'OPEN'",
-                    ),
-                    (
-                        "published",
-                        f"ALTER TABLE menu_weeks ADD COLUMN published BOOLEAN NOT NULL DEFAULT {defaults['false']}",
-                    ),
-                    (
-                        "starts_at",
-                        f"ALTER TABLE menu_weeks ADD COLUMN starts_at {defaults['datetime_type']}",
-                    ),
-                ]
-
-                for column_name, statement in week_additions:
-                    if column_name not in week_cols and _safe_execute(conn, statement):
-                        week_cols.add(column_name)
-
-                if week_cols:
-                    _safe_execute(
-                        conn,
-                        "UPDATE menu_weeks "
-                        f"SET starts_at = COALESCE(starts_at, week_start_date, {defaults['current_timestamp']}), "
-                        f"week_start_date = COALESCE(week_start_date, starts_at, {defaults['current_timestamp']}), "
-                        f"published = COALESCE(published, is_published, {defaults['false']}), "
-                        f"is_published = COALESCE(is_published, published, {defaults['false']}), "
-                        "selling_days = COALESCE(NULLIF(selling_days, ''), 'Mon,Wed,Fri'), "
-                        "status = COALESCE(NULLIF(status, ''), 'OPEN')",
-                    )
 
-            if _table_exists(conn, dialect, "menu_items"):
-                item_cols = _column_names(conn, dialect, "menu_items")
-                item_additions = [
-                    ("photo_url", "ALTER TABLE menu_items ADD COLUMN photo_url VARCHAR"),
-                    (
-                        "available",
-                        f"ALTER TABLE menu_items ADD COLUMN available BOOLEAN NOT NULL DEFAULT {defaults['true']}",
-                    ),
-                    (
-                        "created_at",
-                        f"ALTER TABLE menu_items ADD COLUMN created_at {defaults['datetime_type']} DEFAULT {defaults['current_timestamp']}",
-                    ),
-                ]
-
-                for column_name, statement in item_additions:
-                    if column_name not in item_cols and _safe_execute(conn, statement):
-                        item_cols.add(column_name)
-
-                if item_cols:
-                    available_fallbacks = ["available"]
-                    if "is_active" in item_cols:
-                        available_fallbacks.append("is_active")
-                    if "is_sold_out" in item_cols:
-                        available_fallbacks.append(
-                            f"CASE WHEN is_sold_out = 1 THEN {defaults['false']} ELSE {defaults['true']} END"
-                        )
-                    available_fallbacks.append(defaults["true"])
-                    _safe_execute(
-                        conn,
-                        "UPDATE menu_items "
-                        f"SET available = COALESCE({', '.join(available_fallbacks)})",
+@migration(3, "menu_weeks_backfill")
+def _menu_weeks_backfill(engine: Engine, dialect: str) -> None:
+    defaults = DEFAULTS[dialect]
+    _backfill(
+        engine,
+        "menu_weeks",
+        f"starts_at = COALESCE(starts_at, week_start_date, {defaults['current_timestamp']}), "
+        f"week_start_date = COALESCE(week_start_date, starts_at, {defaults['current_timestamp']}), "
+        f"published = COALESCE(published, is_published, {defaults['false']}), "
+        f"is_published = COALESCE(is_published, published, {defaults['false']}), "
+        "selling_days = COALESCE(NULLIF(selling_days, ''), 'Mon,Wed,Fri'), "
+        "status = COALESCE(NULLIF(status, ''), 'OPEN')",
+        "starts_at IS NULL OR week_start_date IS NULL OR published IS NULL OR is_published IS NULL "
+        "OR selling_days IS NULL OR selling_days = '' OR status IS NULL OR status = ''",
+    )
+
+
+@migration(4, "menu_items_columns")
+def _menu_items_columns(engine: Engine, dialect: str) -> None:
+    defaults = DEFAULTS[dialect]
+    added = _add_missing_columns(
+        engine,
+        dialect,
+        "menu_items",
+        [
+            ("photo_url", "ALTER TABLE menu_items ADD COLUMN photo_url VARCHAR"),
+            (
+                "available",
+                f"ALTER TABLE menu_items ADD COLUMN available BOOLEAN NOT NULL DEFAULT {defaults['true']}",
+            ),
+            (
+                "created_at",
+                f"ALTER TABLE menu_items ADD COLUMN created_at {defaults['datetime_type']} {defaults['added_timestamp_default']}",
+            ),
+        ],
+    )
+    if "created_at" in added and dialect == "sqlite":
+        _backfill(engine, "menu_items", "created_at = CURRENT_TIMESTAMP", "created_at IS NULL")
+    if "available" not in added:
+        return
+
+    # A freshly added column takes its value from the legacy flags, if any.
+    with engine.connect() as conn:
+        legacy = _column_names(conn, dialect, "menu_items") & {"is_active", "is_sold_out"}
+    conditions = []
+    if "is_active" in legacy:
+        conditions.append("CAST(is_active AS INTEGER) = 0")
+    if "is_sold_out" in legacy:
+        conditions.append("CAST(is_sold_out AS INTEGER) = 1")
+    if conditions:
+        _backfill(
+            engine,
+            "menu_items",
+            f"available = {defaults['false']}",
+            f"available = {defaults['true']} AND ({' OR '.join(conditions)})",
+        )
+
+
+@migration(5, "customer_contact_columns")
+def _customer_columns(engine: Engine, dialect: str) -> None:
+    _add_missing_columns(
+        engine,
+        dialect,
+        "customers",
+        [
+            ("address", "ALTER TABLE customers ADD COLUMN address VARCHAR"),
+            ("city", "ALTER TABLE customers ADD COLUMN city VARCHAR"),
+            ("zip_code", "ALTER TABLE customers ADD COLUMN zip_code VARCHAR"),
+            ("additional_phones", "ALTER TABLE customers ADD COLUMN additional_phones TEXT"),
+            ("additional_emails", "ALTER TABLE customers ADD COLUMN additional_emails TEXT"),
+        ],
+    )
+
+
+@migration(6, "orders_customer_name_and_week")
+def _order_columns(engine: Engine, dialect: str) -> None:
+    _add_missing_columns(
+        engine,
+        dialect,
+        "orders",
+        [
+            ("customer_name", "ALTER TABLE orders ADD COLUMN customer_name VARCHAR"),
+            ("menu_week_id", "ALTER TABLE orders ADD COLUMN menu_week_id INTEGER REFERENCES menu_weeks (id)"),
+        ],
+    )
+
+
+@migration(7, "orders_menu_week_backfill")
+def _order_week_backfill(engine: Engine, dialect: str) -> None:
+    # Infer the week from the order's items; mixed-week orders take the latest.
+    # Orders without items stay NULL, so each range re-checks them once: cheap.
+    _backfill(
+        engine,
+        "orders",
+        "menu_week_id = ("
+        "SELECT MAX(menu_items.menu_week_id) FROM order_items "
+        "JOIN menu_items ON menu_items.id = order_items.menu_item_id "
+        "WHERE order_items.order_id = orders.id)",
+        "menu_week_id IS NULL",
+    )
+
+
+@migration(8, "stripe_inbox_columns")
+def _stripe_inbox_columns(engine: Engine, dialect: str) -> None:
+    defaults = DEFAULTS[dialect]
+    # Events recorded before the inbox were applied synchronously, hence the
+    # 'processed' default for existing rows.
+    _add_missing_columns(
+        engine,
+        dialect,
+        "stripe_webhook_events",
+        [
+            ("payload", "ALTER TABLE stripe_webhook_events ADD COLUMN payload TEXT"),
+            (
+                "status",
+                "ALTER TABLE stripe_webhook_events ADD COLUMN status VARCHAR NOT NULL DEFAULT 'processed'",
+            ),
+            ("attempts", "ALTER TABLE stripe_webhook_events ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"),
+            (
+                "next_attempt_at",
+                f"ALTER TABLE stripe_webhook_events ADD COLUMN next_attempt_at {defaults['naive_datetime_type']}",
+            ),
+            ("claimed_by", "ALTER TABLE stripe_webhook_events ADD COLUMN claimed_by VARCHAR"),
+            (
+                "processed_at",
+                f"ALTER TABLE stripe_webhook_events ADD COLUMN processed_at {defaults['naive_datetime_type']}",
+            ),
+            ("last_error", "ALTER TABLE stripe_webhook_events ADD COLUMN last_error TEXT"),
+        ],
+    )
+
+
+@migration(9, "order_snapshot_and_session_columns")
+def _snapshot_columns(engine: Engine, dialect: str) -> None:
+    defaults = DEFAULTS[dialect]
+    _add_missing_columns(
+        engine,
+        dialect,
+        "orders",
+        [
+            ("stripe_session_url", "ALTER TABLE orders ADD COLUMN stripe_session_url VARCHAR"),
+            (
+                "stripe_session_expires_at",
+                f"ALTER TABLE orders ADD COLUMN stripe_session_expires_at {defaults['naive_datetime_type']}",
+            ),
+            ("stripe_session_amount_cents", "ALTER TABLE orders ADD COLUMN stripe_session_amount_cents INTEGER"),
+        ],
+    )
+    _add_missing_columns(
+        engine,
+        dialect,
+        "order_items",
+        [
+            ("unit_price_cents", "ALTER TABLE order_items ADD COLUMN unit_price_cents INTEGER"),
+            ("item_name", "ALTER TABLE order_items ADD COLUMN item_name VARCHAR"),
+        ],
+    )
+
+
+@migration(10, "order_item_snapshot_backfill")
+def _snapshot_backfill(engine: Engine, dialect: str) -> None:
+    # Best available snapshot for existing rows: the current menu entry.
+    _backfill(
+        engine,
+        "order_items",
+        "unit_price_cents = COALESCE(unit_price_cents, "
+        "(SELECT price_cents FROM menu_items WHERE menu_items.id = order_items.menu_item_id)), "
+        "item_name = COALESCE(item_name, "
+        "(SELECT name FROM menu_items WHERE menu_items.id = order_items.menu_item_id))",
+        "unit_price_cents IS NULL OR item_name IS NULL",
+    )
+
+
+@migration(11, "order_tallies_per_week")
+def _tallies_per_week(engine: Engine, dialect: str) -> None:
+    # The tally is derived data: drop a pre-week layout and let
+    # app.tally.ensure_initialized rebuild it.
+    from .models import OrderTally
+
+    with _begin(engine) as conn:
+        if "menu_week_id" not in _column_names(conn, dialect, "order_tallies"):
+            conn.execute(text("DROP TABLE IF EXISTS order_tallies"))
+            OrderTally.__table__.create(conn)
+
+
+@migration(12, "secondary_indexes")
+def _secondary_indexes(engine: Engine, dialect: str) -> None:
+    # Declared on the models; create_all only builds them for new tables.
+    with _begin(engine) as conn:
+        for statement in [
+            "CREATE INDEX IF NOT EXISTS ix_orders_created_at_id ON orders (created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_orders_menu_week_id_created_at_id ON orders (menu_week_id, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_order_items_order_id ON order_items (order_id)",
+            "CREATE INDEX IF NOT EXISTS ix_stripe_webhook_events_status_next_attempt_at "
+            "ON stripe_webhook_events (status, next_attempt_at)",
+        ]:
+            conn.execute(text(statement))
+
+
+def declared_indexes() -> Dict[str, Any]:
+    """Every secondary index declared on the models, by name."""
+    from . import models  # noqa: F401
+    from .db import Base
+
+    return {index.name: index for table in Base.metadata.sorted_tables for index in table.indexes}
+
+
+def _existing_indexes(conn: Any, dialect: str) -> Dict[str, bool]:
+    """Index name -> whether it is usable (an interrupted concurrent build is not)."""
+    if dialect == "postgresql":
+        rows = conn.execute(
+            text(
+                """
+                SELECT c.relname, i.indisvalid
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = current_schema()
+                """
+            )
+        )
+        return {name: bool(valid) for name, valid in rows}
+    rows = conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))
+    return {row[0]: True for row in rows}
+
+
+def _create_indexes(engine: Engine, dialect: str, names: List[str]) -> None:
+    """
+    Build declared indexes that don't exist yet. Postgres builds them with
+    CREATE INDEX CONCURRENTLY, which takes no lock that blocks writes but
+    can't run inside a transaction, so each gets its own autocommit statement.
+    """
+    declared = declared_indexes()
+    if dialect != "postgresql":
+        with _begin(engine) as conn:
+            for name in names:
+                declared[name].create(conn, checkfirst=True)
+        return
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SET statement_timeout = 0"))
+        try:
+            existing = _existing_indexes(conn, dialect)
+            for name in names:
+                index = declared[name]
+                if existing.get(name) is False:
+                    logger.warning("Rebuilding invalid index %s left by an interrupted build", name)
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                elif name in existing:
+                    continue
+                unique = "UNIQUE " if index.unique else ""
+                columns = ", ".join(column.name for column in index.columns)
+                conn.execute(
+                    text(f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {index.table.name} ({columns})")
+                )
+                logger.info("Built index %s", name)
+        finally:
+            conn.execute(text("RESET statement_timeout"))
+
+
+@migration(13, "hot_lookup_indexes")
+def _hot_lookup_indexes(engine: Engine, dialect: str) -> None:
+    # Customer upserts and admin search (phone), the webhook session lookup,
+    # status and fulfilment filters, the tally, and the storefront's week.
+    _create_indexes(
+        engine,
+        dialect,
+        [
+            "ix_orders_phone",
+            "ix_orders_status",
+            "ix_orders_stripe_session_id",
+            "ix_orders_pickup_or_delivery",
+            "ix_order_items_menu_item_id",
+            "ix_menu_items_menu_week_id",
+            "ix_menu_weeks_published_starts_at",
+        ],
+    )
+
+
+def _normalized_contacts(row) -> dict:
+    import json
+
+    from .contacts import normalize_email, normalize_list, normalize_phone
+
+    phone, email = normalize_phone(row["phone"]), normalize_email(row["email"])
+    record = {
+        "name": row["name"],
+        "phone": phone,
+        "email": email,
+        "additional_phones": normalize_list(json.loads(row["additional_phones"] or "[]"), normalize_phone, phone),
+        "additional_emails": normalize_list(json.loads(row["additional_emails"] or "[]"), normalize_email, email),
+    }
+    record["changed"] = _contacts_changed(record, row)
+    return record
+
+
+def _contacts_changed(record: dict, row) -> bool:
+    import json
+
+    return (
+        record["phone"] != row["phone"]
+        or record["email"] != row["email"]
+        or record["additional_phones"] != json.loads(row["additional_phones"] or "[]")
+        or record["additional_emails"] != json.loads(row["additional_emails"] or "[]")
+    )
+
+
+def _absorb(record: dict, phones: List[str], emails: List[str]) -> None:
+    """Add phones and emails to ``record``'s extras."""
+    from .contacts import normalize_email, normalize_list, normalize_phone
+
+    phones = record["additional_phones"] + phones
+    emails = record["additional_emails"] + [email for email in emails if email]
+    record["additional_phones"] = normalize_list(phones, normalize_phone, record["phone"])
+    record["additional_emails"] = normalize_list(emails, normalize_email, record["email"])
+    record["changed"] = True
+
+
+def _contact_rows(customer_id: int, record: dict) -> List[dict]:
+    from .contacts import contact_values, normalize_phone
+
+    # A phone left as typed (see migration 14) is still searchable normalized.
+    values = contact_values(
+        record["name"],
+        normalize_phone(record["phone"]),
+        record["email"],
+        record["additional_phones"],
+        record["additional_emails"],
+    )
+    return [
+        {"customer_id": customer_id, "kind": kind, "value": value, "is_primary": primary}
+        for kind, value, primary in values
+    ]
+
+
+@migration(14, "customer_contacts")
+def _customer_contacts(engine: Engine, dialect: str) -> None:
+    """
+    Normalize customer phones and emails and index every contact in
+    customer_contacts. A phone that normalizes to a number another customer
+    already holds is left as typed and reported; merging such customers is
+    an explicit step (``python -m app.contacts merge``), never a migration.
+    """
+    import json
+
+    from .models import Customer, CustomerContact
+
+    customers, contacts = Customer.__table__, CustomerContact.__table__
+    contacts.create(bind=engine, checkfirst=True)
+    batch_size = max(1, settings.MIGRATION_BATCH_SIZE)
+    with engine.connect() as conn:
+        low, high = conn.execute(select(func.min(customers.c.id), func.max(customers.c.id))).one()
+    if low is None:
+        return
+
+    collisions = []
+    for start in range(low, high + 1, batch_size):
+        with _begin(engine) as conn:
+            rows = conn.execute(
+                select(customers)
+                .where(customers.c.id >= start, customers.c.id < start + batch_size)
+                .order_by(customers.c.id)
+            ).mappings().all()
+            records = {row["id"]: _normalized_contacts(row) for row in rows}
+            if not records:
+                continue
+
+            # The number belongs to whoever already stores it in canonical
+            # form, else the lowest id in this batch.
+            phone_holders = dict(
+                conn.execute(
+                    select(customers.c.phone, customers.c.id).where(
+                        customers.c.phone.in_({record["phone"] for record in records.values()})
                     )
+                ).all()
+            )
+            for row in rows:
+                record = records[row["id"]]
+                holder = phone_holders.setdefault(record["phone"], row["id"])
+                if holder != row["id"]:
+                    collisions.append((row["id"], holder))
+                    record["phone"] = row["phone"]
+                    record["changed"] = _contacts_changed(record, row)
+
+            # A lowercased email may belong to someone else already; keep it as an extra.
+            changed_emails = {r["email"] for r in records.values() if r["changed"] and r["email"]}
+            email_holders = {}
+            if changed_emails:
+                email_holders = dict(
+                    conn.execute(
+                        select(customers.c.email, customers.c.id).where(customers.c.email.in_(changed_emails))
+                    ).all()
+                )
+            for customer_id, record in records.items():
+                if record["changed"] and record["email"]:
+                    if email_holders.setdefault(record["email"], customer_id) != customer_id:
+                        email, record["email"] = record["email"], None
+                        _absorb(record, [], [email])
+
+            updates = [
+                {
+                    "_id": customer_id,
+                    "phone": record["phone"],
+                    "email": record["email"],
+                    "additional_phones": json.dumps(record["additional_phones"]),
+                    "additional_emails": json.dumps(record["additional_emails"]),
+                }
+                for customer_id, record in records.items()
+                if record["changed"]
+            ]
+            if updates:
+                conn.execute(
+                    customers.update()
+                    .where(customers.c.id == bindparam("_id"))
+                    .values({name: bindparam(name) for name in updates[0] if name != "_id"}),
+                    updates,
+                )
+            conn.execute(contacts.delete().where(contacts.c.customer_id.in_(list(records))))
+            contact_rows = [
+                row for customer_id, record in records.items() for row in _contact_rows(customer_id, record)
+            ]
+            if contact_rows:
+                conn.execute(contacts.insert(), contact_rows)
+    if collisions:
+        logger.warning(
+            "%d customers have a phone another customer holds once normalized; left as typed "
+            "(customer -> holder: %s). Review with: python -m app.contacts merge --dry-run",
+            len(collisions),
+            ", ".join(f"{customer_id} -> {holder}" for customer_id, holder in collisions),
+        )
+
+
+@migration(15, "menu_item_photo_variants")
+def _menu_item_photo_variants(engine: Engine, dialect: str) -> None:
+    _add_missing_columns(
+        engine,
+        dialect,
+        "menu_items",
+        [("photo_variants", "ALTER TABLE menu_items ADD COLUMN photo_variants TEXT")],
+    )
+
+
+@migration(16, "order_events")
+def _order_events(engine: Engine, dialect: str) -> None:
+    from .models import OrderEvent
+
+    OrderEvent.__table__.create(bind=engine, checkfirst=True)
+
+
+@migration(17, "idempotency_keys")
+def _idempotency_keys(engine: Engine, dialect: str) -> None:
+    from .models import IdempotencyKey
+
+    IdempotencyKey.__table__.create(bind=engine, checkfirst=True)
+
+
+@migration(18, "orders_week_id_index")
+def _orders_week_id_index(engine: Engine, dialect: str) -> None:
+    # Paging the tally's special requests and delivery list by week.
+    _create_indexes(engine, dialect, ["ix_orders_menu_week_id_id"])
 
-            if _table_exists(conn, dialect, "customers"):
-                customer_cols = _column_names(conn, dialect, "customers")
-                customer_additions = [
-                    ("address", "ALTER TABLE customers ADD COLUMN address VARCHAR"),
-                    ("city", "ALTER TABLE customers ADD COLUMN city VARCHAR"),
-                    ("zip_code", "ALTER TABLE customers ADD COLUMN zip_code VARCHAR"),
-                    ("additional_phones", "ALTER TABLE customers ADD COLUMN additional_phones TEXT"),
-                    ("additional_emails", "ALTER TABLE customers ADD COLUMN additional_emails TEXT"),
-                ]
-                for column_name, statement in customer_additions:
-                    if column_name not in customer_cols and _safe_execute(conn, statement):
-                        customer_cols.add(column_name)
-
-            if _table_exists(conn, dialect, "orders"):
-                order_cols = _column_names(conn, dialect, "orders")
-                if "customer_name" not in order_cols:
-                    _safe_execute(conn, "ALTER TABLE orders ADD COLUMN customer_name VARCHAR")
 
+@migration(19, "order_checkout_claim_columns")
+def _checkout_claim_columns(engine: Engine, dialect: str) -> None:
+    defaults = DEFAULTS[dialect]
+    _add_missing_columns(
+        engine,
+        dialect,
+        "orders",
+        [
+            ("stripe_checkout_claim", "ALTER TABLE orders ADD COLUMN stripe_checkout_claim VARCHAR"),
+            (
+                "stripe_checkout_claimed_at",
+                f"ALTER TABLE orders ADD COLUMN stripe_checkout_claimed_at {defaults['naive_datetime_type']}",
+            ),
+        ],
+    )
+
+
+
+@migration(20, "order_session_timestamps_without_time_zone")
+def _order_session_timestamps(engine: Engine, dialect: str) -> None:
+    # Migrations 9 and 19 added these as TIMESTAMPTZ; psycopg then returned
+    # aware datetimes that can't be compared with datetime.utcnow().
+    _drop_time_zone(engine, dialect, "orders", ["stripe_session_expires_at", "stripe_checkout_claimed_at"])
+
+
+
+@migration(21, "stripe_inbox_timestamps_without_time_zone")
+def _stripe_inbox_timestamps(engine: Engine, dialect: str) -> None:
+    # Added as TIMESTAMPTZ by migration 8; the backoff arithmetic is naive UTC.
+    _drop_time_zone(engine, dialect, "stripe_webhook_events", ["next_attempt_at", "processed_at"])
+
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(engine: Engine) -> Optional[int]:
+    """Highest applied version; None when ``schema_migrations`` doesn't exist yet."""
+    try:
+        conn = engine.connect()
     except SQLAlchemyError as exc:
         logger.exception("Database unreachable during startup migrations")
         raise RuntimeError("Database unreachable during startup migrations") from exc
+    with conn:
+        try:
+            return conn.execute(select(func.max(schema_migrations.c.version))).scalar() or 0
+        except DBAPIError:
+            conn.rollback()
+            return None
+
+
+def applied_migrations(engine: Engine) -> Dict[int, datetime]:
+    with engine.connect() as conn:
+        rows = conn.execute(select(schema_migrations.c.version, schema_migrations.c.applied_at))
+        return {version: applied_at for version, applied_at in rows}
+
+
+def _record(engine: Engine, step: Migration) -> None:
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                schema_migrations.insert().values(
+                    version=step.version, name=step.name, applied_at=datetime.utcnow()
+                )
+            )
+    except IntegrityError:
+        # Another process finished the same step first; they're idempotent.
+        pass
+
+
+def run_migrations(engine: Engine) -> int:
+    """
+    Bring the schema up to ``LATEST_VERSION``. Returns the number of
+    migrations applied (0 on a warm start, which costs a single query).
+    """
+    version = current_version(engine)
+    if version == LATEST_VERSION:
+        return 0
+
+    dialect = _dialect_name(engine)
+    if version is None:
+        schema_migrations.create(bind=engine, checkfirst=True)
+        applied = set()
+    else:
+        # Normally a prefix, but check individually in case one was skipped.
+        applied = set(applied_migrations(engine))
+
+    count = 0
+    for step in MIGRATIONS:
+        if step.version in applied:
+            continue
+        started = time.perf_counter()
+        try:
+            step.apply(engine, dialect)
+        except SQLAlchemyError as exc:
+            logger.exception("Migration %d (%s) failed", step.version, step.name)
+            raise RuntimeError(f"Migration {step.version} ({step.name}) failed") from exc
+        _record(engine, step)
+        count += 1
+        logger.info(
+            "Applied migration %d (%s) in %.2fs", step.version, step.name, time.perf_counter() - started
+        )
+    return count
+
+
+def reset_database(engine: Engine) -> None:
+    """Drop every table, including the migration history (RESET_DB_ON_STARTUP)."""
+    from . import models  # noqa: F401
+    from .db import Base
+
+    Base.metadata.drop_all(bind=engine)
+    schema_migrations.drop(bind=engine, checkfirst=True)
+
+
+def index_report(engine: Engine) -> Dict[str, List[str]]:
+    """
+    Declared indexes that are missing or invalid, and (Postgres only) existing
+    non-unique indexes that have never been scanned since statistics were reset.
+    """
+    dialect = _dialect_name(engine)
+    declared = declared_indexes()
+    with engine.connect() as conn:
+        existing = _existing_indexes(conn, dialect)
+        unused = []
+        if dialect == "postgresql":
+            rows = conn.execute(
+                text(
+                    """
+                    SELECT s.indexrelname, pg_size_pretty(pg_relation_size(s.indexrelid))
+                    FROM pg_stat_user_indexes s
+                    JOIN pg_index i ON i.indexrelid = s.indexrelid
+                    WHERE s.schemaname = current_schema()
+                      AND s.idx_scan = 0 AND NOT i.indisunique AND NOT i.indisprimary
+                    ORDER BY pg_relation_size(s.indexrelid) DESC
+                    """
+                )
+            )
+            unused = [f"{name} ({size})" for name, size in rows]
+    return {
+        "missing": sorted(name for name in declared if name not in existing),
+        "invalid": sorted(name for name in declared if existing.get(name) is False),
+        "unused": unused,
+    }
+
+
+def main(argv=None) -> int:
+    from .db import engine
+
+    parser = argparse.ArgumentParser(prog="python -m app.db_migrations", description="Schema migrations.")
+    parser.add_argument("command", choices=["status", "migrate", "indexes"], nargs="?", default="status")
+    args = parser.parse_args(argv)
+
+    if args.command == "indexes":
+        report = index_report(engine)
+        for kind in ("missing", "invalid", "unused"):
+            print(f"{kind}: {', '.join(report[kind]) or 'none'}")
+        if _dialect_name(engine) != "postgresql":
+            print("(index usage statistics are only available on Postgres)")
+        return 1 if report["missing"] or report["invalid"] else 0
+
+    if args.command == "migrate":
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        print(f"applied {run_migrations(engine)} migration(s); schema at version {LATEST_VERSION}")
+        return 0
+
+    applied = applied_migrations(engine) if current_version(engine) is not None else {}
+    for step in MIGRATIONS:
+        when = applied.get(step.version)
+        print(f"{step.version:>4}  {step.name:<40} {when.isoformat(sep=' ') if when else 'pending'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Idempotency keys for storefront order creation.
+
+A client that sends ``Idempotency-Key`` with POST /api/public/orders/ can retry
+the request safely: the key is claimed by inserting it into
+``idempotency_keys`` in the same transaction as the order, and the order's
+response is stored on it before commit. So:
+
+* a retry after the first request committed finds the stored response and
+  returns it, without reading or writing the order tables;
+* a duplicate arriving while the first is still running blocks on the
+  uncommitted key (``INSERT ... ON CONFLICT DO NOTHING`` waits for the other
+  transaction; on SQLite, for its write lock) and then returns the stored
+  response. It never places a second order. If the first request fails, its
+  key is rolled back with it and the duplicate goes ahead;
+* reusing a key with a different body is rejected with 422.
+
+Failed requests store nothing, so a retry after a 400 is validated again.
+Keys expire after IDEMPOTENCY_KEY_TTL_HOURS; ``Purger`` deletes expired ones
+in the background.
+"""
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import SessionLocal, dialect_insert
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+PURGE_INTERVAL_SECONDS = 600
+PURGE_BATCH_SIZE = 1000
+
+
+def fingerprint(body: str) -> str:
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def claim(db: Session, key: str, request_hash: str) -> Optional[str]:
+    """
+    Claim ``key`` in the session's transaction. Returns None when the caller
+    should go ahead (and ``complete`` the key before committing), or the
+    stored response of the request that already used it.
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, detail=f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"
+        )
+    now = datetime.utcnow()
+    stmt = dialect_insert(db, IdempotencyKey).values(
+        key=key,
+        request_hash=request_hash,
+        expires_at=now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS),
+    )
+    try:
+        # An expired key is free to use again. On SQLite this first write
+        # already waits for the other request's write lock.
+        db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.expires_at < now))
+        # Blocks while another transaction holds the same key uncommitted.
+        result = db.execute(stmt.on_conflict_do_nothing(index_elements=[IdempotencyKey.key]))
+    except OperationalError:
+        # The statement timeout ran out waiting for the first request.
+        raise HTTPException(
+            status.HTTP_409_CONFLICT, detail=f"A request with this {HEADER} is still being processed"
+        )
+    if result.rowcount == 1:
+        return None
+
+    stored = db.execute(
+        select(IdempotencyKey.request_hash, IdempotencyKey.response).where(IdempotencyKey.key == key)
+    ).one()
+    if stored.request_hash != request_hash:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"{HEADER} was already used with a different request"
+        )
+    return stored.response
+
+
+def complete(db: Session, key: str, response: str) -> None:
+    """Store the response for a key claimed in this transaction."""
+    db.execute(update(IdempotencyKey).where(IdempotencyKey.key == key).values(response=response))
+
+
+def purge(db: Session) -> int:
+    """Delete expired keys in batches, committing each batch."""
+    deleted = 0
+    while True:
+        expired = (
+            select(IdempotencyKey.key)
+            .where(IdempotencyKey.expires_at < datetime.utcnow())
+            .limit(PURGE_BATCH_SIZE)
+            .scalar_subquery()
+        )
+        count = db.execute(delete(IdempotencyKey).where(IdempotencyKey.key.in_(expired))).rowcount
+        db.commit()
+        deleted += count
+        if count < PURGE_BATCH_SIZE:
+            return deleted
+
+
+class Purger:
+    """Background thread that deletes expired idempotency keys."""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="idempotency-purge", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                deleted = purge(db)
+                if deleted:
+                    logger.info("Purged %d expired idempotency keys", deleted)
+            except Exception:
+                logger.exception("Idempotency key purge failed")
+            finally:
+                db.close()
+            self._stop.wait(PURGE_INTERVAL_SECONDS)
+
+
+purger = Purger()
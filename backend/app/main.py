@@ -1,11 +1,17 @@
-from fastapi import FastAPI
+from . import boot  # first, so the "imports" startup phase covers the rest
+
+import os
+
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from pathlib import Path
+from . import idempotency, order_events, photos
+from .compression import CompressionMiddleware
 from .config import settings
-from .db import engine, Base, SessionLocal
-from .db_migrations import ensure_legacy_compat_columns
-from .seed import seed_demo_menu_if_empty
+from .db import async_engine, engine
+from .metrics import MetricsMiddleware, instrument_engine
+from .query_audit import QueryAuditMiddleware
+from .static_files import STATIC_DIR, CachingStaticFiles
+from .stripe_inbox import worker as stripe_inbox_worker
 from .routes.public_menu import router as public_menu_router
 from .routes.public_orders import router as public_orders_router
 from .routes.public_stripe import router as public_stripe_router
@@ -15,41 +21,76 @@ from .routes.admin_menu_items import router as admin_menu_items_router
 from .routes.admin_orders import router as admin_orders_router
 from .routes.admin_menu import router as admin_menu_router
 from .routes.admin_customers import router as admin_customers_router
+from .routes.admin_db import router as admin_db_router
+from .routes.admin_stripe import router as admin_stripe_router
+from .routes.metrics import router as metrics_router
 from .routes.queue import router as queue_router
 from .routes.site_settings import router as site_settings_router
 
 app = FastAPI(title="FoodBiz API")
 
+if settings.FAST_BOOT:
+    # Innermost, so requests held during warm-up still get CORS headers.
+    app.add_middleware(boot.FastBootMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.allowed_origins_list,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Query-Count", "X-Query-Repeated", "Idempotent-Replayed"],
 )
 
-app.mount("/static", StaticFiles(directory=Path(__file__).resolve().parent / "static"), name="static")
+if settings.QUERY_AUDIT and os.getenv("NODE_ENV") != "production":
+    app.add_middleware(QueryAuditMiddleware)
+
+if settings.COMPRESSION_ENABLED:
+    # /static sends its precompressed siblings instead (see app.static_files);
+    # /media holds only images.
+    app.add_middleware(
+        CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_SIZE, exclude_paths=("/static/", "/media/")
+    )
+
+if settings.metrics_exposed:
+    # Added last so it wraps everything else and times the full request.
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(engine)
+    instrument_engine(async_engine.sync_engine)
+
+photos.check_storage()
+app.mount(
+    photos.PHOTO_URL_PREFIX.rstrip("/"),
+    CachingStaticFiles(directory=photos.PHOTO_DIR, check_dir=False),
+    name="menu_photos",
+)
+app.mount("/static", CachingStaticFiles(directory=STATIC_DIR), name="static")
 
 
 @app.on_event("startup")
 def on_startup():
-    if settings.RESET_DB_ON_STARTUP:
-        Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
-    ensure_legacy_compat_columns(engine)
+    boot.startup()
 
-    if settings.SEED_DEMO_DATA:
-        db = SessionLocal()
-        try:
-            seed_demo_menu_if_empty(db)
-        finally:
-            db.close()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    stripe_inbox_worker.stop()
+    order_events.listener.stop()
+    idempotency.purger.stop()
+    photos.shutdown_pool()
+    await async_engine.dispose()
 
 
 @app.get("/health", tags=["Health"])
 def health():
-    return {"status": "ok", "demo_mode": settings.DEMO_MODE}
+    if boot.state.error is not None:
+        # FAST_BOOT warm-up failed; let the platform restart the instance.
+        raise HTTPException(status_code=503, detail="Startup failed")
+    return {"status": "ok", "demo_mode": settings.DEMO_MODE, "ready": boot.state.ready.is_set()}
+
 
+if settings.metrics_exposed:
+    app.include_router(metrics_router)
 
 # Public endpoints
 app.include_router(public_menu_router)
@@ -63,6 +104,8 @@ app.include_router(admin_menu_items_router)
 app.include_router(admin_orders_router)
 app.include_router(admin_menu_router)
 app.include_router(admin_customers_router)
+app.include_router(admin_db_router)
+app.include_router(admin_stripe_router)
 app.include_router(site_settings_router)
 
 # Queue and other internal APIs
@@ -0,0 +1,274 @@
+"""
+Lightweight request and database metrics in Prometheus text format.
+
+``MetricsMiddleware`` times every HTTP request and labels it with the matched
+route template (``/api/admin/orders/{order_id}``, not the raw path), so the
+number of series stays bounded. Engine event hooks count SQL statements and
+the time spent in them, attributing both to the request that issued them via
+a context variable; Starlette copies context into the threadpool and
+``AsyncSession.run_sync`` keeps it, so sync and async routes are both covered.
+
+Recording is a dict lookup, a bisect and a few additions under one lock, cheap
+enough to leave on in production.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    """SQL issued while serving one request."""
+
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("metrics_request", default=None)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.request_queries: Dict[Tuple[str, str], Histogram] = {}
+        self.request_db_seconds: Dict[Tuple[str, str], Histogram] = {}
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+    def request_started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+        key = (method, route)
+        with self._lock:
+            self.in_flight -= 1
+            status_key = (method, route, str(status))
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.request_queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+                self.request_db_seconds[key] = Histogram(LATENCY_BUCKETS)
+            self.latency[key].observe(seconds)
+            self.request_queries[key].observe(stats.queries)
+            self.request_db_seconds[key].observe(stats.db_seconds)
+
+    def query_finished(self, seconds: float) -> None:
+        with self._lock:
+            self.db_queries += 1
+            self.db_seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return (
+                self.in_flight,
+                dict(self.requests),
+                {k: _copy(h) for k, h in self.latency.items()},
+                {k: _copy(h) for k, h in self.request_queries.items()},
+                {k: _copy(h) for k, h in self.request_db_seconds.items()},
+                self.db_queries,
+                self.db_seconds,
+            )
+
+
+def _copy(histogram: Histogram) -> Histogram:
+    copied = Histogram(histogram.buckets)
+    copied.counts = list(histogram.counts)
+    copied.total = histogram.total
+    copied.count = histogram.count
+    return copied
+
+
+registry = Registry()
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    if scope.get("endpoint") is not None and scope.get("root_path"):
+        # Mounted apps (e.g. /static) don't set "route"; label by mount point.
+        return scope["root_path"]
+    # Unmatched paths (404s) are collapsed so scanners can't explode the series.
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses aren't buffered."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        registry.request_started()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            registry.request_finished(
+                scope["method"], _route_label(scope), status_code, time.perf_counter() - started, stats
+            )
+            _current_request.reset(token)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _current_request.get()
+
+
+def instrument_engine(engine) -> None:
+    """Count statements and DB time on ``engine`` (a sync Engine)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        elapsed = time.perf_counter() - started
+        registry.query_finished(elapsed)
+        stats = _current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("metrics_started"):
+            conn.info["metrics_started"].pop()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_le(bound: float) -> str:
+    return repr(float(bound))
+
+
+def _histogram_lines(name: str, histograms: Dict[Tuple[str, str], Histogram]) -> List[str]:
+    lines = []
+    for (method, route), histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(method=method, route=route, le=_format_le(bound))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(method=method, route=route, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(method=method, route=route)} {histogram.total}")
+        lines.append(f"{name}_count{_labels(method=method, route=route)} {histogram.count}")
+    return lines
+
+
+def render_prometheus(pools: Dict[str, dict], startup_phases: Optional[Dict[str, float]] = None) -> str:
+    """Render all metrics, plus connection pool and startup figures, as Prometheus text."""
+    in_flight, requests, latency, request_queries, request_db_seconds, db_queries, db_seconds = registry.snapshot()
+
+    lines = [
+        "# HELP http_requests_in_flight Requests currently being served.",
+        "# TYPE http_requests_in_flight gauge",
+        f"http_requests_in_flight {in_flight}",
+        "# HELP http_requests_total Requests served, by route template and status code.",
+        "# TYPE http_requests_total counter",
+    ]
+    for (method, route, status), count in sorted(requests.items()):
+        lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+    lines += [
+        "# HELP http_request_duration_seconds Request latency, until the last body byte is sent.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    lines += _histogram_lines("http_request_duration_seconds", latency)
+    lines += [
+        "# HELP http_request_db_queries SQL statements issued per request.",
+        "# TYPE http_request_db_queries histogram",
+    ]
+    lines += _histogram_lines("http_request_db_queries", request_queries)
+    lines += [
+        "# HELP http_request_db_seconds Time spent in SQL per request.",
+        "# TYPE http_request_db_seconds histogram",
+    ]
+    lines += _histogram_lines("http_request_db_seconds", request_db_seconds)
+
+    lines += [
+        "# HELP db_queries_total SQL statements executed, including background work.",
+        "# TYPE db_queries_total counter",
+        f"db_queries_total {db_queries}",
+        "# HELP db_query_seconds_total Time spent executing SQL statements.",
+        "# TYPE db_query_seconds_total counter",
+        f"db_query_seconds_total {db_seconds}",
+    ]
+
+    gauges = [
+        ("db_pool_checked_out", "checked_out", "Connections currently checked out."),
+        ("db_pool_overflow", "overflow", "Connections open beyond pool_size."),
+    ]
+    counters = [
+        ("db_pool_checkouts_total", "checkouts", "Connection checkouts."),
+        ("db_pool_checkout_timeouts_total", "checkout_timeouts", "Checkouts that timed out waiting."),
+        ("db_pool_wait_seconds_total", "wait_seconds_total", "Time spent waiting for a connection."),
+    ]
+    for kind, metrics in (("gauge", gauges), ("counter", counters)):
+        for name, key, help_text in metrics:
+            values = [(engine, status[key]) for engine, status in pools.items() if status.get(key) is not None]
+            if not values:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_labels(engine=engine)} {value}" for engine, value in values]
+
+    if startup_phases:
+        lines += [
+            "# HELP app_startup_phase_seconds Time spent in each startup phase of this process.",
+            "# TYPE app_startup_phase_seconds gauge",
+        ]
+        lines += [
+            f"app_startup_phase_seconds{_labels(phase=phase)} {seconds}" for phase, seconds in startup_phases.items()
+        ]
+
+    return "\n".join(lines) + "\n"
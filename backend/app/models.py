@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum, Text, func
+from sqlalchemy import (
+    Column, Integer, String, Boolean, DateTime, ForeignKey, Enum, Text, Index, UniqueConstraint, func,
+)
 from .db import Base
 from sqlalchemy.orm import relationship
 import enum
@@ -22,14 +24,21 @@ class MenuWeek(Base):
 
     items = relationship("MenuItem", back_populates="week")
 
+    __table_args__ = (
+        # The storefront's "latest published week" lookup.
+        Index("ix_menu_weeks_published_starts_at", "published", "starts_at"),
+    )
+
 
 class MenuItem(Base):
     __tablename__ = "menu_items"
     id = Column(Integer, primary_key=True, index=True)
-    menu_week_id = Column(Integer, ForeignKey("menu_weeks.id"), nullable=False)
+    menu_week_id = Column(Integer, ForeignKey("menu_weeks.id"), nullable=False, index=True)
     name = Column(String, nullable=False)
     description = Column(String, nullable=True)
     photo_url = Column(String, nullable=True)
+    # JSON: variant name -> {width, height, webp, fallback} (see app.photos).
+    photo_variants = Column(Text, nullable=True)
     price_cents = Column(Integer, nullable=False)
     available = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
@@ -53,6 +62,30 @@ class Customer(Base):
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
     orders = relationship("Order", back_populates="customer")
+    contacts = relationship("CustomerContact", cascade="all, delete-orphan")
+
+
+class CustomerContact(Base):
+    """One normalized phone, email or name word of a customer (see app.contacts)."""
+    __tablename__ = "customer_contacts"
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, ForeignKey("customers.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String, nullable=False)  # phone | email | name
+    value = Column(String, nullable=False)
+    is_primary = Column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        UniqueConstraint("customer_id", "kind", "value", name="uq_customer_contacts_customer_kind_value"),
+        # Prefix search; text_pattern_ops lets Postgres use it for LIKE 'abc%'
+        # whatever the database collation. customer_id makes it covering.
+        Index(
+            "ix_customer_contacts_kind_value",
+            "kind",
+            "value",
+            "customer_id",
+            postgresql_ops={"value": "text_pattern_ops"},
+        ),
+    )
 
 
 class OrderStatus(str, enum.Enum):
@@ -67,30 +100,56 @@ class Order(Base):
     __tablename__ = "orders"
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(Integer, ForeignKey("customers.id"), nullable=True)
+    # Week whose menu the order was placed against; NULL for legacy orders with no items.
+    menu_week_id = Column(Integer, ForeignKey("menu_weeks.id"), nullable=True)
     customer_name = Column(String, nullable=True)
-    phone = Column(String, nullable=False)
+    phone = Column(String, nullable=False, index=True)
     email = Column(String, nullable=True)
-    pickup_or_delivery = Column(String, nullable=False)
+    pickup_or_delivery = Column(String, nullable=False, index=True)
     delivery_fee_cents = Column(Integer, default=0, nullable=False)
     delivery_address = Column(String, nullable=True)
     comment = Column(String, nullable=True)
     total_cents = Column(Integer, nullable=False)
-    status = Column(Enum(OrderStatus), default=OrderStatus.PENDING, nullable=False)
-    stripe_session_id = Column(String, nullable=True)
+    status = Column(Enum(OrderStatus), default=OrderStatus.PENDING, nullable=False, index=True)
+    stripe_session_id = Column(String, nullable=True, index=True)
+    # Last Checkout Session handed out for this order, reused while it is open.
+    stripe_session_url = Column(String, nullable=True)
+    stripe_session_expires_at = Column(DateTime, nullable=True)
+    stripe_session_amount_cents = Column(Integer, nullable=True)
+    # Set while a checkout request creates a session outside the row lock;
+    # only the request holding this token may store its session.
+    stripe_checkout_claim = Column(String, nullable=True)
+    stripe_checkout_claimed_at = Column(DateTime, nullable=True)
     payment_intent_id = Column(String, nullable=True)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
     customer = relationship("Customer", back_populates="orders")
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Keyset pagination order for the admin order list; also serves
+        # created_at range filters, so there is no separate created_at index.
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        # Per-week listing and tally lookups.
+        Index("ix_orders_menu_week_id_created_at_id", "menu_week_id", "created_at", "id"),
+        # The week's special requests and deliveries, paged by id.
+        Index("ix_orders_menu_week_id_id", "menu_week_id", "id"),
+    )
+    # Fetch server-generated created_at via RETURNING on insert.
+    __mapper_args__ = {"eager_defaults": True}
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
-    menu_item_id = Column(Integer, ForeignKey("menu_items.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
+    menu_item_id = Column(Integer, ForeignKey("menu_items.id"), nullable=False, index=True)
     qty = Column(Integer, nullable=False)
     line_total_cents = Column(Integer, nullable=False)
+    # Snapshot of the menu item at order time, so later menu edits don't
+    # change what the customer is charged or shown.
+    unit_price_cents = Column(Integer, nullable=True)
+    item_name = Column(String, nullable=True)
 
     order = relationship("Order", back_populates="items")
     menu_item = relationship("MenuItem")
@@ -105,8 +164,56 @@ class SiteSetting(Base):
 
 
 class StripeWebhookEvent(Base):
+    """Durable inbox of verified Stripe events, drained by app.stripe_inbox."""
     __tablename__ = "stripe_webhook_events"
     id = Column(Integer, primary_key=True, index=True)
     event_id = Column(String, nullable=False, unique=True, index=True)
     event_type = Column(String, nullable=False)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    # Raw event JSON; NULL for events handled before the inbox existed.
+    payload = Column(Text, nullable=True)
+    status = Column(String, nullable=False, default="pending")  # pending | processed | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    # Earliest time a worker may (re)try the event; doubles as the claim lease.
+    next_attempt_at = Column(DateTime, nullable=True)
+    claimed_by = Column(String, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_stripe_webhook_events_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+
+class OrderTally(Base):
+    """Running kitchen tally maintained alongside order writes (see app.tally)."""
+    __tablename__ = "order_tallies"
+    # 0 for orders not tagged with a week.
+    menu_week_id = Column(Integer, primary_key=True, default=0)
+    bucket = Column(String, primary_key=True)
+    # 0 for the order-count buckets; the menu item for "item" rows.
+    menu_item_id = Column(Integer, primary_key=True, default=0)
+    value = Column(Integer, nullable=False, default=0)
+
+
+class OrderEvent(Base):
+    """One order change, for the admin live feed (see app.order_events)."""
+    __tablename__ = "order_events"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    # No foreign key: a deleted order's events outlive it.
+    order_id = Column(Integer, nullable=False)
+    data = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False, index=True)
+
+
+class IdempotencyKey(Base):
+    """A storefront order request's Idempotency-Key (see app.idempotency)."""
+    __tablename__ = "idempotency_keys"
+    key = Column(String, primary_key=True)
+    # SHA-256 of the request body; a reused key must come with the same body.
+    request_hash = Column(String, nullable=False)
+    # The stored OrderRead JSON; set in the transaction that claimed the key.
+    response = Column(Text, nullable=True)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
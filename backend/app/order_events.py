@@ -0,0 +1,298 @@
+"""
+Live feed of order changes for the admin dashboards.
+
+Every order write adds an ``order_events`` row in its own transaction:
+
+* ``order.created``: storefront or admin;
+* ``order.updated``: admin edit;
+* ``order.status_changed``: admin status change;
+* ``order.paid``: Stripe payment, applied by app.stripe_inbox;
+* ``order.deleted``.
+
+GET /api/admin/orders/events sends them as Server-Sent Events. The SSE id is
+the row id, so a client that reconnects with ``Last-Event-ID`` gets what it
+missed, for up to ORDER_EVENTS_RETENTION_HOURS. Delivery is at least once;
+dedupe by id.
+
+Streams don't poll. A commit that recorded events wakes the streams in its
+own process. On Postgres the commit also sends NOTIFY, and a LISTEN thread
+in every worker wakes that worker's streams. An idle dashboard costs a
+keep-alive comment every ORDER_FEED_KEEPALIVE_SECONDS and no queries.
+SQLite has no notifications between processes, so there, and while the
+LISTEN connection is down, streams also check for new rows at each
+keep-alive.
+"""
+import asyncio
+import json
+import logging
+import select as select_module
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+from sqlalchemy import event, func, or_, select
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import AsyncSessionLocal, SessionLocal, engine
+from .models import Order, OrderEvent
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "order_events"
+
+CREATED = "order.created"
+UPDATED = "order.updated"
+STATUS_CHANGED = "order.status_changed"
+PAID = "order.paid"
+DELETED = "order.deleted"
+
+BATCH_SIZE = 500
+# Postgres hands out ids before commit, so a lower id can become visible
+# after higher ones. A skipped id is looked for again (its commit wakes the
+# streams like any other) for this long.
+GAP_GRACE_SECONDS = 10.0
+MAX_GAPS = 100
+# Client reconnect delay sent in the stream.
+RETRY_MS = 3000
+PURGE_INTERVAL_SECONDS = 3600
+RECONNECT_SECONDS = 5.0
+
+_PENDING = "order_events_pending"
+
+
+def _is_postgres(bind) -> bool:
+    return bind.dialect.name.startswith("postgres")
+
+
+def _status(order: Order) -> Optional[str]:
+    return getattr(order.status, "value", order.status)
+
+
+def record(db: Session, kind: str, order: Order, **extra) -> None:
+    """Add an event for ``order`` (already flushed) to the session's transaction."""
+    data = {
+        "order_id": order.id,
+        "menu_week_id": order.menu_week_id,
+        "status": _status(order),
+        "pickup_or_delivery": order.pickup_or_delivery,
+        "total_cents": order.total_cents,
+        "customer_name": order.customer_name,
+        **extra,
+    }
+    db.add(OrderEvent(kind=kind, order_id=order.id, data=json.dumps(data, separators=(",", ":"))))
+    db.info[_PENDING] = True
+    if _is_postgres(db.get_bind()):
+        # Delivered to the listeners when (and only if) the transaction commits.
+        db.execute(select(func.pg_notify(CHANNEL, "")))
+
+
+class Hub:
+    """The open streams of this process, woken from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = set()
+        # True while this process holds a Postgres LISTEN.
+        self.listening = False
+
+    @contextmanager
+    def subscribe(self) -> Iterator[asyncio.Event]:
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            yield waiter[1]
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    def notify(self) -> None:
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, wake in waiters:
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:  # the loop has closed
+                pass
+
+
+hub = Hub()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session: Session) -> None:
+    if session.info.pop(_PENDING, False):
+        hub.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING, None)
+
+
+class Cursor:
+    """A stream's position: the highest id sent and the lower ids still awaited."""
+
+    def __init__(self, last_id: int):
+        self.last_id = last_id
+        self.gaps: Dict[int, float] = {}
+
+    def fetch(self, db: Session) -> list:
+        """The next events to send, oldest first, advancing the cursor past them."""
+        now = time.monotonic()
+        self.gaps = {event_id: seen for event_id, seen in self.gaps.items() if now - seen < GAP_GRACE_SECONDS}
+        condition = OrderEvent.id > self.last_id
+        if self.gaps:
+            condition = or_(condition, OrderEvent.id.in_(list(self.gaps)))
+        rows = db.execute(
+            select(OrderEvent.id, OrderEvent.kind, OrderEvent.data)
+            .where(condition)
+            .order_by(OrderEvent.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        for row in rows:
+            if self.gaps.pop(row.id, None) is not None:
+                continue
+            if row.id - self.last_id - 1 <= MAX_GAPS:
+                for missing in range(self.last_id + 1, row.id):
+                    self.gaps[missing] = now
+            self.last_id = row.id
+        return rows
+
+
+def latest_id(db: Session) -> int:
+    return db.execute(select(func.max(OrderEvent.id))).scalar() or 0
+
+
+def format_event(row) -> str:
+    return f"id: {row.id}\nevent: {row.kind}\ndata: {row.data}\n\n"
+
+
+async def _read(fn):
+    async with AsyncSessionLocal() as db:
+        return await db.run_sync(fn)
+
+
+async def stream(last_event_id: Optional[int] = None) -> AsyncIterator[str]:
+    """
+    SSE text for every event after ``last_event_id`` (default: only events
+    from now on), then for each new one as it is committed.
+    """
+    with hub.subscribe() as wake:
+        # Reads are shielded: a client leaving mid-read mustn't cancel the
+        # session's cleanup.
+        if last_event_id is None:
+            last_event_id = await asyncio.shield(_read(latest_id))
+        cursor = Cursor(last_event_id)
+        yield f"retry: {RETRY_MS}\n\n"
+        check = True
+        while True:
+            if check:
+                # Cleared before reading, so a commit during the read wakes us again.
+                wake.clear()
+                rows = await asyncio.shield(_read(cursor.fetch))
+                if rows:
+                    yield "".join(format_event(row) for row in rows)
+                if len(rows) == BATCH_SIZE:
+                    continue
+            try:
+                await asyncio.wait_for(wake.wait(), settings.ORDER_FEED_KEEPALIVE_SECONDS)
+                check = True
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                # Other processes' commits only wake us through LISTEN.
+                check = not hub.listening
+
+
+def purge(db: Session) -> int:
+    cutoff = datetime.utcnow() - timedelta(hours=settings.ORDER_EVENTS_RETENTION_HOURS)
+    deleted = db.query(OrderEvent).filter(OrderEvent.created_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def _wait_for_notify(connection, timeout: float) -> bool:
+    """Block up to ``timeout`` for a notification on a LISTENing DBAPI connection."""
+    if hasattr(connection, "poll"):  # psycopg2
+        if not select_module.select([connection], [], [], timeout)[0]:
+            return False
+        connection.poll()
+        received = bool(connection.notifies)
+        connection.notifies.clear()
+        return received
+    # psycopg 3
+    return any(True for _ in connection.notifies(timeout=timeout, stop_after=1))
+
+
+class Listener:
+    """
+    Background thread that purges expired events and, on Postgres, LISTENs
+    for other workers' commits.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="order-events", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        next_purge = 0.0
+        while not self._stop.is_set():
+            if time.monotonic() >= next_purge:
+                next_purge = time.monotonic() + PURGE_INTERVAL_SECONDS
+                db = SessionLocal()
+                try:
+                    deleted = purge(db)
+                    if deleted:
+                        logger.info("Purged %d expired order events", deleted)
+                except Exception:
+                    logger.exception("Order event purge failed")
+                finally:
+                    db.close()
+            if not _is_postgres(engine):
+                self._stop.wait(next_purge - time.monotonic())
+                continue
+            try:
+                # Reconnects every purge interval, which also replaces a
+                # connection that died without an error.
+                self._listen(until=next_purge)
+            except Exception:
+                logger.exception("Order event LISTEN failed; retrying in %ss", RECONNECT_SECONDS)
+                self._stop.wait(RECONNECT_SECONDS)
+
+    def _listen(self, until: float) -> None:
+        pooled = engine.raw_connection()
+        # Held for as long as we listen, so keep it out of the request pool.
+        pooled.detach()
+        connection = pooled.driver_connection
+        try:
+            connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute(f"LISTEN {CHANNEL}")
+            cursor.close()
+            hub.listening = True
+            # Anything committed while we weren't listening.
+            hub.notify()
+            while not self._stop.is_set() and time.monotonic() < until:
+                if _wait_for_notify(connection, 1.0):
+                    hub.notify()
+        finally:
+            hub.listening = False
+            connection.close()
+
+
+listener = Listener()
@@ -0,0 +1,161 @@
+"""
+Streaming order export for the kitchen and accounting.
+
+One query walks the filtered orders oldest first, joined to their lines, the
+menu items and the customer, through a server-side cursor (``yield_per``).
+Rows are encoded and sent in chunks as they arrive, so memory stays flat no
+matter how many orders match and the first bytes go out before the query
+has finished.
+
+``per="order"`` gives one row per order with its lines folded in. ``per="line"``
+gives one row per order line with the order's columns repeated (orders with no
+lines get one row with the line columns empty).
+"""
+import csv
+import io
+import json
+from itertools import groupby
+from typing import Iterator, List, Optional
+
+from sqlalchemy import Select, func, select
+from sqlalchemy.orm import Session
+
+from .models import Customer, MenuItem, Order, OrderItem
+
+FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+# Rows fetched from the cursor, and encoded per chunk sent, at a time.
+CHUNK_ROWS = 1000
+
+ORDER_COLUMNS = [
+    "order_id",
+    "created_at",
+    "status",
+    "menu_week_id",
+    "customer_id",
+    "customer_name",
+    "phone",
+    "email",
+    "pickup_or_delivery",
+    "delivery_address",
+    "delivery_fee_cents",
+    "total_cents",
+    "comment",
+    "payment_intent_id",
+]
+LINE_COLUMNS = ["menu_item_id", "item_name", "qty", "unit_price_cents", "line_total_cents"]
+
+
+def export_query() -> Select:
+    """Order lines with their order and customer, for the caller to filter."""
+    return (
+        select(
+            Order.id,
+            Order.created_at,
+            Order.status,
+            Order.menu_week_id,
+            Order.customer_id,
+            func.coalesce(Order.customer_name, Customer.name),
+            Order.phone,
+            func.coalesce(Order.email, Customer.email),
+            Order.pickup_or_delivery,
+            Order.delivery_address,
+            Order.delivery_fee_cents,
+            Order.total_cents,
+            Order.comment,
+            Order.payment_intent_id,
+            # LINE_COLUMNS from here on.
+            OrderItem.menu_item_id,
+            # The name at order time; older lines predate the snapshot.
+            func.coalesce(OrderItem.item_name, MenuItem.name),
+            OrderItem.qty,
+            OrderItem.unit_price_cents,
+            OrderItem.line_total_cents,
+        )
+        .outerjoin(Customer, Customer.id == Order.customer_id)
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .outerjoin(MenuItem, MenuItem.id == OrderItem.menu_item_id)
+    )
+
+
+def columns(per: str) -> List[str]:
+    return ORDER_COLUMNS + (LINE_COLUMNS if per == "line" else ["items"])
+
+
+_LINE_START = len(ORDER_COLUMNS)
+
+
+def _order_values(row) -> list:
+    values = list(row[:_LINE_START])
+    values[1] = values[1].isoformat() if values[1] else None  # created_at
+    values[2] = getattr(values[2], "value", values[2])  # status
+    return values
+
+
+def _records(rows, per: str) -> Iterator[list]:
+    """Values in ``columns(per)`` order; for per="order" the last is a list of line dicts."""
+    if per == "line":
+        for row in rows:
+            yield _order_values(row) + list(row[_LINE_START:])
+        return
+    # Rows arrive grouped by order, so folding lines in needs one order in memory.
+    for _, order_rows in groupby(rows, key=lambda row: row[0]):
+        order_rows = list(order_rows)
+        lines = [dict(zip(LINE_COLUMNS, row[_LINE_START:])) for row in order_rows if row[_LINE_START] is not None]
+        yield _order_values(order_rows[0]) + [lines]
+
+
+def _csv_items(lines) -> str:
+    return "; ".join(f"{line['qty']}x {line['item_name'] or line['menu_item_id']}" for line in lines)
+
+
+class _CsvLines:
+    """csv.writer that hands back each row as a string."""
+
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def line(self, values) -> str:
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.writer.writerow(values)
+        return self.buffer.getvalue()
+
+
+def stream(db: Session, query: Select, export_format: str = "csv", per: str = "order") -> Iterator[bytes]:
+    """
+    Encode the rows of ``query`` (from ``export_query``, filtered) in chunks.
+
+    Takes ownership of ``db`` and closes it when the stream ends or the
+    client goes away.
+    """
+    try:
+        header = columns(per)
+        csv_lines = _CsvLines()
+        if export_format == "csv":
+            # Sent before the query runs.
+            yield csv_lines.line(header).encode()
+
+        query = query.order_by(Order.created_at, Order.id, OrderItem.id).execution_options(yield_per=CHUNK_ROWS)
+        rows = db.connection().execute(query)
+        chunk: List[str] = []
+        for values in _records(rows, per):
+            if export_format == "csv":
+                if per == "order":
+                    values[-1] = _csv_items(values[-1])
+                chunk.append(csv_lines.line(values))
+            else:
+                chunk.append(json.dumps(dict(zip(header, values)), separators=(",", ":")) + "\n")
+            if len(chunk) >= CHUNK_ROWS:
+                yield "".join(chunk).encode()
+                chunk = []
+        if chunk:
+            yield "".join(chunk).encode()
+    finally:
+        db.close()
+
+
+def filename(export_format: str, per: str, week_id: Optional[int] = None) -> str:
+    scope = f"week-{week_id}" if week_id is not None else "orders"
+    suffix = "-lines" if per == "line" else ""
+    return f"{scope}{suffix}.{export_format}"
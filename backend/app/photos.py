@@ -0,0 +1,194 @@
+"""
+Menu photo variants.
+
+An uploaded photo is rendered at a few widths (``VARIANTS``), each as WebP
+plus a JPEG fallback (PNG when the photo has transparency). Every file is
+named by the hash of its bytes, so a URL never changes content and can be
+cached for good (see app.static_files). The renders run in a worker pool,
+one task per variant. Pillow releases the GIL while it decodes, resizes and
+encodes, so the variants of a large upload are rendered on several CPUs at
+once.
+
+The files go to PHOTO_DIR and are served from ``/media/menu_photos/``. Old
+files are left in place when a photo is replaced. Identical renders share a
+file.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+from .config import settings
+
+# Uploads must outlive the container: in production PHOTO_DIR has to be set
+# to persistent storage (see check_storage).
+DEFAULT_PHOTO_DIR = Path(__file__).resolve().parent.parent / "media" / "menu_photos"
+PHOTO_DIR = Path(settings.PHOTO_DIR) if settings.PHOTO_DIR else DEFAULT_PHOTO_DIR
+PHOTO_URL_PREFIX = "/media/menu_photos/"
+
+# name -> maximum width in pixels. Smaller photos are never scaled up.
+VARIANTS = {"thumb": 240, "card": 640, "full": 1600}
+# Reject anything larger before decoding it (decompression bombs).
+MAX_PIXELS = 50_000_000
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class InvalidPhoto(ValueError):
+    pass
+
+
+class PhotoTooLarge(InvalidPhoto):
+    pass
+
+
+def uploads_enabled() -> bool:
+    """False in production until PHOTO_DIR names persistent storage."""
+    return bool(settings.PHOTO_DIR) or os.getenv("NODE_ENV") != "production"
+
+
+def check_storage() -> None:
+    """
+    Fail at startup when PHOTO_DIR is set but isn't a writable directory,
+    e.g. because the disk it names isn't mounted. Writing to the container
+    instead would lose every upload on the next deploy.
+    """
+    if not settings.PHOTO_DIR:
+        return
+    if not PHOTO_DIR.is_dir() or not os.access(PHOTO_DIR, os.W_OK):
+        raise RuntimeError(f"PHOTO_DIR {PHOTO_DIR} is not a writable directory; is the disk mounted?")
+
+
+@lru_cache(maxsize=None)
+def _decode_errors() -> tuple:
+    """What Pillow raises for a file it can't decode. Some decoders raise
+    ValueError or SyntaxError rather than OSError."""
+    from PIL import Image
+
+    return (OSError, ValueError, SyntaxError, Image.DecompressionBombError)
+
+
+def _pool_size() -> int:
+    if settings.PHOTO_WORKERS > 0:
+        return settings.PHOTO_WORKERS
+    from .serve import available_cpus
+
+    return min(len(VARIANTS), available_cpus())
+
+
+def get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(_pool_size(), thread_name_prefix="photo")
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _write_hashed(data: bytes, extension: str, directory: Path) -> str:
+    name = f"{hashlib.sha256(data).hexdigest()[:16]}.{extension}"
+    target = directory / name
+    if not target.exists():
+        # Write then rename, so a request never sees a partial file.
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, target)
+    return PHOTO_URL_PREFIX + name
+
+
+def render_variant(source: str, max_width: int, directory: str) -> Dict[str, object]:
+    """Render one width of ``source`` as WebP and a fallback."""
+    import io
+
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        # JPEGs can decode straight at a fraction of their size.
+        image.draft("RGB", (max_width, max_width * 4))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    if image.width > max_width:
+        image = image.resize((max_width, max(1, round(image.height * max_width / image.width))), Image.LANCZOS)
+
+    def encode(fmt: str, **options) -> bytes:
+        buffer = io.BytesIO()
+        image.save(buffer, fmt, **options)
+        return buffer.getvalue()
+
+    target = Path(directory)
+    webp = encode("WEBP", quality=WEBP_QUALITY, method=4)
+    if has_alpha:
+        fallback, extension = encode("PNG", optimize=True), "png"
+    else:
+        fallback, extension = encode("JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True), "jpg"
+    return {
+        "width": image.width,
+        "height": image.height,
+        "webp": _write_hashed(webp, "webp", target),
+        "fallback": _write_hashed(fallback, extension, target),
+    }
+
+
+def _check(source: str) -> None:
+    from PIL import Image
+
+    try:
+        with Image.open(source) as image:
+            width, height = image.size
+    except _decode_errors():
+        raise InvalidPhoto("Not a supported image, or too large to decode")
+    if width * height > MAX_PIXELS:
+        raise InvalidPhoto(f"Image is larger than {MAX_PIXELS // 1_000_000} megapixels")
+
+
+def create_variants(upload: BinaryIO, directory: Path = PHOTO_DIR) -> Dict[str, Dict[str, object]]:
+    """
+    Render every variant of the image in ``upload`` and return, per variant
+    name, its size and the URLs of its files. Blocks until all are written.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    limit = settings.PHOTO_MAX_UPLOAD_MB * 1024 * 1024
+    fd, source = tempfile.mkstemp(dir=directory, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            copied = 0
+            while True:
+                chunk = upload.read(1024 * 1024)
+                if not chunk:
+                    break
+                copied += len(chunk)
+                if copied > limit:
+                    raise PhotoTooLarge(f"Photo is larger than {settings.PHOTO_MAX_UPLOAD_MB} MB")
+                handle.write(chunk)
+        _check(source)
+        pool = get_pool()
+        futures = {
+            name: pool.submit(render_variant, source, max_width, str(directory))
+            for name, max_width in VARIANTS.items()
+        }
+        try:
+            return {name: future.result() for name, future in futures.items()}
+        except _decode_errors() as exc:  # e.g. a truncated file that only fails to decode
+            for future in futures.values():
+                future.cancel()
+            raise InvalidPhoto(f"Could not read the image: {exc}")
+    finally:
+        os.unlink(source)
@@ -0,0 +1,168 @@
+"""
+N+1 query detection for development and tests.
+
+Every SQL statement is normalized (literals and bind parameters become ``?``,
+IN-lists collapse to one placeholder) so statements that differ only in their
+parameters group together. The same shape running several times within one
+request is the signature of a lazy-loaded relationship inside a loop.
+
+Two ways to use it:
+
+* ``QUERY_AUDIT=true`` (ignored when NODE_ENV=production) installs
+  ``QueryAuditMiddleware``. It adds ``X-Query-Count`` to every response, adds
+  ``X-Query-Repeated`` when a shape repeats, and logs the offending SQL.
+* ``assert_max_queries`` in tests and scripts::
+
+      with assert_max_queries(2):
+          client.get("/api/public/menu/")
+"""
+import logging
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# A normalized statement seen this many times in one request is reported.
+REPEAT_THRESHOLD = 3
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_BIND_PARAM = re.compile(r"%\(\w+\)s|%s|\$\d+|:\w+|\?")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(statement: str) -> str:
+    sql = _STRING_LITERAL.sub("?", statement)
+    sql = _BIND_PARAM.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(?)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+class QueryLog:
+    """Statements executed within one request or capture block."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.statements: List[str] = []
+
+    def add(self, statement: str) -> None:
+        with self._lock:
+            self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def grouped(self) -> Counter:
+        return Counter(normalize_sql(statement) for statement in self.statements)
+
+    def repeated(self, threshold: int = REPEAT_THRESHOLD) -> List[Tuple[str, int]]:
+        """Normalized statements issued at least ``threshold`` times, most frequent first."""
+        return [(sql, n) for sql, n in self.grouped().most_common() if n >= threshold]
+
+    def report(self) -> str:
+        lines = [f"{self.count} queries"]
+        lines += [f"  {n}x {sql}" for sql, n in self.grouped().most_common()]
+        return "\n".join(lines)
+
+
+_current_log: ContextVar[Optional[QueryLog]] = ContextVar("query_audit_log", default=None)
+# Process-wide captures for assert_max_queries. TestClient runs the app on its
+# own thread, so the test's context variables never reach the request.
+_captures: List[QueryLog] = []
+_captures_lock = threading.Lock()
+_instrumented = set()
+
+
+def instrument_engine(engine) -> None:
+    """Record statements executed on ``engine`` (a sync Engine). Idempotent."""
+    if id(engine) in _instrumented:
+        return
+    _instrumented.add(id(engine))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        log = _current_log.get()
+        if log is not None:
+            log.add(statement)
+        if _captures:
+            with _captures_lock:
+                for capture in _captures:
+                    capture.add(statement)
+
+
+def _instrument_default_engines() -> None:
+    from .db import async_engine, engine
+
+    instrument_engine(engine)
+    instrument_engine(async_engine.sync_engine)
+
+
+@contextmanager
+def capture_queries() -> Iterator[QueryLog]:
+    """Collect every statement run on the app's engines inside the block."""
+    _instrument_default_engines()
+    log = QueryLog()
+    with _captures_lock:
+        _captures.append(log)
+    try:
+        yield log
+    finally:
+        with _captures_lock:
+            _captures.remove(log)
+
+
+@contextmanager
+def assert_max_queries(limit: int, allow_repeats: bool = False) -> Iterator[QueryLog]:
+    """
+    Fail if the block runs more than ``limit`` statements, or (unless
+    ``allow_repeats``) repeats one statement shape ``REPEAT_THRESHOLD`` times.
+    """
+    with capture_queries() as log:
+        yield log
+    if log.count > limit:
+        raise AssertionError(f"Expected at most {limit} queries, got {log.report()}")
+    if not allow_repeats and log.repeated():
+        raise AssertionError(f"Possible N+1: repeated statements in {log.report()}")
+
+
+class QueryAuditMiddleware:
+    """Reports each request's query count in a response header (development only)."""
+
+    def __init__(self, app):
+        self.app = app
+        _instrument_default_engines()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = QueryLog()
+        token = _current_log.set(log)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(log.count).encode()))
+                repeated = log.repeated()
+                if repeated:
+                    headers.append((b"x-query-repeated", str(len(repeated)).encode()))
+                    logger.warning(
+                        "Possible N+1 in %s %s:\n%s", scope["method"], scope["path"], log.report()
+                    )
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_log.reset(token)
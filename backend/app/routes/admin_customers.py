@@ -1,8 +1,11 @@
 import json
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 
+from .. import serialization
+from ..config import settings
+from ..contacts import normalize_email, normalize_list, normalize_phone, search_customer_ids, sync_contacts
 from ..db import get_db
 from ..models import Customer
 from ..schemas import CustomerCreate, CustomerRead, CustomerUpdate
@@ -32,31 +35,80 @@ def _as_read_model(customer: Customer) -> CustomerRead:
     )
 
 
+def _normalize_contacts(data: dict, customer: Optional[Customer] = None) -> dict:
+    """Canonical phones and emails for the contact fields present in ``data``."""
+    if "phone" in data:
+        data["phone"] = normalize_phone(data["phone"])
+    if "email" in data:
+        data["email"] = normalize_email(data["email"])
+    phone = data.get("phone", customer.phone if customer else None)
+    email = data.get("email", customer.email if customer else None)
+    if data.get("additional_phones") is not None:
+        data["additional_phones"] = json.dumps(normalize_list(data["additional_phones"], normalize_phone, phone))
+    if data.get("additional_emails") is not None:
+        data["additional_emails"] = json.dumps(normalize_list(data["additional_emails"], normalize_email, email))
+    return data
+
+
+def _ensure_phone_free(db: Session, phone: str, customer_id: Optional[int] = None) -> None:
+    query = db.query(Customer.id).filter(Customer.phone == phone)
+    if customer_id is not None:
+        query = query.filter(Customer.id != customer_id)
+    if query.first():
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Customer with this phone already exists")
+
+
+def _page(db: Session, response: Response, ids: List[int], limit: int) -> List[CustomerRead]:
+    if len(ids) > limit:
+        ids = ids[:limit]
+        response.headers["X-Next-Cursor"] = str(ids[-1])
+    if settings.FAST_SERIALIZATION:
+        rows = {row.id: row for row in db.query(*serialization.CUSTOMER.columns).filter(Customer.id.in_(ids))}
+        return serialization.json_response(serialization.customers(rows[i] for i in ids), response.headers)
+    customers = {customer.id: customer for customer in db.query(Customer).filter(Customer.id.in_(ids))}
+    return [_as_read_model(customers[customer_id]) for customer_id in ids]
+
+
 @router.get("/", response_model=List[CustomerRead])
-def list_customers(db: Session = Depends(get_db)):
-    customers = db.query(Customer).order_by(Customer.created_at.desc()).all()
-    return [_as_read_model(customer) for customer in customers]
+def list_customers(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[int] = Query(None, description="X-Next-Cursor of the previous page"),
+    db: Session = Depends(get_db),
+):
+    """List customers newest first, one page at a time (see ``X-Next-Cursor``)."""
+    query = db.query(Customer.id)
+    if cursor is not None:
+        query = query.filter(Customer.id < cursor)
+    ids = [customer_id for (customer_id,) in query.order_by(Customer.id.desc()).limit(limit + 1)]
+    return _page(db, response, ids, limit)
+
+
+@router.get("/search", response_model=List[CustomerRead])
+def search_customers(
+    response: Response,
+    q: str = Query(..., min_length=1, description="Prefix of a name word, phone number or email"),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[int] = Query(None, description="X-Next-Cursor of the previous page"),
+    db: Session = Depends(get_db),
+):
+    """
+    Find customers by prefix of any phone (primary or additional, in any
+    format), email, or word of their name, newest first. Several words must
+    all match, so "mar lop" finds Maria Lopez.
+    """
+    ids = search_customer_ids(db, q, limit + 1, before_id=cursor)
+    return _page(db, response, ids, limit)
 
 
 @router.post("/", response_model=CustomerRead, status_code=status.HTTP_201_CREATED)
 def create_customer(payload: CustomerCreate, db: Session = Depends(get_db)):
-    existing = db.query(Customer).filter(Customer.phone == payload.phone).first()
-    if existing:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Customer with this phone already exists")
+    data = _normalize_contacts(payload.dict())
+    _ensure_phone_free(db, data["phone"])
 
-    customer = Customer(
-        name=payload.name,
-        phone=payload.phone,
-        email=payload.email,
-        address=payload.address,
-        city=payload.city,
-        zip_code=payload.zip_code,
-        additional_phones=json.dumps(payload.additional_phones),
-        additional_emails=json.dumps(payload.additional_emails),
-        sms_opt_in=payload.sms_opt_in,
-        email_opt_in=payload.email_opt_in,
-    )
+    customer = Customer(**data)
     db.add(customer)
+    sync_contacts(db, customer)
     db.commit()
     db.refresh(customer)
     return _as_read_model(customer)
@@ -68,15 +120,14 @@ def update_customer(customer_id: int, payload: CustomerUpdate, db: Session = Dep
     if not customer:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Customer not found")
 
-    data = payload.dict(exclude_unset=True)
-    if "additional_phones" in data:
-        data["additional_phones"] = json.dumps(data["additional_phones"])
-    if "additional_emails" in data:
-        data["additional_emails"] = json.dumps(data["additional_emails"])
+    data = _normalize_contacts(payload.dict(exclude_unset=True), customer)
+    if "phone" in data:
+        _ensure_phone_free(db, data["phone"], customer.id)
 
     for field, value in data.items():
         setattr(customer, field, value)
 
+    sync_contacts(db, customer)
     db.commit()
     db.refresh(customer)
     return _as_read_model(customer)
@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends, Query
+
+from ..db import pool_status
+from ..schemas import DbPoolStatus
+from ..security import require_admin
+
+router = APIRouter(
+    prefix="/api/admin/db",
+    tags=["Admin Database"],
+    dependencies=[Depends(require_admin)],
+)
+
+
+@router.get("/pool", response_model=DbPoolStatus)
+def get_pool_status(engine: str = Query("sync", pattern="^(sync|async)$")):
+    """Report live connection pool usage and checkout wait times."""
+    return pool_status(use_async=engine == "async")
@@ -1,7 +1,10 @@
 from typing import List
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 
+from .. import serialization
+from ..cache import PUBLIC_MENU_KEY, public_cache
+from ..config import settings
 from ..db import get_db
 from ..models import MenuWeek
 from ..schemas import MenuWeekCreate, MenuWeekRead
@@ -17,7 +20,10 @@ router = APIRouter(
 @router.get("/", response_model=List[MenuWeekRead])
 def get_admin_menu(db: Session = Depends(get_db)):
     """Retrieve all menu weeks and items for admin."""
-    return db.query(MenuWeek).order_by(MenuWeek.starts_at.desc()).all()
+    if settings.FAST_SERIALIZATION:
+        rows = db.query(*serialization.MENU_WEEK.columns).order_by(MenuWeek.starts_at.desc())
+        return serialization.json_response(serialization.menu_weeks(db, rows))
+    return db.query(MenuWeek).options(selectinload(MenuWeek.items)).order_by(MenuWeek.starts_at.desc()).all()
 
 
 @router.post("/week", response_model=MenuWeekRead)
@@ -28,5 +34,6 @@ def upsert_menu_week(payload: MenuWeekCreate, db: Session = Depends(get_db)):
     week = MenuWeek(**payload.dict())
     db.add(week)
     db.commit()
+    public_cache.invalidate(PUBLIC_MENU_KEY)
     db.refresh(week)
     return week
@@ -1,11 +1,16 @@
+import json
+from collections import defaultdict
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
 
+from .. import photos
+from ..cache import PUBLIC_MENU_KEY, public_cache
 from ..db import get_db
-from ..models import MenuItem
-from ..schemas import MenuItemCreate, MenuItemRead, MenuItemUpdate
+from ..models import MenuItem, MenuWeek
+from ..schemas import MenuItemCreate, MenuItemRead, MenuItemUpdate, MenuItemUpsert
 from ..security import require_admin
 
 router = APIRouter(
@@ -29,10 +34,63 @@ def create_admin_menu_item(
     item = MenuItem(**payload.dict())
     db.add(item)
     db.commit()
+    public_cache.invalidate(PUBLIC_MENU_KEY)
     db.refresh(item)
     return item
 
 
+@router.post("/bulk", response_model=List[MenuItemRead])
+def bulk_upsert_admin_menu_items(payload: List[MenuItemUpsert], db: Session = Depends(get_db)):
+    """
+    Create (no ``id``) or update (with ``id``) many menu items in one
+    transaction. An update sends only the fields it changes, as PATCH does; a
+    new item needs ``menu_week_id``, ``name`` and ``price_cents``. Nothing is
+    written unless every item is valid. Returns the items in request order.
+    """
+    updates = [item.dict(exclude_unset=True) for item in payload if item.id is not None]
+    inserts = [
+        MenuItemCreate(**item.dict(exclude_unset=True, exclude={"id"})).dict() for item in payload if item.id is None
+    ]
+
+    update_ids = [row["id"] for row in updates]
+    if len(set(update_ids)) != len(update_ids):
+        raise HTTPException(status_code=400, detail="Each MenuItem id may appear only once")
+    photo_urls = dict(db.query(MenuItem.id, MenuItem.photo_url).filter(MenuItem.id.in_(update_ids)))
+    missing = [item_id for item_id in update_ids if item_id not in photo_urls]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"MenuItem {missing[0]} not found")
+    week_ids = {item.menu_week_id for item in payload if item.menu_week_id is not None}
+    weeks = {week_id for (week_id,) in db.query(MenuWeek.id).filter(MenuWeek.id.in_(week_ids))}
+    missing = sorted(week_ids - weeks)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"MenuWeek {missing[0]} not found")
+
+    # One executemany per set of columns written.
+    batches = defaultdict(list)
+    for row in updates:
+        if "photo_url" in row and row["photo_url"] != photo_urls[row["id"]]:
+            # The variants belonged to the uploaded photo being replaced.
+            row["photo_variants"] = None
+        batches[tuple(sorted(row))].append(row)
+    for rows in batches.values():
+        db.execute(update(MenuItem), rows)
+    created_ids = []
+    if inserts:
+        # Neither database promises RETURNING rows in VALUES order;
+        # sort_by_parameter_order has SQLAlchemy match each id to its row
+        # (row at a time on SQLite).
+        created_ids = list(
+            db.execute(insert(MenuItem).returning(MenuItem.id, sort_by_parameter_order=True), inserts).scalars()
+        )
+    db.commit()
+    public_cache.invalidate(PUBLIC_MENU_KEY)
+
+    created = iter(created_ids)
+    ids = [item.id if item.id is not None else next(created) for item in payload]
+    items = {item.id: item for item in db.query(MenuItem).filter(MenuItem.id.in_(ids))}
+    return [items[item_id] for item_id in ids]
+
+
 @router.get("/weeks/{week_id}/items", response_model=List[MenuItemRead])
 def list_menu_items_by_week(week_id: int, db: Session = Depends(get_db)):
     """List items for a given week."""
@@ -48,8 +106,42 @@ def update_admin_menu_item(
     if not item:
         raise HTTPException(status_code=404, detail="MenuItem not found")
     update_data = payload.dict(exclude_unset=True)
+    if "photo_url" in update_data and update_data["photo_url"] != item.photo_url:
+        # The variants belonged to the uploaded photo being replaced.
+        item.photo_variants = None
     for field, value in update_data.items():
         setattr(item, field, value)
     db.commit()
+    public_cache.invalidate(PUBLIC_MENU_KEY)
+    db.refresh(item)
+    return item
+
+
+@router.post("/{item_id}/photo", response_model=MenuItemRead)
+def upload_admin_menu_item_photo(item_id: int, photo: UploadFile = File(...), db: Session = Depends(get_db)):
+    """
+    Upload a photo for a menu item. Resized WebP and JPEG/PNG variants are
+    stored under content-hashed names and listed in ``photo_variants``;
+    ``photo_url`` becomes the card-size fallback.
+    """
+    if not photos.uploads_enabled():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Photo uploads need PHOTO_DIR set to persistent storage",
+        )
+    item = db.query(MenuItem).get(item_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="MenuItem not found")
+    try:
+        variants = photos.create_variants(photo.file)
+    except photos.PhotoTooLarge as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
+    except photos.InvalidPhoto as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    item.photo_variants = json.dumps(variants)
+    item.photo_url = variants["card"]["fallback"]
+    db.commit()
+    public_cache.invalidate(PUBLIC_MENU_KEY)
     db.refresh(item)
     return item
@@ -1,11 +1,16 @@
+from datetime import timedelta
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, literal, select
+from sqlalchemy.orm import Session, selectinload
 
+from .. import serialization
+from ..cache import PUBLIC_MENU_KEY, public_cache
+from ..config import settings
 from ..db import get_db
-from ..models import MenuItem, MenuWeek
-from ..schemas import MenuItemRead, MenuWeekCreate, MenuWeekRead, MenuWeekUpdate
+from ..models import MenuItem, MenuWeek, WeekStatus
+from ..schemas import MenuItemRead, MenuWeekClone, MenuWeekCreate, MenuWeekRead, MenuWeekUpdate
 from ..security import require_admin
 
 router = APIRouter(
@@ -18,7 +23,10 @@ router = APIRouter(
 @router.get("/", response_model=List[MenuWeekRead])
 def list_admin_menu_weeks(db: Session = Depends(get_db)):
     """List all menu weeks, including unpublished."""
-    return db.query(MenuWeek).order_by(MenuWeek.starts_at.desc()).all()
+    if settings.FAST_SERIALIZATION:
+        rows = db.query(*serialization.MENU_WEEK.columns).order_by(MenuWeek.starts_at.desc())
+        return serialization.json_response(serialization.menu_weeks(db, rows))
+    return db.query(MenuWeek).options(selectinload(MenuWeek.items)).order_by(MenuWeek.starts_at.desc()).all()
 
 
 @router.post(
@@ -33,10 +41,44 @@ def create_admin_menu_week(
     week.is_published = payload.published
     db.add(week)
     db.commit()
+    public_cache.invalidate(PUBLIC_MENU_KEY)
     db.refresh(week)
     return week
 
 
+@router.post("/{week_id}/clone", response_model=MenuWeekRead, status_code=status.HTTP_201_CREATED)
+def clone_admin_menu_week(week_id: int, payload: MenuWeekClone, db: Session = Depends(get_db)):
+    """Create a new menu week with a copy of every item of week ``week_id``."""
+    source = db.query(MenuWeek).get(week_id)
+    if not source:
+        raise HTTPException(status_code=404, detail="MenuWeek not found")
+
+    starts_at = payload.starts_at or source.starts_at + timedelta(weeks=1)
+    week = MenuWeek(
+        selling_days=payload.selling_days or source.selling_days,
+        status=WeekStatus.OPEN,
+        published=payload.published,
+        starts_at=starts_at,
+        week_start_date=starts_at,
+        is_published=payload.published,
+    )
+    db.add(week)
+    db.flush()
+    # INSERT ... SELECT: the items never leave the database.
+    copied = ["name", "description", "photo_url", "photo_variants", "price_cents", "available"]
+    db.execute(
+        insert(MenuItem).from_select(
+            ["menu_week_id", *copied],
+            select(literal(week.id), *(getattr(MenuItem, column) for column in copied))
+            .where(MenuItem.menu_week_id == week_id)
+            .order_by(MenuItem.id),
+        )
+    )
+    db.commit()
+    public_cache.invalidate(PUBLIC_MENU_KEY)
+    return db.query(MenuWeek).options(selectinload(MenuWeek.items)).filter(MenuWeek.id == week.id).one()
+
+
 @router.patch("/{week_id}", response_model=MenuWeekRead)
 def update_admin_menu_week(
     week_id: int, payload: MenuWeekUpdate, db: Session = Depends(get_db)
@@ -56,6 +98,7 @@ def update_admin_menu_week(
         week.published = payload.published
         week.is_published = payload.published
     db.commit()
+    public_cache.invalidate(PUBLIC_MENU_KEY)
     db.refresh(week)
     return week
 
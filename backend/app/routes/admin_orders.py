@@ -1,11 +1,28 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-
-from ..db import get_db
-from ..models import Order, OrderItem, Customer
-from ..schemas import OrderCreate, OrderRead, OrderStatusUpdate, OrdersTally, OrderUpdate
+import base64
+import binascii
+import json
+from collections import Counter
+from datetime import date, datetime, time
+from typing import List, Literal, Optional, Union
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import String, or_, tuple_, type_coerce
+
+from .. import order_events, order_export, serialization, tally
+from ..config import settings
+from ..contacts import normalize_email, normalize_phone, phone_customer_ids, phone_query_digits, sync_contacts
+from ..db import SessionLocal, get_db
+from ..models import MenuItem, Order, OrderItem, Customer, OrderStatus
+from ..schemas import (
+    DeliveryInfo,
+    OrderCreate,
+    OrderRead,
+    OrderStatusUpdate,
+    OrdersTally,
+    OrderUpdate,
+    SpecialRequest,
+)
 from ..security import require_admin
 
 router = APIRouter(
@@ -16,46 +33,227 @@ router = APIRouter(
 
 
 def _upsert_customer(db: Session, order: Order):
-    customer = db.query(Customer).filter(Customer.phone == order.phone).first()
+    phone, email = normalize_phone(order.phone), normalize_email(order.email)
+    if email is not None and db.query(Customer.id).filter(Customer.email == email, Customer.phone != phone).first():
+        # Another customer's email; the order keeps it, the customer can't.
+        email = None
+    customer = db.query(Customer).filter(Customer.phone == phone).first()
     if customer:
         customer.name = order.customer_name or customer.name
-        customer.email = order.email
+        customer.email = email
         if order.delivery_address:
             customer.address = order.delivery_address
     elif order.customer_name and order.phone:
         customer = Customer(
             name=order.customer_name,
-            phone=order.phone,
-            email=order.email,
+            phone=phone,
+            email=email,
             address=order.delivery_address,
             sms_opt_in=False,
             email_opt_in=False,
         )
         db.add(customer)
-        db.flush()
     if customer:
+        sync_contacts(db, customer)
         order.customer_id = customer.id
 
 
 def _replace_items(db: Session, order: Order, items):
     db.query(OrderItem).filter(OrderItem.order_id == order.id).delete()
     db.flush()
+    menu_item_ids = {item.menu_item_id for item in items}
+    menu_items = {
+        row.id: row
+        for row in db.query(MenuItem.id, MenuItem.menu_week_id, MenuItem.name, MenuItem.price_cents).filter(
+            MenuItem.id.in_(menu_item_ids)
+        )
+    }
     subtotal = 0
     for item in items:
+        menu_item = menu_items.get(item.menu_item_id)
         created = OrderItem(
             order_id=order.id,
             menu_item_id=item.menu_item_id,
             qty=max(1, item.qty),
             line_total_cents=max(0, item.line_total_cents),
+            unit_price_cents=menu_item.price_cents if menu_item else None,
+            item_name=menu_item.name if menu_item else None,
         )
         subtotal += created.line_total_cents
         db.add(created)
+    # Tag the order with the (latest) week its items belong to.
+    if menu_item_ids:
+        order.menu_week_id = max((row.menu_week_id for row in menu_items.values()), default=None)
     return subtotal
 
 
+def _encode_cursor(order: Order) -> str:
+    raw = json.dumps([order.created_at.isoformat(), order.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, order_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def _created_at_comparable(db: Session):
+    """
+    Return the ``created_at`` expression and a converter for values compared to it.
+
+    SQLite keeps server-default timestamps as "YYYY-MM-DD HH:MM:SS" text while
+    SQLAlchemy binds datetimes with microseconds appended, so equal instants
+    would compare unequal. Compare in the stored textual form there instead.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        return type_coerce(Order.created_at, String), lambda value: value.isoformat(sep=" ")
+    return Order.created_at, lambda value: value
+
+
+def _filter_orders(
+    db: Session,
+    query,
+    week_id: Optional[int] = None,
+    order_status: Optional[OrderStatus] = None,
+    pickup_or_delivery: Optional[str] = None,
+    created_from: Optional[Union[datetime, date]] = None,
+    created_to: Optional[Union[datetime, date]] = None,
+    q: Optional[str] = None,
+):
+    """Apply the order list filters. A bare date means midnight; ``created_to`` is exclusive."""
+    created_at, as_created_at = _created_at_comparable(db)
+    if type(created_from) is date:
+        created_from = datetime.combine(created_from, time.min)
+    if type(created_to) is date:
+        created_to = datetime.combine(created_to, time.min)
+    if week_id is not None:
+        query = query.filter(Order.menu_week_id == week_id)
+    if order_status is not None:
+        query = query.filter(Order.status == order_status)
+    if pickup_or_delivery:
+        query = query.filter(Order.pickup_or_delivery == pickup_or_delivery)
+    if created_from is not None:
+        query = query.filter(created_at >= as_created_at(created_from))
+    if created_to is not None:
+        query = query.filter(created_at < as_created_at(created_to))
+    if q:
+        matches = [Order.phone.icontains(q, autoescape=True), Order.customer_name.icontains(q, autoescape=True)]
+        digits = phone_query_digits(q)
+        if digits:
+            # Phones are stored as digits; orders from before that are found
+            # through their customer's normalized contacts.
+            matches += [
+                Order.phone.contains(digits, autoescape=True),
+                Order.customer_id.in_(phone_customer_ids(db, digits)),
+            ]
+        query = query.filter(or_(*matches))
+    return query
+
+
 @router.get("/", response_model=List[OrderRead])
-def list_admin_orders(db: Session = Depends(get_db)):
-    return db.query(Order).order_by(Order.created_at.desc()).all()
+def list_admin_orders(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    week_id: Optional[int] = None,
+    order_status: Optional[OrderStatus] = Query(None, alias="status"),
+    pickup_or_delivery: Optional[str] = None,
+    created_from: Optional[Union[datetime, date]] = None,
+    created_to: Optional[Union[datetime, date]] = None,
+    q: Optional[str] = Query(None, description="Substring of the phone or customer name"),
+    db: Session = Depends(get_db),
+):
+    """
+    List orders newest first, one keyset page at a time.
+
+    When more orders remain, the ``X-Next-Cursor`` response header carries the
+    cursor for the next page.
+    """
+    created_at, as_created_at = _created_at_comparable(db)
+    fast = settings.FAST_SERIALIZATION
+    query = _filter_orders(
+        db,
+        db.query(*serialization.ORDER.columns) if fast else db.query(Order).options(selectinload(Order.items)),
+        week_id,
+        order_status,
+        pickup_or_delivery,
+        created_from,
+        created_to,
+        q,
+    )
+    if cursor:
+        cursor_created_at, cursor_id = _decode_cursor(cursor)
+        query = query.filter(tuple_(created_at, Order.id) < tuple_(as_created_at(cursor_created_at), cursor_id))
+
+    orders = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1).all()
+    if len(orders) > limit:
+        orders = orders[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(orders[-1])
+    if fast:
+        return serialization.json_response(serialization.orders(db, orders), response.headers)
+    return orders
+
+
+@router.get("/export")
+def export_orders(
+    export_format: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    per: Literal["order", "line"] = Query("order", description="One row per order, or per order line"),
+    week_id: Optional[int] = None,
+    order_status: Optional[OrderStatus] = Query(None, alias="status"),
+    pickup_or_delivery: Optional[str] = None,
+    created_from: Optional[Union[datetime, date]] = None,
+    created_to: Optional[Union[datetime, date]] = None,
+    q: Optional[str] = Query(None, description="Substring of the phone or customer name"),
+):
+    """
+    Stream the matching orders, oldest first, as CSV or NDJSON. Takes the same
+    filters as the order list, without paging. Memory use does not grow with
+    the number of orders.
+    """
+    # The stream outlives this handler (and a get_db session), so it gets its own.
+    db = SessionLocal()
+    try:
+        query = _filter_orders(
+            db,
+            order_export.export_query(),
+            week_id,
+            order_status,
+            pickup_or_delivery,
+            created_from,
+            created_to,
+            q,
+        )
+    except BaseException:
+        db.close()
+        raise
+    filename = order_export.filename(export_format, per, week_id)
+    return StreamingResponse(
+        order_export.stream(db, query, export_format, per),
+        media_type=order_export.FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/events")
+async def order_event_feed(
+    last_event_id: Optional[int] = Header(None, description="Set by EventSource when it reconnects"),
+    after: Optional[int] = Query(None, description="Resume after this event id (for clients that can't send headers)"),
+):
+    """
+    Server-Sent Events for every order created, edited, paid, deleted or
+    given a new status, as they are committed. See app.order_events.
+    """
+    resume_from = last_event_id if last_event_id is not None else after
+    return StreamingResponse(
+        order_events.stream(resume_from),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: a proxy must pass events on as they come.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/", response_model=OrderRead, status_code=status.HTTP_201_CREATED)
@@ -63,7 +261,7 @@ def create_admin_order(payload: OrderCreate, db: Session = Depends(get_db)):
     order = Order(
         customer_name=payload.customer_name,
         customer_id=payload.customer_id,
-        phone=payload.phone,
+        phone=normalize_phone(payload.phone),
         email=payload.email,
         pickup_or_delivery=payload.pickup_or_delivery,
         delivery_fee_cents=payload.delivery_fee_cents,
@@ -76,30 +274,51 @@ def create_admin_order(payload: OrderCreate, db: Session = Depends(get_db)):
     subtotal = _replace_items(db, order, payload.items)
     order.total_cents = subtotal + max(0, payload.delivery_fee_cents)
     _upsert_customer(db, order)
+    tally.record_change(db, Counter(), _contribution_after_write(db, order))
+    order_events.record(db, order_events.CREATED, order)
     db.commit()
     db.refresh(order)
     return order
 
 
-@router.patch("/{order_id}", response_model=OrderRead)
-def update_admin_order(order_id: int, payload: OrderUpdate, db: Session = Depends(get_db)):
-    order = db.query(Order).get(order_id)
+def _get_order_for_update(db: Session, order_id: int) -> Order:
+    # Row lock (Postgres) so concurrent edits see each other's tally contribution.
+    order = db.get(Order, order_id, with_for_update=True)
     if not order:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Order not found")
+    return order
+
+
+def _contribution_after_write(db: Session, order: Order):
+    # _replace_items bypasses the relationship, so reload it from the flushed rows.
+    db.flush()
+    db.expire(order, ["items"])
+    return tally.order_contribution(order)
+
+
+@router.patch("/{order_id}", response_model=OrderRead)
+def update_admin_order(order_id: int, payload: OrderUpdate, db: Session = Depends(get_db)):
+    order = _get_order_for_update(db, order_id)
+    before = tally.order_contribution(order)
+    previous_status = order.status
 
     data = payload.dict(exclude_unset=True)
     items = data.pop("items", None)
     price_adjustment_cents = data.pop("price_adjustment_cents", 0) or 0
+    if data.get("phone"):
+        data["phone"] = normalize_phone(data["phone"])
 
     for field, value in data.items():
         setattr(order, field, value)
 
     subtotal = sum(item.line_total_cents for item in order.items)
     if items is not None:
-        subtotal = _replace_items(db, order, items)
+        subtotal = _replace_items(db, order, payload.items)
 
     order.total_cents = max(0, subtotal + order.delivery_fee_cents + price_adjustment_cents)
     _upsert_customer(db, order)
+    tally.record_change(db, before, _contribution_after_write(db, order))
+    order_events.record(db, order_events.UPDATED, order, previous_status=previous_status.value)
     db.commit()
     db.refresh(order)
     return order
@@ -107,56 +326,86 @@ def update_admin_order(order_id: int, payload: OrderUpdate, db: Session = Depend
 
 @router.delete("/{order_id}")
 def delete_admin_order(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(Order).get(order_id)
-    if not order:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Order not found")
+    order = _get_order_for_update(db, order_id)
+    tally.record_change(db, tally.order_contribution(order), Counter())
+    order_events.record(db, order_events.DELETED, order)
     db.delete(order)
     db.commit()
     return {"ok": True}
 
 
 @router.get("/tally", response_model=OrdersTally)
-def tally_orders(db: Session = Depends(get_db)):
-    total_orders = db.query(Order).count()
-    total_pickup_orders = db.query(Order).filter(Order.pickup_or_delivery == "pickup").count()
-    total_delivery_orders = db.query(Order).filter(Order.pickup_or_delivery == "delivery").count()
-
-    counts = (
-        db.query(OrderItem.menu_item_id, func.sum(OrderItem.qty).label("total_qty"))
-        .group_by(OrderItem.menu_item_id)
-        .all()
+def tally_orders(week_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    Running counts per menu item. Reads ``order_tallies`` only, so the cost
+    follows the menu, not the orders; the special requests and the delivery
+    list are paged separately.
+    """
+    return tally.read_tally(db, week_id)
+
+
+def _tally_page(response: Response, query, week_id: Optional[int], cursor: Optional[int], limit: int):
+    """One page, by order id, of the week's counted orders matching ``query``."""
+    query = query.filter(Order.status != OrderStatus.CANCELLED)
+    if week_id is not None:
+        query = query.filter(Order.menu_week_id == week_id)
+    if cursor is not None:
+        query = query.filter(Order.id > cursor)
+    rows = query.order_by(Order.id).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return rows
+
+
+@router.get("/tally/special-requests", response_model=List[SpecialRequest])
+def list_special_requests(
+    response: Response,
+    week_id: Optional[int] = None,
+    cursor: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db),
+):
+    """Comments of the counted orders, oldest first; ``X-Next-Cursor`` while more remain."""
+    rows = _tally_page(
+        response, db.query(Order.id, Order.comment).filter(Order.comment.isnot(None)), week_id, cursor, limit
     )
-    item_counts = [{"menu_item_id": menu_item_id, "total_qty": total_qty} for menu_item_id, total_qty in counts]
+    return [{"order_id": row.id, "comment": row.comment} for row in rows]
 
-    specials = db.query(Order.id, Order.comment).filter(Order.comment.isnot(None)).all()
-    special_requests = [{"order_id": order_id, "comment": comment} for order_id, comment in specials]
 
-    deliveries = (
-        db.query(Order.id, Order.customer_name, Order.phone, Order.delivery_address, Order.comment)
-        .filter(Order.pickup_or_delivery == "delivery")
-        .all()
+@router.get("/tally/deliveries", response_model=List[DeliveryInfo])
+def list_deliveries(
+    response: Response,
+    week_id: Optional[int] = None,
+    cursor: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db),
+):
+    """The counted delivery orders, oldest first; ``X-Next-Cursor`` while more remain."""
+    query = db.query(Order.id, Order.customer_name, Order.phone, Order.delivery_address, Order.comment).filter(
+        Order.pickup_or_delivery == "delivery"
     )
-    delivery_list = [
-        {"order_id": order_id, "name": name, "phone": phone, "address": address, "comment": comment}
-        for order_id, name, phone, address, comment in deliveries
+    rows = _tally_page(response, query, week_id, cursor, limit)
+    return [
+        {
+            "order_id": row.id,
+            "name": row.customer_name,
+            "phone": row.phone,
+            "address": row.delivery_address,
+            "comment": row.comment,
+        }
+        for row in rows
     ]
 
-    return {
-        "total_orders": total_orders,
-        "total_pickup_orders": total_pickup_orders,
-        "total_delivery_orders": total_delivery_orders,
-        "item_counts": item_counts,
-        "special_requests": special_requests,
-        "delivery_list": delivery_list,
-    }
-
 
 @router.patch("/{order_id}/status", response_model=OrderRead)
 def update_order_status(order_id: int, payload: OrderStatusUpdate, db: Session = Depends(get_db)):
-    order = db.query(Order).get(order_id)
-    if not order:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Order not found")
+    order = _get_order_for_update(db, order_id)
+    before = tally.order_contribution(order)
+    previous_status = order.status
     order.status = payload.status
+    tally.record_change(db, before, tally.order_contribution(order))
+    order_events.record(db, order_events.STATUS_CHANGED, order, previous_status=previous_status.value)
     db.commit()
     db.refresh(order)
     return order
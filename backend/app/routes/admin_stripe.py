@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from ..db import get_db
+from ..schemas import StripeInboxStatus
+from ..security import require_admin
+from ..stripe_inbox import inbox_status
+
+router = APIRouter(
+    prefix="/api/admin/stripe",
+    tags=["Admin Stripe"],
+    dependencies=[Depends(require_admin)],
+)
+
+
+@router.get("/inbox", response_model=StripeInboxStatus)
+def get_inbox_status(db: Session = Depends(get_db)):
+    """Report webhook inbox depth, failures and how far the worker is lagging."""
+    return inbox_status(db)
@@ -0,0 +1,28 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from ..boot import state as boot_state
+from ..config import settings
+from ..db import pool_status
+from ..metrics import render_prometheus
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics(authorization: Optional[str] = Header(None)):
+    """
+    Prometheus scrape endpoint. Protected by METRICS_TOKEN when it is set;
+    in production it is only mounted when it is (see Settings.metrics_exposed).
+    """
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        if not authorization or not hmac.compare_digest(authorization, expected):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    body = render_prometheus(
+        {"sync": pool_status(), "async": pool_status(use_async=True)}, startup_phases=dict(boot_state.phases)
+    )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,26 +1,34 @@
 from typing import Optional
 
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 
-from ..db import get_db
+from ..cache import PUBLIC_MENU_KEY, cached_json_response, render_json
+from ..db import get_async_db
 from ..models import MenuWeek
 from ..schemas import MenuWeekRead
 
 router = APIRouter(prefix="/api/public/menu", tags=["Public Menu"])
 
-@router.get("/", response_model=Optional[MenuWeekRead])
-def get_current_menu(db: Session = Depends(get_db)):
-    """
-    Return the most recent published MenuWeek with its active items.
-    If none is published, return null.
-    """
+
+def _render_current_menu(db: Session) -> bytes:
     week = (
         db.query(MenuWeek)
+        .options(selectinload(MenuWeek.items))
         .filter(MenuWeek.published == True)
         .order_by(MenuWeek.starts_at.desc())
         .first()
     )
-    if not week:
-        return None
-    return week
+    return render_json(MenuWeekRead.from_orm(week) if week else None)
+
+
+@router.get("/", response_model=Optional[MenuWeekRead])
+async def get_current_menu(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Return the most recent published MenuWeek with its active items.
+    If none is published, return null.
+
+    The serialized body is cached until an admin menu write invalidates it.
+    """
+    return await cached_json_response(request, PUBLIC_MENU_KEY, lambda: db.run_sync(_render_current_menu))
@@ -1,15 +1,84 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from collections import Counter
+from typing import Optional, Union
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from ..db import get_db
-from ..models import Order, OrderItem, Customer, MenuItem, OrderStatus
-from ..schemas import OrderCreate, OrderRead
+from .. import idempotency, order_events, serialization, tally
+from ..contacts import add_missing_contacts, normalize_email, normalize_phone
+from ..db import dialect_insert, get_async_db
+from ..models import Order, OrderItem, Customer, MenuItem, MenuWeek, OrderStatus
+from ..schemas import OrderCreate, OrderItemRead, OrderRead
 
 router = APIRouter(prefix="/api/public/orders", tags=["Public Orders"])
 
 
-@router.post("/", response_model=OrderRead, status_code=status.HTTP_201_CREATED)
-def create_order(payload: OrderCreate, db: Session = Depends(get_db)):
+def _resolve_menu_items(db: Session, payload: OrderCreate) -> dict:
+    """Load every ordered MenuItem in one query and check it can be ordered."""
+    requested_ids = {item.menu_item_id for item in payload.items}
+    rows = (
+        db.query(
+            MenuItem.id,
+            MenuItem.menu_week_id,
+            MenuItem.name,
+            MenuItem.price_cents,
+            MenuItem.available,
+            MenuWeek.published,
+        )
+        .join(MenuWeek, MenuItem.menu_week_id == MenuWeek.id)
+        .filter(MenuItem.id.in_(requested_ids))
+        .all()
+    )
+    menu_items = {row.id: row for row in rows}
+    for menu_item_id in requested_ids:
+        row = menu_items.get(menu_item_id)
+        if not row:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, detail=f"MenuItem {menu_item_id} not found")
+        if not row.available or not row.published:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=f"MenuItem {menu_item_id} is not available")
+    return menu_items
+
+
+def _upsert_customer_id(db: Session, payload: OrderCreate) -> int:
+    """
+    Insert the customer for this phone or return the existing one's id.
+
+    Phones are matched in canonical form, so "620-262-1073" and "6202621073"
+    are one customer. A single INSERT ... ON CONFLICT keeps two simultaneous
+    first orders from the same phone from racing on the unique
+    ``customers.phone`` constraint. The no-op update on conflict is what makes
+    RETURNING yield the existing row, whose stored name and email are indexed.
+    """
+    phone, email = normalize_phone(payload.phone), normalize_email(payload.email)
+    if email is not None:
+        holder = db.execute(select(Customer.phone).where(Customer.email == email)).scalar()
+        if holder is not None and holder != phone:
+            # Emails are unique too; the order still records the one given.
+            email = None
+    stmt = dialect_insert(db, Customer).values(
+        name=(payload.comment.split('|')[0].replace('Name:', '').strip() if payload.comment else 'Customer'),
+        phone=phone,
+        email=email,
+        sms_opt_in=True,
+        email_opt_in=bool(payload.email),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Customer.phone],
+        set_={"phone": stmt.excluded.phone},
+    ).returning(Customer.id, Customer.name, Customer.phone, Customer.email)
+    customer = db.execute(stmt).one()
+    add_missing_contacts(db, customer.id, customer.name, customer.phone, customer.email)
+    return customer.id
+
+
+def place_order(db: Session, payload: OrderCreate, idempotency_key: Optional[str] = None) -> OrderRead:
+    """
+    Validate and persist a storefront order, committing the session. With an
+    ``idempotency_key`` (already claimed in this transaction) the response is
+    stored on the key in the same commit.
+    """
     if not payload.items or len(payload.items) == 0:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Order must contain at least one item")
     # Validate delivery vs pickup
@@ -20,51 +89,87 @@ def create_order(payload: OrderCreate, db: Session = Depends(get_db)):
 
     if payload.delivery_fee_cents < 0:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="delivery_fee_cents must be non-negative")
+    if any(item_data.qty < 1 for item_data in payload.items):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Quantity must be at least 1")
 
-    customer = db.query(Customer).filter(Customer.phone == payload.phone).first()
-    if not customer:
-        customer = Customer(
-            name=(payload.comment.split('|')[0].replace('Name:', '').strip() if payload.comment else 'Customer'),
-            phone=payload.phone,
-            email=payload.email,
-            sms_opt_in=True,
-            email_opt_in=bool(payload.email),
-        )
-        db.add(customer)
-        db.flush()
+    menu_items = _resolve_menu_items(db, payload)
+    customer_id = _upsert_customer_id(db, payload)
 
+    delivery_fee_cents = payload.delivery_fee_cents if payload.pickup_or_delivery == "delivery" else 0
+    line_items = [
+        {
+            "menu_item_id": item_data.menu_item_id,
+            "qty": item_data.qty,
+            "line_total_cents": menu_items[item_data.menu_item_id].price_cents * item_data.qty,
+            "unit_price_cents": menu_items[item_data.menu_item_id].price_cents,
+            "item_name": menu_items[item_data.menu_item_id].name,
+        }
+        for item_data in payload.items
+    ]
     order = Order(
-        customer_id=customer.id if customer else payload.customer_id,
-        phone=payload.phone,
+        customer_id=customer_id,
+        menu_week_id=max(row.menu_week_id for row in menu_items.values()),
+        phone=normalize_phone(payload.phone),
         email=payload.email,
         pickup_or_delivery=payload.pickup_or_delivery,
-        delivery_fee_cents=payload.delivery_fee_cents if payload.pickup_or_delivery == "delivery" else 0,
+        delivery_fee_cents=delivery_fee_cents,
         delivery_address=payload.delivery_address,
         comment=payload.comment,
-        total_cents=0,
+        total_cents=sum(line["line_total_cents"] for line in line_items) + delivery_fee_cents,
         status=OrderStatus.PENDING,
+        items=[],
     )
     db.add(order)
     db.flush()
 
-    total = 0
-    for item_data in payload.items:
-        if item_data.qty < 1:
-            raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Quantity must be at least 1")
-        menu_item = db.query(MenuItem).get(item_data.menu_item_id)
-        if not menu_item:
-            raise HTTPException(status.HTTP_404_NOT_FOUND, detail=f"MenuItem {item_data.menu_item_id} not found")
-        line_total = menu_item.price_cents * item_data.qty
-        order_item = OrderItem(
-            order_id=order.id,
-            menu_item_id=item_data.menu_item_id,
-            qty=item_data.qty,
-            line_total_cents=line_total,
-        )
-        db.add(order_item)
-        total += line_total
+    # All line items go out as one multi-row INSERT ... RETURNING.
+    inserted = db.execute(
+        insert(OrderItem).returning(
+            OrderItem.id,
+            OrderItem.menu_item_id,
+            OrderItem.qty,
+            OrderItem.line_total_cents,
+            OrderItem.unit_price_cents,
+            OrderItem.item_name,
+        ),
+        [{"order_id": order.id, **line} for line in line_items],
+    )
 
-    order.total_cents = total + order.delivery_fee_cents
+    ordered = [(line["menu_item_id"], line["qty"]) for line in line_items]
+    after = tally.contribution(order.menu_week_id, order.status, order.pickup_or_delivery, ordered)
+    tally.record_change(db, Counter(), after)
+    order_events.record(db, order_events.CREATED, order)
+
+    # Build the response before commit so the expired instance isn't reloaded.
+    response = OrderRead.from_orm(order)
+    response.items = [OrderItemRead(**row._mapping) for row in inserted]
+    if idempotency_key is not None:
+        # Encoded as FastAPI would send it, so a replay is byte-identical.
+        idempotency.complete(db, idempotency_key, serialization.dumps(response.dict()).decode("utf-8"))
     db.commit()
-    db.refresh(order)
-    return order
+    return response
+
+
+def place_order_once(db: Session, payload: OrderCreate, idempotency_key: str) -> Union[OrderRead, Response]:
+    """``place_order``, or the stored response if the key was already used."""
+    stored = idempotency.claim(db, idempotency_key, idempotency.fingerprint(payload.json()))
+    if stored is None:
+        return place_order(db, payload, idempotency_key)
+    return Response(
+        content=stored,
+        status_code=status.HTTP_201_CREATED,
+        media_type="application/json",
+        headers={idempotency.REPLAYED_HEADER: "true"},
+    )
+
+
+@router.post("/", response_model=OrderRead, status_code=status.HTTP_201_CREATED)
+async def create_order(
+    payload: OrderCreate,
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None),
+):
+    """Send an ``Idempotency-Key`` header to make retries safe (see app.idempotency)."""
+    if idempotency_key is None:
+        return await db.run_sync(place_order, payload)
+    return await db.run_sync(place_order_once, payload, idempotency_key)
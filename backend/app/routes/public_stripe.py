@@ -1,82 +1,239 @@
 """
 Stripe Checkout Session creation and Webhook handler.
 
-POST /api/public/checkout/session  — creates a Stripe Checkout session for an order
-POST /api/public/stripe/webhook    — verifies Stripe signature and marks order as PAID
+POST /api/public/checkout/session  — creates (or reuses an open) Stripe Checkout session for an order
+POST /api/public/stripe/webhook    — verifies Stripe signature and queues the event in the inbox
 """
 import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
+from sqlalchemy import func, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from .. import stripe_inbox
 from ..config import settings
-from ..db import get_db
-from ..models import MenuItem, Order, OrderStatus, StripeWebhookEvent
+from ..db import get_async_db, get_db, utc_naive
+from ..models import MenuItem, Order, OrderItem, OrderStatus
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/public", tags=["Public Stripe"])
 
+# An open session is only handed out again if the customer still has this long to pay.
+SESSION_REUSE_MARGIN = timedelta(minutes=5)
+# A request creating a session holds the order's claim this long at most;
+# after that another request may take over. Longer than Stripe calls take.
+CHECKOUT_CLAIM_LEASE = timedelta(seconds=60)
+# How long a concurrent request waits for the claim holder's session.
+CHECKOUT_WAIT = timedelta(seconds=15)
+CHECKOUT_POLL_SECONDS = 0.2
 
-class CheckoutRequest(BaseModel):
+
+class CheckoutClaim(NamedTuple):
+    token: str
     order_id: int
+    amount_cents: int
+    line_items: list
+    superseded_session_id: Optional[str]
 
 
-@router.post("/checkout/session")
-def create_checkout_session(payload: CheckoutRequest, db: Session = Depends(get_db)):
-    if not settings.STRIPE_SECRET_KEY:
-        raise HTTPException(status_code=503, detail="Stripe is not configured on this server")
+class CheckoutRequest(BaseModel):
+    order_id: int
+
 
+def _stripe_module():
     import stripe  # imported here so the module still loads when stripe is not installed
 
     stripe.api_key = settings.STRIPE_SECRET_KEY
+    if settings.STRIPE_API_BASE:
+        # e.g. a local stripe-mock instance in development and CI.
+        stripe.api_base = settings.STRIPE_API_BASE
+    return stripe
+
+
+def _checkout_line_items(db: Session, order_id: int) -> list:
+    """
+    Build Stripe line items from the order's price snapshots in one query.
+
+    The menu join only fills in rows written before snapshots were recorded.
+    """
+    rows = (
+        db.query(
+            OrderItem.qty,
+            func.coalesce(OrderItem.item_name, MenuItem.name).label("name"),
+            func.coalesce(OrderItem.unit_price_cents, MenuItem.price_cents).label("unit_amount"),
+        )
+        .outerjoin(MenuItem, MenuItem.id == OrderItem.menu_item_id)
+        .filter(OrderItem.order_id == order_id)
+        .order_by(OrderItem.id)
+        .all()
+    )
+    return [
+        {
+            "price_data": {
+                "currency": "usd",
+                "product_data": {"name": row.name},
+                "unit_amount": row.unit_amount,
+            },
+            "quantity": row.qty,
+        }
+        for row in rows
+        if row.name is not None and row.unit_amount is not None
+    ]
+
 
-    order = db.query(Order).get(payload.order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-
-    line_items = []
-    for oi in order.items:
-        menu_item = db.query(MenuItem).get(oi.menu_item_id)
-        if menu_item:
-            line_items.append(
-                {
-                    "price_data": {
-                        "currency": "usd",
-                        "product_data": {"name": menu_item.name},
-                        "unit_amount": menu_item.price_cents,
-                    },
-                    "quantity": oi.qty,
-                }
-            )
-
-    if not line_items:
-        raise HTTPException(status_code=400, detail="No valid items found in order")
-
-    session = stripe.checkout.Session.create(
-        payment_method_types=["card"],
-        line_items=line_items,
-        mode="payment",
-        success_url=settings.STRIPE_SUCCESS_URL,
-        cancel_url=settings.STRIPE_CANCEL_URL,
-        metadata={"order_id": str(order.id)},
+def _open_session_matches(order: Order, amount_cents: int) -> bool:
+    return (
+        order.status == OrderStatus.PENDING
+        and bool(order.stripe_session_id and order.stripe_session_url)
+        and order.stripe_session_amount_cents == amount_cents
+        and order.stripe_session_expires_at is not None
+        and utc_naive(order.stripe_session_expires_at) - SESSION_REUSE_MARGIN > datetime.utcnow()
     )
 
-    order.stripe_session_id = session.id
+
+def _session_response(url: str, session_id: str) -> dict:
+    return {"url": url, "checkout_url": url, "session_id": session_id}
+
+
+def _claim_checkout(db: Session, order_id: int):
+    """
+    Find an open session to hand out again, or claim the order to create
+    one. Returns ``(response, None)`` or ``(None, claim)``.
+
+    The claim is a compare-and-set in its own short transaction: it only
+    succeeds while no fresh claim is held and the order's session is still
+    the one we read, so two requests never both create a session, and no row
+    lock outlives the statement. While another request holds the claim this
+    waits for its session, for up to CHECKOUT_WAIT.
+    """
+    deadline = time.monotonic() + CHECKOUT_WAIT.total_seconds()
+    while True:
+        order = db.get(Order, order_id, populate_existing=True)
+        if not order:
+            raise HTTPException(status_code=404, detail="Order not found")
+
+        line_items = _checkout_line_items(db, order.id)
+        if not line_items:
+            raise HTTPException(status_code=400, detail="No valid items found in order")
+        amount_cents = sum(line["price_data"]["unit_amount"] * line["quantity"] for line in line_items)
+
+        if _open_session_matches(order, amount_cents):
+            response = _session_response(order.stripe_session_url, order.stripe_session_id)
+            db.rollback()
+            return response, None
+
+        session_id = order.stripe_session_id
+        superseded = session_id if order.status == OrderStatus.PENDING else None
+        # End the read before writing; SQLite can't upgrade a read transaction
+        # another connection has written past.
+        db.rollback()
+
+        now = datetime.utcnow()
+        claim = CheckoutClaim(uuid.uuid4().hex, order_id, amount_cents, line_items, superseded)
+        unclaimed = or_(
+            Order.stripe_checkout_claim.is_(None), Order.stripe_checkout_claimed_at < now - CHECKOUT_CLAIM_LEASE
+        )
+        claimed = db.execute(
+            update(Order)
+            .where(Order.id == order_id, Order.stripe_session_id.is_not_distinct_from(session_id), unclaimed)
+            .values(stripe_checkout_claim=claim.token, stripe_checkout_claimed_at=now)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return None, claim
+
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=409, detail="Checkout is being created for this order; try again")
+        time.sleep(CHECKOUT_POLL_SECONDS)
+
+
+def _release_claim(db: Session, claim: "CheckoutClaim", **values) -> bool:
+    """Clear our claim (compare-and-set on its token), storing ``values``."""
+    result = db.execute(
+        update(Order)
+        .where(Order.id == claim.order_id, Order.stripe_checkout_claim == claim.token)
+        .values(stripe_checkout_claim=None, stripe_checkout_claimed_at=None, **values)
+    )
     db.commit()
+    return result.rowcount == 1
+
+
+@router.post("/checkout/session")
+def create_checkout_session(payload: CheckoutRequest, db: Session = Depends(get_db)):
+    """
+    Hand out the order's open Checkout Session, or create one.
 
-    return {"url": session.url, "checkout_url": session.url, "session_id": session.id}
+    No transaction is open during the calls to Stripe: a slow Stripe request
+    mustn't block webhooks and admin writes to the order or pin a pooled
+    connection.
+    """
+    if not settings.STRIPE_SECRET_KEY:
+        raise HTTPException(status_code=503, detail="Stripe is not configured on this server")
+
+    response, claim = _claim_checkout(db, payload.order_id)
+    if response is not None:
+        return response
+
+    stripe = _stripe_module()
+    try:
+        if claim.superseded_session_id:
+            # The order changed since the last session; make sure the stale one can't be paid.
+            try:
+                stripe.checkout.Session.expire(claim.superseded_session_id)
+            except stripe.error.StripeError:
+                logger.info("Could not expire superseded Checkout Session %s", claim.superseded_session_id)
+
+        session = stripe.checkout.Session.create(
+            payment_method_types=["card"],
+            line_items=claim.line_items,
+            mode="payment",
+            success_url=settings.STRIPE_SUCCESS_URL,
+            cancel_url=settings.STRIPE_CANCEL_URL,
+            metadata={"order_id": str(claim.order_id)},
+        )
+    except BaseException:
+        _release_claim(db, claim)
+        raise
+
+    expires_at = getattr(session, "expires_at", None)
+    stored = _release_claim(
+        db,
+        claim,
+        stripe_session_id=session.id,
+        stripe_session_url=session.url,
+        stripe_session_amount_cents=claim.amount_cents,
+        stripe_session_expires_at=datetime.utcfromtimestamp(expires_at) if expires_at else None,
+    )
+    if not stored:
+        # Our claim outlived its lease and another request took over; its
+        # session is the one the order keeps.
+        try:
+            stripe.checkout.Session.expire(session.id)
+        except stripe.error.StripeError:
+            logger.info("Could not expire abandoned Checkout Session %s", session.id)
+        raise HTTPException(status_code=409, detail="Checkout was restarted for this order; try again")
+    return _session_response(session.url, session.id)
 
 
 @router.post("/stripe/webhook")
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
+async def stripe_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Verify the event and record it in the webhook inbox, then acknowledge.
+
+    The order update itself is applied by the inbox worker, so Stripe gets its
+    200 as soon as the event is durably stored and retries stay cheap.
+    """
     if not settings.STRIPE_WEBHOOK_SECRET:
         raise HTTPException(status_code=503, detail="Stripe webhook secret is not configured")
 
-    import stripe
-
-    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe = _stripe_module()
 
     raw_body = await request.body()
     sig_header = request.headers.get("stripe-signature", "")
@@ -88,33 +245,17 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
     except stripe.error.SignatureVerificationError:
         raise HTTPException(status_code=400, detail="Invalid webhook signature")
 
-    event_id = event.get("id")
-    event_type = event.get("type", "")
-
-    if event_id:
-        already_processed = db.query(StripeWebhookEvent).filter(StripeWebhookEvent.event_id == event_id).first()
-        if already_processed:
-            return {"status": "ok", "idempotent": True}
+    # Attribute access works on both old (dict-based) and new StripeObject events.
+    event_id = getattr(event, "id", None)
+    if not event_id:
+        raise HTTPException(status_code=400, detail="Webhook event has no id")
 
-    if event_type == "checkout.session.completed":
-        obj = event["data"]["object"]
-        order_id_str = obj.get("metadata", {}).get("order_id")
-        session_id = obj.get("id")
-
-        order = None
-        if order_id_str:
-            order = db.query(Order).get(int(order_id_str))
-        elif session_id:
-            order = db.query(Order).filter(Order.stripe_session_id == session_id).first()
-
-        if order:
-            order.status = OrderStatus.PAID
-            order.payment_intent_id = obj.get("payment_intent")
-            if session_id:
-                order.stripe_session_id = session_id
-
-    if event_id:
-        db.add(StripeWebhookEvent(event_id=event_id, event_type=event_type))
+    inserted = await db.run_sync(
+        stripe_inbox.enqueue_event, event_id, getattr(event, "type", "") or "", raw_body.decode("utf-8")
+    )
+    await db.commit()
 
-    db.commit()
+    if not inserted:
+        return {"status": "ok", "idempotent": True}
+    stripe_inbox.worker.wake()
     return {"status": "ok"}
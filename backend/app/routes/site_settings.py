@@ -1,8 +1,10 @@
 import json
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from ..db import get_db
+from ..cache import PUBLIC_SETTINGS_KEY, cached_json_response, public_cache, render_json
+from ..db import get_async_db, get_db
 from ..models import SiteSetting
 from ..schemas import SiteSettingsRead, SiteSettingsUpdate
 from ..security import require_admin
@@ -36,8 +38,11 @@ def _get_data(db: Session):
 
 
 @router.get("/api/public/settings", response_model=SiteSettingsRead)
-def get_public_settings(db: Session = Depends(get_db)):
-    return {"data": _get_data(db)}
+async def get_public_settings(request: Request, db: AsyncSession = Depends(get_async_db)):
+    async def build():
+        return render_json({"data": await db.run_sync(_get_data)})
+
+    return await cached_json_response(request, PUBLIC_SETTINGS_KEY, build)
 
 
 @router.get("/api/admin/settings", response_model=SiteSettingsRead, dependencies=[Depends(require_admin)])
@@ -55,4 +60,5 @@ def update_admin_settings(payload: SiteSettingsUpdate, db: Session = Depends(get
     else:
         record.value_json = json.dumps(data)
     db.commit()
+    public_cache.invalidate(PUBLIC_SETTINGS_KEY)
     return {"data": data}
@@ -1,6 +1,7 @@
+import json
 from datetime import datetime
-from typing import Any, List, Optional
-from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, root_validator, validator
 import enum
 
 
@@ -33,6 +34,12 @@ class MenuItemCreate(MenuItemBase):
 class MenuItemRead(MenuItemBase):
     id: int
     created_at: datetime
+    # Resized photos by name ("thumb", "card", "full"); see app.photos.
+    photo_variants: Optional[Dict[str, Any]] = None
+
+    @validator("photo_variants", pre=True)
+    def _parse_photo_variants(cls, value):
+        return json.loads(value) if isinstance(value, str) else value
 
     class Config:
         orm_mode = True
@@ -46,6 +53,20 @@ class MenuItemUpdate(BaseModel):
     available: Optional[bool] = None
 
 
+class MenuItemUpsert(MenuItemUpdate):
+    # Set to update that item (only the fields sent); leave out to create one.
+    id: Optional[int] = None
+    menu_week_id: Optional[int] = None
+
+    @root_validator(skip_on_failure=True)
+    def _new_items_need_required_fields(cls, values):
+        if values.get("id") is None:
+            missing = [field for field in ("menu_week_id", "name", "price_cents") if values.get(field) is None]
+            if missing:
+                raise ValueError(f"a new item needs {', '.join(missing)}")
+        return values
+
+
 class MenuWeekBase(BaseModel):
     selling_days: str
     status: WeekStatus = WeekStatus.OPEN
@@ -73,6 +94,13 @@ class MenuWeekUpdate(BaseModel):
     starts_at: Optional[datetime] = None
 
 
+class MenuWeekClone(BaseModel):
+    # Defaults: one week after the source week, on the same selling days.
+    starts_at: Optional[datetime] = None
+    selling_days: Optional[str] = None
+    published: bool = False
+
+
 class CustomerBase(BaseModel):
     name: str
     phone: str
@@ -123,6 +151,8 @@ class OrderItemCreate(OrderItemBase):
 
 class OrderItemRead(OrderItemBase):
     id: int
+    unit_price_cents: Optional[int] = None
+    item_name: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -159,6 +189,7 @@ class OrderUpdate(BaseModel):
 
 class OrderRead(OrderBase):
     id: int
+    menu_week_id: Optional[int] = None
     status: OrderStatus
     stripe_session_id: Optional[str] = None
     payment_intent_id: Optional[str] = None
@@ -196,8 +227,6 @@ class OrdersTally(BaseModel):
     total_pickup_orders: int
     total_delivery_orders: int
     item_counts: List[ItemCount]
-    special_requests: List[SpecialRequest]
-    delivery_list: List[DeliveryInfo]
 
 
 class SiteSettingsRead(BaseModel):
@@ -206,3 +235,25 @@ class SiteSettingsRead(BaseModel):
 
 class SiteSettingsUpdate(BaseModel):
     data: dict[str, Any]
+
+
+class DbPoolStatus(BaseModel):
+    pool_class: str
+    size: Optional[int]
+    checked_out: Optional[int]
+    checked_in: Optional[int]
+    overflow: Optional[int]
+    max_overflow: Optional[int]
+    checkouts: int
+    checkout_timeouts: int
+    wait_seconds_total: float
+    wait_seconds_avg: float
+    wait_seconds_max: float
+
+
+class StripeInboxStatus(BaseModel):
+    pending: int
+    failed: int
+    processed: int
+    oldest_pending_age_seconds: float
+    last_processed_at: Optional[datetime]
@@ -1,8 +1,21 @@
-from datetime import datetime
+import argparse
+import csv
+import io
+import json
+import math
+import random
+import sys
+import time
+import unicodedata
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+from typing import Optional
 
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-from .models import MenuItem, MenuWeek, WeekStatus
+from .contacts import contact_values, normalize_phone
+from .models import Customer, MenuItem, MenuWeek, WeekStatus
 
 
 DEMO_MENU_ITEMS = [
@@ -52,3 +65,412 @@ def seed_demo_menu_if_empty(db: Session) -> bool:
 
     db.commit()
     return True
+
+
+# ---------------------------------------------------------------------------
+# Synthetic data generator
+#
+#   python -m app.seed generate --years 3 --orders 1000000 --seed 7
+#
+# Writes straight through the DB-API connection: COPY on Postgres (psycopg or
+# psycopg2), executemany everywhere else. The same --seed and --until always
+# produce the same rows.
+# ---------------------------------------------------------------------------
+
+EXTRA_MENU_ITEMS = [
+    ("Birria Tacos", "Slow-braised beef tacos with consommé", 14900),
+    ("Mole Poblano", "Chicken in rich mole sauce, rice", 15900),
+    ("Tamales de Rajas", "Poblano and cheese tamales (3)", 11900),
+    ("Sopa de Tortilla", "Tomato-chile broth, crispy tortilla, avocado", 9900),
+    ("Flautas de Pollo", "Crispy rolled chicken tacos, crema, queso fresco", 12500),
+    ("Camarones a la Diabla", "Shrimp in spicy red sauce, rice", 17900),
+    ("Chilaquiles Rojos", "Tortilla chips in salsa roja, eggs, crema", 11500),
+    ("Gorditas de Chicharrón", "Masa pockets with pork crackling stew", 12900),
+    ("Sopes de Tinga", "Chicken tinga on masa boats", 12500),
+    ("Pescado Veracruzano", "Fish fillet, tomato, olives, capers", 17500),
+    ("Enfrijoladas", "Tortillas in black bean sauce, cheese", 11900),
+    ("Calabacitas con Elote", "Squash and corn sauté, rice", 10900),
+    ("Menudo", "Tripe and hominy soup (weekends)", 14500),
+    ("Agua de Horchata (1L)", "Rice and cinnamon drink", 4500),
+    ("Flan Napolitano", "Vanilla custard, caramel", 5500),
+    ("Arroz con Leche", "Cinnamon rice pudding", 4900),
+]
+MENU_CATALOG = DEMO_MENU_ITEMS + EXTRA_MENU_ITEMS
+
+FIRST_NAMES = [
+    "María", "José", "Guadalupe", "Juan", "Ana", "Luis", "Carmen", "Carlos", "Rosa", "Jorge",
+    "Laura", "Miguel", "Sofía", "Pedro", "Elena", "Daniel", "Lucía", "Fernando", "Patricia", "Ricardo",
+    "Emily", "Michael", "Sarah", "David", "Jessica", "James", "Ashley", "Robert", "Jennifer", "John",
+]
+LAST_NAMES = [
+    "García", "Martínez", "Hernández", "López", "González", "Pérez", "Rodríguez", "Sánchez", "Ramírez",
+    "Cruz", "Flores", "Gómez", "Morales", "Vázquez", "Reyes", "Jiménez", "Torres", "Díaz", "Ruiz",
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Miller", "Davis", "Wilson", "Anderson", "Taylor",
+]
+CITIES = [("Austin", "787"), ("San Antonio", "782"), ("Houston", "770"), ("Dallas", "752")]
+AREA_CODES = ["512", "737", "210", "726", "713", "832", "214", "469"]
+
+ORDERS_PER_CUSTOMER = 6
+GENERATOR_BATCH_SIZE = 10000
+
+# Share of orders placed on each weekday (Mon=0) and in each hour of the day.
+# Cumulative weights, so rng.choices doesn't re-sum them for every order.
+_WEEKDAY_CUM_WEIGHTS = list(accumulate([22, 6, 24, 6, 30, 8, 4]))
+_HOUR_CUM_WEIGHTS = list(accumulate([0, 0, 0, 0, 0, 0, 1, 2, 4, 6, 8, 12, 14, 10, 6, 5, 6, 10, 12, 9, 6, 4, 2, 1]))
+_PAST_STATUSES = (["COMPLETED", "PAID", "CANCELLED", "PENDING"], list(accumulate([80, 10, 7, 3])))
+_OPEN_WEEK_STATUSES = (["PENDING", "PAID", "CONFIRMED", "CANCELLED"], list(accumulate([30, 58, 7, 5])))
+
+
+def customer_phone(n: int) -> str:
+    """Phone of generated customer ``n``, in one of the formats people actually type."""
+    area = AREA_CODES[n % len(AREA_CODES)]
+    local = f"{(n // len(AREA_CODES)) % 10_000_000:07d}"
+    style = (n * 7919) % 5
+    if style == 0:
+        return f"{area}-{local[:3]}-{local[3:]}"
+    if style == 1:
+        return f"({area}) {local[:3]}-{local[3:]}"
+    if style == 2:
+        return f"{area}{local}"
+    if style == 3:
+        return f"+1 {area} {local[:3]} {local[3:]}"
+    return f"{area}.{local[:3]}.{local[3:]}"
+
+
+def _email_local(name: str) -> str:
+    return unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode().lower()
+
+
+def customer_count_for(orders: int) -> int:
+    return max(1, orders // ORDERS_PER_CUSTOMER)
+
+
+class BulkWriter:
+    """Append rows to a table as fast as the driver allows, inside the session's transaction."""
+
+    def __init__(self, db: Session, batch_size: int = GENERATOR_BATCH_SIZE):
+        self.dbapi_connection = db.connection().connection.dbapi_connection
+        self.dialect = db.get_bind().dialect
+        self.batch_size = batch_size
+        self.rows_written = 0
+
+    def _sqlite_value(self, value):
+        if isinstance(value, datetime):
+            # The same text SQLite's CURRENT_TIMESTAMP server default produces.
+            return value.strftime("%Y-%m-%d %H:%M:%S")
+        if isinstance(value, bool):
+            return int(value)
+        return value
+
+    def write(self, table: str, columns, rows) -> int:
+        column_list = ", ".join(columns)
+        cursor = self.dbapi_connection.cursor()
+        written = 0
+        try:
+            if self.dialect.name.startswith("postgres") and hasattr(cursor, "copy"):
+                # psycopg 3
+                with cursor.copy(f"COPY {table} ({column_list}) FROM STDIN") as copy:
+                    for row in rows:
+                        copy.write_row(row)
+                        written += 1
+            elif self.dialect.name.startswith("postgres") and hasattr(cursor, "copy_expert"):
+                written = self._copy_csv(cursor, table, column_list, rows)
+            else:
+                placeholders = ", ".join(["?" if self.dialect.paramstyle == "qmark" else "%s"] * len(columns))
+                statement = f"INSERT INTO {table} ({column_list}) VALUES ({placeholders})"
+                convert = self._sqlite_value if self.dialect.name == "sqlite" else (lambda value: value)
+                batch = []
+                for row in rows:
+                    batch.append(tuple(convert(value) for value in row))
+                    if len(batch) >= self.batch_size:
+                        cursor.executemany(statement, batch)
+                        written += len(batch)
+                        batch = []
+                if batch:
+                    cursor.executemany(statement, batch)
+                    written += len(batch)
+        finally:
+            cursor.close()
+        self.rows_written += written
+        return written
+
+    def _copy_csv(self, cursor, table: str, column_list: str, rows) -> int:
+        """psycopg2: stream CSV batches through COPY ... FROM STDIN."""
+        written = 0
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        pending = 0
+        for row in rows:
+            writer.writerow(["\\N" if value is None else value for value in row])
+            pending += 1
+            if pending >= self.batch_size:
+                written += self._flush_csv(cursor, table, column_list, buffer, pending)
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                pending = 0
+        if pending:
+            written += self._flush_csv(cursor, table, column_list, buffer, pending)
+        return written
+
+    @staticmethod
+    def _flush_csv(cursor, table: str, column_list: str, buffer: io.StringIO, count: int) -> int:
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+        return count
+
+
+def _week_start(day: date) -> datetime:
+    monday = day - timedelta(days=day.weekday())
+    return datetime(monday.year, monday.month, monday.day)
+
+
+def _orders_per_week(rng: random.Random, weeks: int, orders: int) -> list:
+    """Spread ``orders`` over the weeks with steady growth, seasonality and noise."""
+    weights = []
+    for index in range(weeks):
+        growth = 0.4 + 0.6 * (index + 1) / weeks
+        season = 1 + 0.15 * math.sin(2 * math.pi * index / 52)
+        weights.append(growth * season * rng.uniform(0.85, 1.15))
+    scale = orders / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    for index in range(orders - sum(counts)):
+        counts[-1 - (index % weeks)] += 1
+    return counts
+
+
+def _require_empty(db: Session) -> None:
+    if db.query(MenuWeek.id).first() is not None or db.query(Customer.id).first() is not None:
+        raise RuntimeError("generate needs an empty database (pass --reset to drop and recreate the tables)")
+
+
+def _reset_sequences(db: Session, tables) -> None:
+    if not db.get_bind().dialect.name.startswith("postgres"):
+        return
+    for table in tables:
+        db.execute(
+            text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}")
+        )
+
+
+def generate(
+    db: Session,
+    orders: int,
+    weeks: int = 156,
+    seed: int = 1,
+    until: Optional[date] = None,
+    batch_size: int = GENERATOR_BATCH_SIZE,
+    log=None,
+) -> dict:
+    """
+    Bulk-insert ``weeks`` weekly menus ending with the week of ``until``
+    (default: today) and ``orders`` orders spread across them, with customers,
+    order items and processed Stripe webhook events. The database must be empty.
+    """
+    from . import tally
+
+    _require_empty(db)
+    rng = random.Random(seed)
+    writer = BulkWriter(db, batch_size)
+    log = log or (lambda message: None)
+    started = time.perf_counter()
+
+    def done(what: str, count: int) -> None:
+        log(f"{what}: {count} rows ({time.perf_counter() - started:.1f}s)")
+
+    last_week = _week_start(until or datetime.utcnow().date())
+    week_starts = [last_week - timedelta(weeks=weeks - 1 - index) for index in range(weeks)]
+
+    # Menu weeks and items. Prices drift up ~4%/year with a little noise.
+    week_rows, item_rows = [], []
+    items_by_week = []
+    for index, starts_at in enumerate(week_starts):
+        week_id = index + 1
+        is_current = index == weeks - 1
+        week_rows.append(
+            (week_id, "Mon,Wed,Fri", "OPEN" if is_current else "CLOSED", True, starts_at,
+             starts_at - timedelta(days=3), starts_at, True)
+        )
+        inflation = 1 + 0.04 * (index - weeks + 1) / 52
+        week_items = []
+        for name, description, base_price in rng.sample(MENU_CATALOG, rng.randint(6, 12)):
+            item_id = len(item_rows) + 1
+            price = int(round(base_price * inflation * rng.uniform(0.97, 1.03) / 50) * 50)
+            item_rows.append(
+                (item_id, week_id, name, description, None, price, rng.random() > 0.05,
+                 starts_at - timedelta(days=3))
+            )
+            week_items.append((item_id, name, price))
+        items_by_week.append(week_items)
+    done("menu_weeks", writer.write(
+        "menu_weeks",
+        ["id", "selling_days", "status", "published", "starts_at", "created_at", "week_start_date", "is_published"],
+        week_rows,
+    ))
+    done("menu_items", writer.write(
+        "menu_items",
+        ["id", "menu_week_id", "name", "description", "photo_url", "price_cents", "available", "created_at"],
+        item_rows,
+    ))
+
+    customers = customer_count_for(orders)
+    first_seen = week_starts[0]
+    # (name, email) per customer, copied onto their orders.
+    customer_details = []
+    contact_rows = []
+
+    def customer_rows():
+        for n in range(customers):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            city, zip_prefix = rng.choice(CITIES)
+            extra_phones = [normalize_phone(customer_phone(customers + n))] if rng.random() < 0.1 else []
+            extra_emails = [f"{_email_local(first)}.{n}@work.example.com"] if rng.random() < 0.05 else []
+            has_email = rng.random() < 0.6
+            email = f"{_email_local(first)}.{_email_local(last)}.{n}@example.com" if has_email else None
+            customer_details.append((f"{first} {last}", email))
+            phone = normalize_phone(customer_phone(n))
+            contact_rows.extend(
+                (n + 1, kind, value, is_primary)
+                for kind, value, is_primary in contact_values(
+                    f"{first} {last}", phone, email, extra_phones, extra_emails
+                )
+            )
+            yield (
+                n + 1, f"{first} {last}", phone, email,
+                f"{rng.randint(100, 9999)} {rng.choice(LAST_NAMES)} St" if rng.random() < 0.5 else None,
+                city, f"{zip_prefix}{rng.randint(0, 99):02d}",
+                json.dumps(extra_phones), json.dumps(extra_emails),
+                True, has_email and rng.random() < 0.5,
+                first_seen + timedelta(seconds=rng.randint(0, max(1, weeks * 7 * 86400))),
+            )
+
+    done("customers", writer.write(
+        "customers",
+        ["id", "name", "phone", "email", "address", "city", "zip_code", "additional_phones",
+         "additional_emails", "sms_opt_in", "email_opt_in", "created_at"],
+        customer_rows(),
+    ))
+    # Ids come from the table's own sequence, so it needs no reset below.
+    contacts = writer.write("customer_contacts", ["customer_id", "kind", "value", "is_primary"], contact_rows)
+    done("customer_contacts", contacts)
+    del contact_rows[:]
+
+    # Orders, their items and webhook events are generated in one pass and
+    # written in chunks so memory stays flat at millions of rows.
+    counts = _orders_per_week(rng, weeks, orders)
+    order_columns = [
+        "id", "customer_id", "menu_week_id", "customer_name", "phone", "email", "pickup_or_delivery",
+        "delivery_fee_cents", "delivery_address", "comment", "total_cents", "status", "stripe_session_id",
+        "payment_intent_id", "created_at",
+    ]
+    item_columns = ["order_id", "menu_item_id", "qty", "line_total_cents", "unit_price_cents", "item_name"]
+    event_columns = ["event_id", "event_type", "payload", "status", "attempts", "created_at", "processed_at"]
+    totals = {"orders": 0, "order_items": 0, "stripe_webhook_events": 0}
+
+    def flush(order_rows, order_item_rows, event_rows):
+        totals["orders"] += writer.write("orders", order_columns, order_rows)
+        totals["order_items"] += writer.write("order_items", item_columns, order_item_rows)
+        totals["stripe_webhook_events"] += writer.write("stripe_webhook_events", event_columns, event_rows)
+
+    order_rows, order_item_rows, event_rows = [], [], []
+    order_id = 0
+    for week_index, week_count in enumerate(counts):
+        week_id = week_index + 1
+        week_items = items_by_week[week_index]
+        statuses, status_cum_weights = _OPEN_WEEK_STATUSES if week_index == weeks - 1 else _PAST_STATUSES
+        for _ in range(week_count):
+            order_id += 1
+            # Skewed towards low ids: a core of regulars places most orders.
+            customer_n = int(customers * rng.random() ** 2.5)
+            day = rng.choices(range(7), cum_weights=_WEEKDAY_CUM_WEIGHTS)[0]
+            hour = rng.choices(range(24), cum_weights=_HOUR_CUM_WEIGHTS)[0]
+            created_at = week_starts[week_index] + timedelta(
+                days=day, hours=hour, minutes=rng.randint(0, 59), seconds=rng.randint(0, 59)
+            )
+            delivery = rng.random() < 0.35
+            fee = rng.choice([500, 700, 900]) if delivery else 0
+            subtotal = 0
+            for item_id, name, price in rng.sample(week_items, min(len(week_items), rng.choice([1, 1, 2, 2, 2, 3, 4]))):
+                qty = rng.choice([1, 1, 1, 2, 2, 3])
+                subtotal += price * qty
+                order_item_rows.append((order_id, item_id, qty, price * qty, price, name))
+            status = rng.choices(statuses, cum_weights=status_cum_weights)[0]
+            paid = status in ("PAID", "COMPLETED", "CONFIRMED")
+            session_id = f"cs_test_{order_id:010d}" if paid else None
+            name, email = customer_details[customer_n]
+            order_rows.append(
+                (order_id, customer_n + 1, week_id, name, customer_phone(customer_n), email,
+                 "delivery" if delivery else "pickup", fee, "123 Main St" if delivery else None,
+                 "Extra salsa please" if rng.random() < 0.08 else None, subtotal + fee, status, session_id,
+                 f"pi_test_{order_id:010d}" if paid else None, created_at)
+            )
+            if paid:
+                payload = {
+                    "id": f"evt_test_{order_id:010d}",
+                    "type": "checkout.session.completed",
+                    "data": {"object": {"id": session_id, "metadata": {"order_id": str(order_id)}}},
+                }
+                event_rows.append(
+                    (payload["id"], payload["type"], json.dumps(payload), "processed", 1,
+                     created_at + timedelta(seconds=30), created_at + timedelta(seconds=31))
+                )
+            if len(order_rows) >= batch_size:
+                flush(order_rows, order_item_rows, event_rows)
+                order_rows, order_item_rows, event_rows = [], [], []
+                log(f"orders: {totals['orders']}/{orders} ({time.perf_counter() - started:.1f}s)")
+    flush(order_rows, order_item_rows, event_rows)
+    done("orders", totals["orders"])
+
+    _reset_sequences(db, ["menu_weeks", "menu_items", "customers", "orders", "order_items", "stripe_webhook_events"])
+    db.commit()
+    tally.rebuild(db)
+    log(f"order_tallies rebuilt ({time.perf_counter() - started:.1f}s)")
+
+    return {
+        "menu_weeks": len(week_rows),
+        "menu_items": len(item_rows),
+        "customers": customers,
+        "customer_contacts": contacts,
+        **totals,
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+
+
+def main(argv=None) -> int:
+    from .db import SessionLocal, engine
+    from .db_migrations import reset_database, run_migrations
+
+    parser = argparse.ArgumentParser(prog="python -m app.seed", description="Seed demo or synthetic data.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("demo", help="Seed the one-week demo menu if the database has no menu data")
+    gen = sub.add_parser("generate", help="Bulk-generate deterministic synthetic history")
+    gen.add_argument("--orders", type=int, default=100000)
+    span = gen.add_mutually_exclusive_group()
+    span.add_argument("--weeks", type=int)
+    span.add_argument("--years", type=float, default=3)
+    gen.add_argument("--seed", type=int, default=1)
+    gen.add_argument("--until", type=date.fromisoformat, help="Date in the last (open) week, YYYY-MM-DD")
+    gen.add_argument("--batch-size", type=int, default=GENERATOR_BATCH_SIZE)
+    gen.add_argument("--reset", action="store_true", help="Drop and recreate all tables first")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate" and args.reset:
+        reset_database(engine)
+    run_migrations(engine)
+
+    db = SessionLocal()
+    try:
+        if args.command == "demo":
+            print("seeded" if seed_demo_menu_if_empty(db) else "skipped: menu data already present")
+            return 0
+        weeks = args.weeks or max(1, int(round(args.years * 52)))
+        summary = generate(
+            db, args.orders, weeks=weeks, seed=args.seed, until=args.until, batch_size=args.batch_size, log=print
+        )
+        print(json.dumps(summary))
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
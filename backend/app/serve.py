@@ -0,0 +1,100 @@
+"""
+Production entry point: uvicorn with one worker process per usable CPU.
+
+    python -m app.serve [--workers N] [--host 0.0.0.0] [--port 8010]
+
+The worker count is WEB_CONCURRENCY when set, otherwise the CPUs this process
+may use: its affinity mask, capped by a cgroup CPU quota (containers). Each
+worker runs the startup hook. The once-only parts are serialized across
+workers by app.boot.startup_lock.
+
+Per-process state stays per worker: the public response cache (bounded by
+PUBLIC_CACHE_TTL_SECONDS), /metrics figures and the connection pool. Size
+DB_POOL_SIZE + DB_MAX_OVERFLOW so that workers × that stays under the
+database's connection limit.
+"""
+import argparse
+import math
+import os
+import sys
+from typing import Optional
+
+from sqlalchemy.engine import make_url
+
+from .config import settings
+
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as handle:
+            return handle.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_cpu_limit() -> Optional[float]:
+    cpu_max = _read(CGROUP_V2_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    quota, period = _read(CGROUP_V1_QUOTA), _read(CGROUP_V1_PERIOD)
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def available_cpus() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        # A fractional quota (Render's free plan is 0.1 CPU) still gets a worker.
+        cpus = min(cpus, max(1, math.ceil(limit)))
+    return max(1, cpus)
+
+
+def worker_count(requested: Optional[int] = None) -> int:
+    url = make_url(settings.DB_URL)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # Each process would get its own empty in-memory database.
+        return 1
+    if settings.RESET_DB_ON_STARTUP:
+        # Every worker would reset the database the previous one just set up.
+        return 1
+    if requested:
+        return requested
+    if settings.WEB_CONCURRENCY > 0:
+        return settings.WEB_CONCURRENCY
+    return available_cpus()
+
+
+def main(argv=None) -> int:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(prog="python -m app.serve", description="Run the API with uvicorn workers.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8010")))
+    parser.add_argument("--workers", type=int, help="Defaults to WEB_CONCURRENCY, then to the usable CPUs")
+    args = parser.parse_args(argv)
+
+    workers = worker_count(args.workers)
+    print(f"Starting {workers} worker(s) on {args.host}:{args.port}", flush=True)
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Static file serving with caching headers and precompressed siblings.
+
+Starlette's StaticFiles already sends ETag and Last-Modified, answers
+conditional requests with 304 and serves byte ranges. This adds
+Cache-Control: content-hashed files (the menu photo variants, see app.photos)
+never change and are cached for a year; anything else is revalidated.
+
+Text files (SVG, CSS, JS, JSON) are compressed once, at build time::
+
+    python -m app.static_files [directory]
+
+which writes ``name.br`` and ``name.gz`` next to each of them. When the
+client accepts one of those encodings the sibling is sent as it is on disk,
+so nothing is compressed per request. Siblings older than their file are
+ignored, so an edited file is never shadowed by a stale build.
+"""
+import argparse
+import mimetypes
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from . import compression
+
+STATIC_DIR = Path(__file__).resolve().parent / "static"
+
+# "<16 hex digits>.<ext>", as written by app.photos.
+HASHED_NAME = re.compile(r"(?:^|/)[0-9a-f]{16}\.[a-z0-9]+$")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Encoding -> sibling suffix, most preferred first.
+SIBLINGS = {"br": ".br", "gzip": ".gz"}
+# A sibling has to save at least this fraction of the file to be kept.
+MIN_SAVING = 0.05
+
+
+def _media_type(path: str) -> Optional[str]:
+    return mimetypes.guess_type(path)[0]
+
+
+def _precompressed(full_path: str, stat_result, request_headers: Headers):
+    """(encoding, path, stat) of the sibling to send, or None."""
+    accept_encoding = request_headers.get("accept-encoding")
+    if not accept_encoding or "range" in request_headers:
+        # Byte ranges are served from the file itself.
+        return None
+    found = {}
+    for encoding, suffix in SIBLINGS.items():
+        try:
+            sibling_stat = os.stat(full_path + suffix)
+        except OSError:
+            continue
+        if sibling_stat.st_mtime >= stat_result.st_mtime:
+            found[encoding] = (full_path + suffix, sibling_stat)
+    encoding = compression.negotiate(accept_encoding, tuple(found))
+    return (encoding, *found[encoding]) if encoding else None
+
+
+class CachingStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        full_path = str(full_path)
+        request_headers = Headers(scope=scope)
+        headers = {"Cache-Control": IMMUTABLE if HASHED_NAME.search(full_path) else REVALIDATE}
+        media_type = _media_type(full_path)
+        if compression.compressible(media_type):
+            headers["Vary"] = "Accept-Encoding"
+            sibling = _precompressed(full_path, stat_result, request_headers)
+            if sibling is not None:
+                headers["Content-Encoding"], full_path, stat_result = sibling
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            headers=headers,
+            media_type=media_type,
+            stat_result=stat_result,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def precompress(directory: Path = STATIC_DIR, force: bool = False) -> Tuple[int, int]:
+    """
+    Write the compressed siblings of every compressible file under
+    ``directory`` that lacks them or has changed since. Brotli siblings need
+    the ``brotli`` package. Returns (files written, files up to date).
+    """
+    written = current = 0
+    encodings = compression.supported_encodings()
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            if name.startswith(".") or not compression.compressible(_media_type(path)):
+                continue
+            mtime = os.stat(path).st_mtime
+            for encoding in encodings:
+                target = path + SIBLINGS[encoding]
+                if not force and os.path.exists(target) and os.stat(target).st_mtime >= mtime:
+                    current += 1
+                    continue
+                with open(path, "rb") as handle:
+                    data = handle.read()
+                level = compression.STATIC_BROTLI_QUALITY if encoding == "br" else compression.STATIC_GZIP_LEVEL
+                compressed = compression.compress(data, encoding, level)
+                if len(compressed) > len(data) * (1 - MIN_SAVING):
+                    # Not worth a Content-Encoding; serve the file itself.
+                    if os.path.exists(target):
+                        os.unlink(target)
+                    continue
+                temporary = target + ".tmp"
+                with open(temporary, "wb") as handle:
+                    handle.write(compressed)
+                os.replace(temporary, target)
+                written += 1
+    return written, current
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.static_files",
+        description="Write .br/.gz siblings of the compressible static files.",
+    )
+    parser.add_argument("directory", nargs="?", type=Path, default=STATIC_DIR)
+    parser.add_argument("--force", action="store_true", help="Rewrite siblings that are up to date")
+    args = parser.parse_args(argv)
+
+    written, current = precompress(args.directory, force=args.force)
+    encodings = "/".join(compression.supported_encodings())
+    print(f"Precompressed ({encodings}): {written} written, {current} up to date", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Durable inbox for Stripe webhook events.
+
+The webhook route only verifies the signature and inserts the event here;
+idempotency comes from ``INSERT ... ON CONFLICT (event_id) DO NOTHING``, so
+redelivered or concurrent duplicates never reach the order tables twice.
+``InboxWorker`` drains pending events in batches on a background thread and
+applies them, retrying failures with exponential backoff.
+"""
+import json
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from . import order_events, tally
+from .config import settings
+from .db import SessionLocal, dialect_insert
+from .models import Order, OrderStatus, StripeWebhookEvent
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+PROCESSED = "processed"
+FAILED = "failed"
+
+# How long a claimed event stays invisible to other workers before it is
+# considered abandoned (e.g. the claiming process died) and retried.
+CLAIM_LEASE = timedelta(seconds=60)
+MAX_BACKOFF_SECONDS = 300
+
+
+def enqueue_event(db: Session, event_id: str, event_type: str, payload: str) -> bool:
+    """Insert a verified event; return False if it was already in the inbox."""
+    stmt = dialect_insert(db, StripeWebhookEvent).values(
+        event_id=event_id,
+        event_type=event_type,
+        payload=payload,
+        status=PENDING,
+        attempts=0,
+    )
+    result = db.execute(stmt.on_conflict_do_nothing(index_elements=[StripeWebhookEvent.event_id]))
+    return result.rowcount == 1
+
+
+def apply_event(db: Session, event_type: str, event: dict) -> None:
+    """Apply one Stripe event to the order tables (without committing)."""
+    if event_type != "checkout.session.completed":
+        return
+
+    obj = event["data"]["object"]
+    order_id_str = (obj.get("metadata") or {}).get("order_id")
+    session_id = obj.get("id")
+
+    order = None
+    if order_id_str:
+        order = db.get(Order, int(order_id_str), with_for_update=True)
+    elif session_id:
+        order = db.query(Order).filter(Order.stripe_session_id == session_id).with_for_update().first()
+
+    if order:
+        before = tally.order_contribution(order)
+        previous_status = order.status
+        order.status = OrderStatus.PAID
+        tally.record_change(db, before, tally.order_contribution(order))
+        order.payment_intent_id = obj.get("payment_intent")
+        if session_id:
+            order.stripe_session_id = session_id
+        order_events.record(db, order_events.PAID, order, previous_status=previous_status.value)
+
+
+def _due(now: datetime):
+    return and_(
+        StripeWebhookEvent.status == PENDING,
+        or_(StripeWebhookEvent.next_attempt_at.is_(None), StripeWebhookEvent.next_attempt_at <= now),
+    )
+
+
+def _claim_batch(db: Session, limit: int) -> list:
+    """Lease up to ``limit`` due events to this call and return them."""
+    now = datetime.utcnow()
+    candidates = db.query(StripeWebhookEvent.id).filter(_due(now)).order_by(StripeWebhookEvent.id).limit(limit)
+    if db.get_bind().dialect.name.startswith("postgres"):
+        candidates = candidates.with_for_update(skip_locked=True)
+    ids = [row.id for row in candidates]
+    if not ids:
+        db.rollback()
+        return []
+
+    # Re-checking _due in the UPDATE keeps two workers from claiming the same
+    # row even where SKIP LOCKED is unavailable (SQLite).
+    token = uuid.uuid4().hex
+    db.query(StripeWebhookEvent).filter(StripeWebhookEvent.id.in_(ids), _due(now)).update(
+        {"claimed_by": token, "next_attempt_at": now + CLAIM_LEASE}, synchronize_session=False
+    )
+    db.commit()
+    return (
+        db.query(StripeWebhookEvent)
+        .filter(StripeWebhookEvent.claimed_by == token)
+        .order_by(StripeWebhookEvent.id)
+        .all()
+    )
+
+
+def _finish(db: Session, event_pk: int, token: str, values: dict) -> bool:
+    """
+    Write an event's outcome if this worker still holds its lease. A worker
+    whose lease ran out mid-handler must not overwrite the status or attempts
+    of an event another worker has reclaimed since.
+    """
+    finished = (
+        db.query(StripeWebhookEvent)
+        .filter(StripeWebhookEvent.id == event_pk, StripeWebhookEvent.claimed_by == token)
+        .update({"claimed_by": None, **values}, synchronize_session=False)
+    )
+    if not finished:
+        db.rollback()
+        logger.warning("Lease on Stripe event %s expired before it finished; leaving it to its new claim", event_pk)
+        return False
+    db.commit()
+    return True
+
+
+def _record_failure(db: Session, event_pk: int, token: str, error: str) -> None:
+    event = db.get(StripeWebhookEvent, event_pk, populate_existing=True)
+    attempts = event.attempts + 1
+    values = {"attempts": attempts, "last_error": error[:2000]}
+    if attempts >= settings.STRIPE_INBOX_MAX_ATTEMPTS:
+        values["status"] = FAILED
+    else:
+        delay = min(2 ** attempts, MAX_BACKOFF_SECONDS)
+        values["next_attempt_at"] = datetime.utcnow() + timedelta(seconds=delay)
+    if _finish(db, event_pk, token, values) and attempts >= settings.STRIPE_INBOX_MAX_ATTEMPTS:
+        logger.error("Stripe event %s failed permanently after %s attempts", event.event_id, attempts)
+
+
+def drain_once(db: Session, limit: Optional[int] = None) -> int:
+    """Process one batch of due events; return how many were claimed."""
+    events = _claim_batch(db, limit or settings.STRIPE_INBOX_BATCH_SIZE)
+    for event in events:
+        event_pk, token = event.id, event.claimed_by
+        try:
+            apply_event(db, event.event_type, json.loads(event.payload or "{}"))
+            # Rolls back the order changes too when the lease was lost.
+            _finish(db, event_pk, token, {"status": PROCESSED, "processed_at": datetime.utcnow(), "last_error": None})
+        except Exception as exc:
+            db.rollback()
+            logger.exception("Failed to apply Stripe event %s", event_pk)
+            _record_failure(db, event_pk, token, repr(exc))
+    return len(events)
+
+
+def inbox_status(db: Session) -> dict:
+    """Inbox depth and lag for the admin status endpoint."""
+    counts = dict(db.query(StripeWebhookEvent.status, func.count()).group_by(StripeWebhookEvent.status).all())
+    oldest_pending = (
+        db.query(func.min(StripeWebhookEvent.created_at)).filter(StripeWebhookEvent.status == PENDING).scalar()
+    )
+    last_processed = db.query(func.max(StripeWebhookEvent.processed_at)).scalar()
+    lag = (datetime.utcnow() - oldest_pending).total_seconds() if oldest_pending else 0.0
+    return {
+        "pending": counts.get(PENDING, 0),
+        "failed": counts.get(FAILED, 0),
+        "processed": counts.get(PROCESSED, 0),
+        "oldest_pending_age_seconds": max(0.0, lag),
+        "last_processed_at": last_processed,
+    }
+
+
+class InboxWorker:
+    """Background thread that drains the inbox when woken or every poll interval."""
+
+    def __init__(self, poll_seconds: float):
+        self._poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stripe-inbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            db = SessionLocal()
+            try:
+                # Keep going while full batches come back.
+                while not self._stop.is_set() and drain_once(db) >= settings.STRIPE_INBOX_BATCH_SIZE:
+                    pass
+            except Exception:
+                logger.exception("Stripe inbox drain failed")
+            finally:
+                db.close()
+            self._wake.wait(self._poll_seconds)
+
+
+worker = InboxWorker(poll_seconds=settings.STRIPE_INBOX_POLL_SECONDS)
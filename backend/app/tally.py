@@ -0,0 +1,192 @@
+"""
+Incrementally maintained kitchen tally.
+
+Every write that can change an order's contribution to the tally (create,
+edit, status change, delete, Stripe payment) computes the contribution before
+and after the change and calls ``record_change`` in the same transaction, so
+``order_tallies`` always matches the committed orders. Cancelled orders do not
+count. Rows are kept per menu week so one week's figures are read without
+touching the others.
+
+    python -m app.tally verify    # rebuild in memory and diff against the store
+    python -m app.tally rebuild   # replace the store with a fresh rebuild
+"""
+import argparse
+import sys
+from collections import Counter
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .db import dialect_insert
+from .models import Order, OrderItem, OrderStatus, OrderTally
+
+ORDERS = "orders"
+PICKUP = "pickup"
+DELIVERY = "delivery"
+ITEM = "item"
+
+
+def contribution(
+    menu_week_id: Optional[int], status, pickup_or_delivery: str, items: Iterable[Tuple[int, int]]
+) -> Counter:
+    """Tally rows an order with these attributes adds, keyed by (week, bucket, menu_item_id)."""
+    counts = Counter()
+    if status == OrderStatus.CANCELLED:
+        return counts
+    week = menu_week_id or 0
+    counts[(week, ORDERS, 0)] += 1
+    if pickup_or_delivery in (PICKUP, DELIVERY):
+        counts[(week, pickup_or_delivery, 0)] += 1
+    for menu_item_id, qty in items:
+        counts[(week, ITEM, menu_item_id)] += qty
+    return counts
+
+
+def order_contribution(order: Order) -> Counter:
+    return contribution(
+        order.menu_week_id,
+        order.status,
+        order.pickup_or_delivery,
+        [(item.menu_item_id, item.qty) for item in order.items],
+    )
+
+
+def _upsert_increments(db: Session, counts: Counter) -> None:
+    # In key order, so concurrent writers lock shared rows in the same order
+    # and can't deadlock.
+    rows = [
+        {"menu_week_id": menu_week_id, "bucket": bucket, "menu_item_id": menu_item_id, "value": value}
+        for (menu_week_id, bucket, menu_item_id), value in sorted(counts.items())
+        if value
+    ]
+    if not rows:
+        return
+    stmt = dialect_insert(db, OrderTally)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[OrderTally.menu_week_id, OrderTally.bucket, OrderTally.menu_item_id],
+        set_={"value": OrderTally.value + stmt.excluded.value},
+    )
+    db.execute(stmt, rows)
+
+
+def record_change(db: Session, before: Counter, after: Counter) -> None:
+    """Apply the net difference between two contributions to the stored tally."""
+    delta = Counter(after)
+    delta.subtract(before)
+    _upsert_increments(db, delta)
+
+
+def read_tally(db: Session, week_id: Optional[int] = None) -> dict:
+    """
+    Read the stored tally for one week, or summed over all weeks.
+
+    A single week is a primary-key range read proportional to its menu items.
+    """
+    totals = Counter()
+    item_counts = []
+    rows = db.query(OrderTally.bucket, OrderTally.menu_item_id, func.sum(OrderTally.value))
+    if week_id is not None:
+        rows = rows.filter(OrderTally.menu_week_id == week_id)
+    rows = rows.group_by(OrderTally.bucket, OrderTally.menu_item_id).order_by(
+        OrderTally.bucket, OrderTally.menu_item_id
+    )
+    for bucket, menu_item_id, value in rows:
+        if bucket == ITEM:
+            if value:
+                item_counts.append({"menu_item_id": menu_item_id, "total_qty": value})
+        else:
+            totals[bucket] += value
+    return {
+        "total_orders": totals[ORDERS],
+        "total_pickup_orders": totals[PICKUP],
+        "total_delivery_orders": totals[DELIVERY],
+        "item_counts": item_counts,
+    }
+
+
+def compute_from_orders(db: Session) -> Counter:
+    """Recompute the tally from scratch with full scans of orders and order_items."""
+    counted = Order.status != OrderStatus.CANCELLED
+    week = func.coalesce(Order.menu_week_id, 0)
+    counts = Counter()
+    by_mode = db.query(week, Order.pickup_or_delivery, func.count(Order.id)).filter(counted).group_by(
+        week, Order.pickup_or_delivery
+    )
+    for menu_week_id, pickup_or_delivery, total in by_mode:
+        counts[(menu_week_id, ORDERS, 0)] += total
+        if pickup_or_delivery in (PICKUP, DELIVERY):
+            counts[(menu_week_id, pickup_or_delivery, 0)] += total
+    by_item = (
+        db.query(week, OrderItem.menu_item_id, func.sum(OrderItem.qty))
+        .join(Order, OrderItem.order_id == Order.id)
+        .filter(counted)
+        .group_by(week, OrderItem.menu_item_id)
+    )
+    for menu_week_id, menu_item_id, total_qty in by_item:
+        counts[(menu_week_id, ITEM, menu_item_id)] += total_qty
+    return +counts
+
+
+def stored_counts(db: Session) -> Counter:
+    rows = db.query(OrderTally.menu_week_id, OrderTally.bucket, OrderTally.menu_item_id, OrderTally.value)
+    return +Counter({(week, bucket, menu_item_id): value for week, bucket, menu_item_id, value in rows})
+
+
+def diff(stored: Counter, expected: Counter) -> list:
+    """Return (key, stored, expected) for every key where the two disagree."""
+    keys = sorted(set(stored) | set(expected))
+    return [(key, stored[key], expected[key]) for key in keys if stored[key] != expected[key]]
+
+
+def rebuild(db: Session) -> None:
+    """Replace the stored tally with one recomputed from the orders tables."""
+    if db.get_bind().dialect.name.startswith("postgres"):
+        # Block concurrent order writes so none land between the scan and the swap.
+        db.connection().exec_driver_sql("LOCK TABLE orders, order_items IN SHARE MODE")
+    expected = compute_from_orders(db)
+    db.query(OrderTally).delete(synchronize_session=False)
+    _upsert_increments(db, expected)
+    db.commit()
+
+
+def ensure_initialized(db: Session) -> None:
+    """Build the tally once for databases that had orders before it existed."""
+    if db.query(OrderTally.bucket).first() is not None:
+        return
+    if db.query(Order.id).first() is None:
+        return
+    rebuild(db)
+
+
+def main(argv=None) -> int:
+    from .db import SessionLocal
+
+    parser = argparse.ArgumentParser(prog="python -m app.tally", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            rebuild(db)
+            print("Order tally rebuilt.")
+            return 0
+
+        mismatches = diff(stored_counts(db), compute_from_orders(db))
+        if not mismatches:
+            print("Order tally OK.")
+            return 0
+        print(f"Order tally drift in {len(mismatches)} row(s):")
+        for (menu_week_id, bucket, menu_item_id), stored, expected in mismatches:
+            label = f"{bucket}[{menu_item_id}]" if bucket == ITEM else bucket
+            label = f"week {menu_week_id} {label}"
+            print(f"  {label}: stored={stored} expected={expected}")
+        return 1
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+"""
+Benchmark and load-test suite for the FoodBiz API.
+
+Run from ``backend/``::
+
+    python -m bench --scenario friday_rush --orders 100000
+
+See ``python -m bench --help`` and the "Benchmarks" section of the backend README.
+"""
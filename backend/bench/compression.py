@@ -0,0 +1,114 @@
+"""
+Bytes and time saved by response compression on representative payloads.
+
+    python -m bench.compression [--orders 20000] [--bandwidth-mbps 10]
+
+Each payload is fetched in-process with ``Accept-Encoding: identity``,
+``gzip`` and ``br``. For each one this reports the bytes on the wire, the
+median server time (which includes compressing, when it happens) and an
+estimated time to the last byte on a link of ``--bandwidth-mbps``.
+Static files are precompressed first, as the Docker build does.
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from .run import _configure_environment, _prepare_database
+
+ENCODINGS = ("identity", "gzip", "br")
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m bench.compression", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db-url", default=None, help="Database to use (default: the python -m bench SQLite file)")
+    parser.add_argument("--orders", type=int, default=20000, help="Orders to seed (default: 20000)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--repeat", type=int, default=30, help="Requests per payload and encoding (default: 30)")
+    parser.add_argument("--bandwidth-mbps", type=float, default=10.0, help="Link speed for transfer estimates")
+    return parser.parse_args(argv)
+
+
+def _payloads(week_id):
+    week = {"week_id": week_id} if week_id else {}
+    return [
+        ("public menu", "/api/public/menu/", {}),
+        ("admin orders (100)", "/api/admin/orders/", {"limit": 100}),
+        ("admin customers (500)", "/api/admin/customers/", {"limit": 500}),
+        ("order tally", "/api/admin/orders/tally", week),
+        ("special requests (500)", "/api/admin/orders/tally/special-requests", {**week, "limit": 500}),
+        ("week export (csv)", "/api/admin/orders/export", {**week, "per": "line"}),
+        ("static svg", "/static/menu_photos/placeholder.svg", {}),
+    ]
+
+
+async def _measure(client, path, params, headers, repeat):
+    timings, size = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        async with client.stream("GET", path, params=params, headers=headers) as response:
+            response.raise_for_status()
+            size = 0
+            async for chunk in response.aiter_raw():
+                size += len(chunk)
+            encoding = response.headers.get("content-encoding", "identity")
+        timings.append(time.perf_counter() - started)
+    return size, statistics.median(timings), encoding
+
+
+async def _run(args):
+    import httpx
+
+    from app.main import app
+    from app.security import create_access_token
+    from app.static_files import precompress
+
+    precompress()
+    admin = {"Authorization": f"Bearer {create_access_token({'role': 'admin'})}"}
+    results = []
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            week_id = (await client.get("/api/public/menu/")).json().get("id")
+            for label, path, params in _payloads(week_id):
+                for requested in ENCODINGS:
+                    headers = {**admin, "Accept-Encoding": requested}
+                    size, seconds, served = await _measure(client, path, params, headers, args.repeat)
+                    results.append((label, requested, served, size, seconds))
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+def _print_table(results, bandwidth_mbps: float) -> None:
+    bytes_per_second = bandwidth_mbps * 1_000_000 / 8
+    print(f"{'payload':<24}{'encoding':>9}{'bytes':>12}{'ratio':>8}{'server ms':>11}"
+          f"{'total ms':>10}{'saved ms':>10}")
+    identity = {}
+    for label, requested, served, size, seconds in results:
+        total = (seconds + size / bytes_per_second) * 1000
+        if requested == "identity":
+            identity[label] = (size, total)
+        base_size, base_total = identity[label]
+        shown = served if served == requested else f"{served}*"
+        print(f"{label:<24}{shown:>9}{size:>12,}{size / base_size:>8.2f}{seconds * 1000:>11.2f}"
+              f"{total:>10.2f}{base_total - total:>10.2f}")
+    print(f"\ntotal ms = server time + bytes at {bandwidth_mbps:g} Mbit/s. * = not the encoding asked for.")
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    if args.db_url is None:
+        args.db_url = f"sqlite:///{Path(tempfile.gettempdir()) / 'foodbiz_bench.db'}"
+    _configure_environment(args.db_url)
+    _prepare_database(args)
+    _print_table(asyncio.run(_run(args)), args.bandwidth_mbps)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
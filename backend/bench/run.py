@@ -0,0 +1,342 @@
+"""
+Drive a benchmark scenario against the API and compare it with a baseline.
+
+The app's settings are read from the environment at import time, so this
+module configures the environment first and only then imports ``app``.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+BENCH_JWT_SECRET = "bench-only-secret-" + "x" * 32
+
+# A p95 regression has to clear both the relative tolerance and this many
+# milliseconds, so sub-millisecond jitter on cached endpoints doesn't fail runs.
+MIN_REGRESSION_MS = 5.0
+ORDERS_PER_WEEK = 2000
+
+
+def _parse_args(argv):
+    from .workloads import SCENARIOS
+
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmark the FoodBiz API.")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="friday_rush")
+    parser.add_argument(
+        "--db-url",
+        default=None,
+        help="Database to benchmark (default: a SQLite file in the temp dir). "
+        "Postgres database names must contain 'bench'; their tables are dropped on reseed.",
+    )
+    parser.add_argument("--orders", type=int, default=20000, help="Orders to seed (default: 20000)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for data and workload")
+    parser.add_argument("--reseed", action="store_true", help="Recreate the data even if the order count matches")
+    parser.add_argument("--server", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (--server uvicorn)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds (default: 20)")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured warm-up seconds (default: 3)")
+    parser.add_argument("--concurrency-scale", type=float, default=1.0, help="Multiply every actor's concurrency")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95/throughput regression (0.25 = 25%%)")
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def _configure_environment(db_url: str) -> None:
+    os.environ["DB_URL"] = db_url
+    os.environ["JWT_SECRET"] = BENCH_JWT_SECRET
+    os.environ.setdefault("DEMO_MODE", "false")
+    os.environ["SEED_DEMO_DATA"] = "false"
+    os.environ["RESET_DB_ON_STARTUP"] = "false"
+    os.environ["QUERY_AUDIT"] = "false"
+    # The admin dev bypass would skip token verification and flatter the numbers.
+    os.environ.pop("NODE_ENV", None)
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+def _prepare_database(args) -> dict:
+    from sqlalchemy import func
+    from sqlalchemy.engine import make_url
+
+    from app.db import SessionLocal, engine
+    from app.db_migrations import reset_database, run_migrations
+    from app.models import Order
+    from app.seed import generate
+
+    url = make_url(args.db_url)
+    if url.get_backend_name() == "postgresql" and "bench" not in (url.database or ""):
+        raise SystemExit("Refusing to benchmark a Postgres database whose name doesn't contain 'bench'.")
+
+    run_migrations(engine)
+    db = SessionLocal()
+    try:
+        if not args.reseed and db.query(func.count(Order.id)).scalar() == args.orders:
+            print(f"Reusing existing data ({args.orders} orders)")
+            return {"orders": args.orders, "seeded": False}
+    finally:
+        db.close()
+
+    reset_database(engine)
+    run_migrations(engine)
+    db = SessionLocal()
+    try:
+        # About a busy week's worth of orders per menu week.
+        weeks = max(1, -(-args.orders // ORDERS_PER_WEEK))
+        summary = generate(db, args.orders, weeks=weeks, seed=args.seed)
+        print(f"Seeded {summary}")
+    finally:
+        db.close()
+    engine.dispose()
+    return {**summary, "seeded": True}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for_health(client, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("Server did not become healthy")
+        await asyncio.sleep(0.2)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.recording = False
+
+    def record(self, label: str, seconds: float, ok: bool) -> None:
+        if not self.recording:
+            return
+        self.latencies[label].append(seconds)
+        if not ok:
+            self.errors[label] += 1
+
+    def summary(self, duration: float) -> Dict[str, dict]:
+        result = {}
+        for label, values in sorted(self.latencies.items()):
+            values.sort()
+            result[label] = {
+                "requests": len(values),
+                "errors": self.errors.get(label, 0),
+                "rps": round(len(values) / duration, 1),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+            }
+        return result
+
+
+async def _virtual_user(client, actor, ctx, recorder: Recorder, stop_at: float, rng: random.Random) -> None:
+    from .workloads import UserState
+
+    user = UserState()
+    while time.monotonic() < stop_at:
+        operation = actor.pick(rng)
+        started = time.perf_counter()
+        try:
+            label, response = await operation(client, ctx, user)
+            ok = response.status_code < 400
+        except Exception as exc:
+            label, ok = f"{operation.__name__} ({type(exc).__name__})", False
+        recorder.record(label, time.perf_counter() - started, ok)
+        if actor.think_seconds:
+            await asyncio.sleep(actor.think_seconds * rng.uniform(0.5, 1.5))
+
+
+async def _build_context(client, seed: int, orders: int):
+    from app.security import create_access_token
+    from app.seed import customer_count_for, customer_phone
+
+    from .workloads import Context
+
+    headers = {"Authorization": f"Bearer {create_access_token({'role': 'admin'})}"}
+    menu = (await client.get("/api/public/menu/")).json() or {}
+    item_ids = [item["id"] for item in menu.get("items", []) if item.get("available", True)]
+    if not item_ids:
+        raise RuntimeError("No published menu items to order from")
+    return Context(
+        admin_headers=headers,
+        menu_item_ids=item_ids,
+        week_id=menu.get("id"),
+        customers=customer_count_for(orders),
+        customer_phone=customer_phone,
+        rng=random.Random(seed),
+    )
+
+
+async def _drive(client, args) -> Dict[str, dict]:
+    from .workloads import SCENARIOS
+
+    scenario = SCENARIOS[args.scenario]
+    ctx = await _build_context(client, args.seed, args.orders)
+    recorder = Recorder()
+    stop_at = time.monotonic() + args.warmup + args.duration
+
+    tasks = []
+    for actor in scenario.actors:
+        for n in range(max(1, round(actor.concurrency * args.concurrency_scale))):
+            rng = random.Random(f"{args.seed}-{actor.name}-{n}")
+            tasks.append(asyncio.create_task(_virtual_user(client, actor, ctx, recorder, stop_at, rng)))
+
+    await asyncio.sleep(args.warmup)
+    recorder.recording = True
+    measured_from = time.monotonic()
+    await asyncio.gather(*tasks)
+    return recorder.summary(time.monotonic() - measured_from)
+
+
+async def _run_inprocess(args) -> Dict[str, dict]:
+    import httpx
+
+    from app.main import app
+
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            return await _drive(client, args)
+    finally:
+        await app.router.shutdown()
+
+
+async def _run_uvicorn(args) -> Dict[str, dict]:
+    import httpx
+
+    port = _free_port()
+    command = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+        # Longer than any pause in the workload, so pooled client connections aren't
+        # closed under the client between requests.
+        "--timeout-keep-alive", "120",
+    ]
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=os.environ.copy())
+    try:
+        limits = httpx.Limits(max_connections=256, max_keepalive_connections=256)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+            await _wait_for_health(client)
+            return await _drive(client, args)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def _baseline_key(args) -> str:
+    from sqlalchemy.engine import make_url
+
+    return f"{args.scenario}/{make_url(args.db_url).get_backend_name()}/{args.server}"
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Return a line per regression: errors, slower p95 or lower throughput."""
+    problems = []
+    for label, stats in current.items():
+        if stats["errors"]:
+            problems.append(f"{label}: {stats['errors']} failed requests")
+        base = baseline.get(label)
+        if not base:
+            continue
+        slower_by = stats["p95_ms"] - base["p95_ms"]
+        if stats["p95_ms"] > base["p95_ms"] * (1 + tolerance) and slower_by > MIN_REGRESSION_MS:
+            problems.append(f"{label}: p95 {stats['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if stats["rps"] < base["rps"] * (1 - tolerance):
+            problems.append(f"{label}: {stats['rps']} req/s vs baseline {base['rps']} req/s")
+    return problems
+
+
+def _print_table(results: Dict[str, dict], baseline: Optional[Dict[str, dict]]) -> None:
+    header = f"{'endpoint':<42} {'req':>7} {'err':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'base p95':>9}"
+    print(header)
+    print("-" * len(header))
+    for label, stats in results.items():
+        base_p95 = (baseline or {}).get(label, {}).get("p95_ms")
+        print(
+            f"{label:<42} {stats['requests']:>7} {stats['errors']:>5} {stats['rps']:>8} "
+            f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8} "
+            f"{base_p95 if base_p95 is not None else '-':>9}"
+        )
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    if args.db_url is None:
+        args.db_url = f"sqlite:///{Path(tempfile.gettempdir()) / 'foodbiz_bench.db'}"
+    _configure_environment(args.db_url)
+
+    data = _prepare_database(args)
+    runner = _run_uvicorn if args.server == "uvicorn" else _run_inprocess
+    results = asyncio.run(runner(args))
+
+    key = _baseline_key(args)
+    baselines = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    stored = baselines.get(key)
+    comparable = stored is not None and (stored.get("orders"), stored.get("seed")) == (args.orders, args.seed)
+    if stored is not None and not comparable:
+        print(f"Baseline {key} was recorded with other data (orders/seed); not comparing.")
+
+    print(f"\n{key}: {args.orders} orders, {args.duration:.0f}s\n")
+    _print_table(results, stored["endpoints"] if comparable else None)
+
+    run = {
+        "orders": args.orders,
+        "seed": args.seed,
+        "duration_seconds": args.duration,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "endpoints": results,
+    }
+    if args.json:
+        args.json.write_text(json.dumps({key: {**run, "data": data}}, indent=2) + "\n")
+
+    if args.save_baseline:
+        baselines[key] = run
+        args.baseline.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"\nSaved baseline {key} to {args.baseline}")
+        return 0
+
+    problems = compare(results, stored["endpoints"], args.tolerance) if comparable else []
+    problems += [f"{label}: {stats['errors']} failed requests" for label, stats in results.items()
+                 if stats["errors"] and not comparable]
+    if problems:
+        print("\nREGRESSIONS:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    print("\nOK" + (" (within baseline tolerance)" if comparable else ""))
+    return 0
@@ -0,0 +1,191 @@
+"""
+Benchmark scenarios.
+
+A scenario is a set of actors. Each actor runs ``concurrency`` closed-loop
+virtual users that repeatedly pick a weighted operation, issue it and pause
+for ``think_seconds``. Operations return the endpoint label they are
+reported under.
+"""
+import random
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+@dataclass
+class Context:
+    """State shared by every virtual user in a run."""
+
+    admin_headers: Dict[str, str]
+    menu_item_ids: List[int]
+    week_id: Optional[int]
+    customers: int
+    # app.seed.customer_phone; passed in because importing app here would
+    # read settings before the runner has pointed DB_URL at the bench database.
+    customer_phone: Callable[[int], str]
+    rng: random.Random
+    menu_etag: Optional[str] = None
+    next_phone: int = 0
+
+
+@dataclass
+class UserState:
+    """Per virtual user state, e.g. the admin's place in the order list."""
+
+    cursor: Optional[str] = None
+    pages_left: int = 0
+
+
+Operation = Callable[..., Awaitable[Tuple[str, "object"]]]
+
+
+async def get_menu(client, ctx: Context, user: UserState):
+    return "GET /api/public/menu/", await client.get("/api/public/menu/")
+
+
+async def get_menu_revalidate(client, ctx: Context, user: UserState):
+    """A returning browser revalidating its cached menu (expects 304)."""
+    headers = {"If-None-Match": ctx.menu_etag} if ctx.menu_etag else {}
+    response = await client.get("/api/public/menu/", headers=headers)
+    if response.headers.get("etag"):
+        ctx.menu_etag = response.headers["etag"]
+    return "GET /api/public/menu/ (If-None-Match)", response
+
+
+async def get_settings(client, ctx: Context, user: UserState):
+    return "GET /api/public/settings", await client.get("/api/public/settings")
+
+
+async def place_order(client, ctx: Context, user: UserState):
+    ctx.next_phone += 1
+    # Mostly returning customers, some first-time phones.
+    if ctx.rng.random() < 0.7:
+        phone = ctx.customer_phone(ctx.rng.randrange(ctx.customers))
+    else:
+        phone = f"555-{ctx.next_phone:07d}"
+    chosen = ctx.rng.sample(ctx.menu_item_ids, min(len(ctx.menu_item_ids), ctx.rng.randint(1, 3)))
+    delivery = ctx.rng.random() < 0.3
+    payload = {
+        "phone": phone,
+        "pickup_or_delivery": "delivery" if delivery else "pickup",
+        "delivery_address": "123 Main St" if delivery else None,
+        "delivery_fee_cents": 500 if delivery else 0,
+        "total_cents": 0,
+        "items": [{"menu_item_id": item_id, "qty": ctx.rng.randint(1, 3), "line_total_cents": 0} for item_id in chosen],
+    }
+    return "POST /api/public/orders/", await client.post("/api/public/orders/", json=payload)
+
+
+async def list_admin_orders(client, ctx: Context, user: UserState):
+    """Page through the admin order list a few pages deep, then start over."""
+    params = {"limit": 100}
+    if user.pages_left > 0 and user.cursor:
+        params["cursor"] = user.cursor
+        label = "GET /api/admin/orders/ (next page)"
+    else:
+        user.pages_left = 3
+        label = "GET /api/admin/orders/"
+    response = await client.get("/api/admin/orders/", params=params, headers=ctx.admin_headers)
+    user.cursor = response.headers.get("x-next-cursor")
+    user.pages_left -= 1
+    return label, response
+
+
+async def list_week_orders(client, ctx: Context, user: UserState):
+    params = {"limit": 100, "week_id": ctx.week_id} if ctx.week_id else {"limit": 100}
+    response = await client.get("/api/admin/orders/", params=params, headers=ctx.admin_headers)
+    return "GET /api/admin/orders/?week_id", response
+
+
+async def search_orders(client, ctx: Context, user: UserState):
+    # The last four digits, as staff would type them from a receipt.
+    params = {"limit": 50, "q": ctx.customer_phone(ctx.rng.randrange(ctx.customers))[-4:]}
+    response = await client.get("/api/admin/orders/", params=params, headers=ctx.admin_headers)
+    return "GET /api/admin/orders/?q", response
+
+
+async def search_customers(client, ctx: Context, user: UserState):
+    # A phone typed up to the exchange, in whatever format.
+    params = {"limit": 50, "q": ctx.customer_phone(ctx.rng.randrange(ctx.customers))[:7]}
+    response = await client.get("/api/admin/customers/search", params=params, headers=ctx.admin_headers)
+    return "GET /api/admin/customers/search", response
+
+
+async def tally_orders(client, ctx: Context, user: UserState):
+    params = {"week_id": ctx.week_id} if ctx.week_id else {}
+    response = await client.get("/api/admin/orders/tally", params=params, headers=ctx.admin_headers)
+    return "GET /api/admin/orders/tally", response
+
+
+@dataclass
+class Actor:
+    name: str
+    concurrency: int
+    operations: List[Tuple[Operation, int]]
+    think_seconds: float = 0.0
+
+    def pick(self, rng: random.Random) -> Operation:
+        operations, weights = zip(*self.operations)
+        return rng.choices(operations, weights=weights)[0]
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    actors: List[Actor] = field(default_factory=list)
+
+
+SCENARIOS = {
+    "friday_rush": Scenario(
+        "friday_rush",
+        "Customers browsing and ordering flat out while two admins poll the order list and tally.",
+        [
+            Actor(
+                "customer",
+                concurrency=16,
+                operations=[(get_menu, 4), (get_menu_revalidate, 2), (get_settings, 1), (place_order, 3)],
+            ),
+            Actor(
+                "admin",
+                concurrency=2,
+                operations=[(list_admin_orders, 3), (list_week_orders, 2), (tally_orders, 2)],
+                think_seconds=0.25,
+            ),
+        ],
+    ),
+    "storefront": Scenario(
+        "storefront",
+        "Read-only storefront traffic: menu (cold and revalidated) and settings.",
+        [
+            Actor(
+                "customer",
+                concurrency=32,
+                operations=[(get_menu, 3), (get_menu_revalidate, 3), (get_settings, 1)],
+            ),
+        ],
+    ),
+    "orders": Scenario(
+        "orders",
+        "Order placement only; compare --server uvicorn runs at different --workers to see scaling.",
+        [
+            Actor("customer", concurrency=32, operations=[(place_order, 1)]),
+        ],
+    ),
+    "admin": Scenario(
+        "admin",
+        "Admin endpoints on their own: deep order list paging, week filter, order and customer search, tally.",
+        [
+            Actor(
+                "admin",
+                concurrency=4,
+                operations=[
+                    (list_admin_orders, 4),
+                    (list_week_orders, 2),
+                    (search_orders, 1),
+                    (search_customers, 1),
+                    (tally_orders, 2),
+                ],
+            ),
+        ],
+    ),
+}
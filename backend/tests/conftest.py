@@ -0,0 +1,73 @@
+"""
+Shared fixtures. The app runs in-process against a throwaway SQLite file,
+migrated by its own startup hook. Run from backend/:
+
+    pip install -r requirements-dev.txt
+    python -m pytest
+"""
+import os
+import tempfile
+
+_DB_DIR = tempfile.mkdtemp(prefix="foodbiz-tests-")
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+os.environ["NODE_ENV"] = "test"
+os.environ["JWT_SECRET"] = "test-secret-" + "x" * 32
+os.environ["STRIPE_SECRET_KEY"] = ""
+os.environ["STRIPE_WEBHOOK_SECRET"] = ""
+# Lock waits give up (and surface as 409s) in seconds rather than 15.
+os.environ["DB_STATEMENT_TIMEOUT_MS"] = "2000"
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.security import create_access_token  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def admin_headers():
+    return {"Authorization": f"Bearer {create_access_token({'role': 'admin'})}"}
+
+
+@pytest.fixture
+def menu_items(client, admin_headers):
+    """Ids of three orderable items on a new published week."""
+    week = client.post(
+        "/admin/menu/weeks/",
+        json={"selling_days": "Fri", "published": True, "starts_at": "2026-06-05T00:00:00"},
+        headers=admin_headers,
+    ).json()
+    return [
+        client.post(
+            "/admin/menu/items/",
+            json={"menu_week_id": week["id"], "name": f"Dish {n}", "price_cents": 1000 + n},
+            headers=admin_headers,
+        ).json()["id"]
+        for n in range(3)
+    ]
+
+
+def order_body(menu_item_ids, phone="5550100", qty=1):
+    return {
+        "phone": phone,
+        "comment": "Name: Test",
+        "pickup_or_delivery": "pickup",
+        "total_cents": 0,
+        "items": [{"menu_item_id": item_id, "qty": qty, "line_total_cents": 0} for item_id in menu_item_ids],
+    }
+
+
+@pytest.fixture
+def place_order(client):
+    def place(menu_item_ids, **kwargs):
+        response = client.post("/api/public/orders/", json=order_body(menu_item_ids, **kwargs))
+        assert response.status_code == 201, response.text
+        return response.json()
+
+    return place
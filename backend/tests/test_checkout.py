@@ -0,0 +1,232 @@
+"""
+Checkout session reuse and the webhook inbox, against a stubbed ``stripe``.
+
+The stub hands out a new session id on every create, so reuse is asserted on
+what was actually sent to Stripe rather than on ids a fixture server repeats.
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import settings
+from app.db import SessionLocal
+from app.models import Order, StripeWebhookEvent
+from app.routes import public_stripe
+
+
+class FakeStripe:
+    class error:
+        class StripeError(Exception):
+            pass
+
+        class SignatureVerificationError(StripeError):
+            pass
+
+    def __init__(self):
+        self.created = []
+        self.expired = []
+        # Set to a threading.Event to hold Session.create until it is set.
+        self.release = None
+        self.creating = threading.Event()
+        self.checkout = SimpleNamespace(Session=SimpleNamespace(create=self._create, expire=self._expire))
+        self.Webhook = SimpleNamespace(construct_event=self._construct_event)
+
+    def _create(self, **params):
+        self.creating.set()
+        if self.release is not None:
+            assert self.release.wait(10)
+        self.created.append(params)
+        number = len(self.created)
+        return SimpleNamespace(
+            id=f"cs_test_{number}",
+            url=f"https://checkout.stripe.test/pay/{number}",
+            expires_at=int(time.time()) + 24 * 3600,
+        )
+
+    def _expire(self, session_id):
+        self.expired.append(session_id)
+
+    @staticmethod
+    def _construct_event(payload, sig_header, secret):
+        if sig_header != "valid":
+            raise FakeStripe.error.SignatureVerificationError("bad signature")
+        event = json.loads(payload)
+        return SimpleNamespace(id=event["id"], type=event["type"])
+
+
+@pytest.fixture
+def fake_stripe(monkeypatch):
+    fake = FakeStripe()
+    monkeypatch.setattr(public_stripe, "_stripe_module", lambda: fake)
+    monkeypatch.setattr(settings, "STRIPE_SECRET_KEY", "sk_test_stub")
+    monkeypatch.setattr(settings, "STRIPE_WEBHOOK_SECRET", "whsec_stub")
+    return fake
+
+
+def checkout(client, order_id):
+    response = client.post("/api/public/checkout/session", json={"order_id": order_id})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_open_pending_session_with_same_amount_is_reused(client, fake_stripe, menu_items, place_order):
+    order = place_order(menu_items[:2])
+
+    first = checkout(client, order["id"])
+    second = checkout(client, order["id"])
+
+    assert second == first
+    assert len(fake_stripe.created) == 1
+    assert fake_stripe.expired == []
+    sent = fake_stripe.created[0]
+    assert [line["price_data"]["unit_amount"] for line in sent["line_items"]] == [1000, 1001]
+    assert sent["metadata"] == {"order_id": str(order["id"])}
+
+
+def test_changed_amount_creates_new_session_and_expires_old(
+    client, admin_headers, fake_stripe, menu_items, place_order
+):
+    order = place_order(menu_items[:1])
+    first = checkout(client, order["id"])
+
+    response = client.patch(
+        f"/api/admin/orders/{order['id']}",
+        json={"items": [{"menu_item_id": menu_items[1], "qty": 3, "line_total_cents": 3003}]},
+        headers=admin_headers,
+    )
+    assert response.status_code == 200, response.text
+    second = checkout(client, order["id"])
+
+    assert second["session_id"] != first["session_id"]
+    assert len(fake_stripe.created) == 2
+    assert fake_stripe.expired == [first["session_id"]]
+
+
+def test_session_close_to_expiry_is_replaced(client, fake_stripe, menu_items, place_order):
+    order = place_order(menu_items[:1])
+    first = checkout(client, order["id"])
+    db = SessionLocal()
+    try:
+        db.get(Order, order["id"]).stripe_session_expires_at = datetime.utcnow() + timedelta(minutes=1)
+        db.commit()
+    finally:
+        db.close()
+
+    second = checkout(client, order["id"])
+
+    assert second["session_id"] != first["session_id"]
+    assert len(fake_stripe.created) == 2
+
+
+def test_aware_session_expiry_is_compared_as_utc(client, fake_stripe, menu_items, place_order):
+    # psycopg returns aware datetimes from a TIMESTAMPTZ column.
+    order = place_order(menu_items[:1])
+    checkout(client, order["id"])
+    db = SessionLocal()
+    try:
+        stored = db.get(Order, order["id"])
+        amount = stored.stripe_session_amount_cents
+        local = timezone(timedelta(hours=-6))
+        stored.stripe_session_expires_at = (datetime.utcnow() + timedelta(hours=1)).replace(
+            tzinfo=timezone.utc
+        ).astimezone(local)
+        assert public_stripe._open_session_matches(stored, amount)
+        stored.stripe_session_expires_at = datetime.now(local) + timedelta(minutes=1)
+        assert not public_stripe._open_session_matches(stored, amount)
+    finally:
+        db.close()
+
+
+def test_concurrent_checkouts_create_one_session(client, fake_stripe, menu_items, place_order):
+    order = place_order(menu_items[:1])
+    fake_stripe.release = threading.Event()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(checkout(client, order["id"]))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert fake_stripe.creating.wait(10)
+    time.sleep(0.5)  # the others are now waiting on the claim
+    fake_stripe.release.set()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(fake_stripe.created) == 1
+    assert len(results) == 3
+    assert {result["session_id"] for result in results} == {"cs_test_1"}
+
+
+def test_order_is_not_locked_during_stripe_call(client, admin_headers, fake_stripe, menu_items, place_order):
+    order = place_order(menu_items[:1])
+    fake_stripe.release = threading.Event()
+    thread = threading.Thread(target=checkout, args=(client, order["id"]))
+    thread.start()
+    try:
+        assert fake_stripe.creating.wait(10)
+        started = time.monotonic()
+        response = client.patch(
+            f"/api/admin/orders/{order['id']}/status", json={"status": "CONFIRMED"}, headers=admin_headers
+        )
+        assert response.status_code == 200, response.text
+        assert time.monotonic() - started < 2
+    finally:
+        fake_stripe.release.set()
+        thread.join(10)
+
+
+def test_session_created_after_claim_was_taken_over_is_expired(client, fake_stripe, menu_items, place_order):
+    order = place_order(menu_items[:1])
+    fake_stripe.release = threading.Event()
+    responses = []
+    thread = threading.Thread(
+        target=lambda: responses.append(client.post("/api/public/checkout/session", json={"order_id": order["id"]}))
+    )
+    thread.start()
+    try:
+        assert fake_stripe.creating.wait(10)
+        # The lease ran out during the Stripe call and another request claimed the order.
+        db = SessionLocal()
+        try:
+            db.get(Order, order["id"]).stripe_checkout_claim = "another-request"
+            db.commit()
+        finally:
+            db.close()
+    finally:
+        fake_stripe.release.set()
+        thread.join(10)
+
+    assert responses[0].status_code == 409
+    assert fake_stripe.expired == ["cs_test_1"]
+    db = SessionLocal()
+    try:
+        stored = db.get(Order, order["id"])
+        assert stored.stripe_session_id is None
+        assert stored.stripe_checkout_claim == "another-request"
+    finally:
+        db.close()
+
+
+def test_redelivered_webhook_is_queued_once(client, fake_stripe):
+    event_id = f"evt_test_{time.time_ns()}"
+    body = json.dumps({"id": event_id, "type": "checkout.session.completed", "data": {"object": {}}})
+    headers = {"stripe-signature": "valid", "content-type": "application/json"}
+
+    first = client.post("/api/public/stripe/webhook", content=body, headers=headers)
+    second = client.post("/api/public/stripe/webhook", content=body, headers=headers)
+
+    assert first.json() == {"status": "ok"}
+    assert second.json() == {"status": "ok", "idempotent": True}
+    db = SessionLocal()
+    try:
+        assert db.query(StripeWebhookEvent).filter(StripeWebhookEvent.event_id == event_id).count() == 1
+    finally:
+        db.close()
+
+
+def test_webhook_with_bad_signature_is_rejected(client, fake_stripe):
+    body = json.dumps({"id": "evt_bad", "type": "checkout.session.completed"})
+    response = client.post("/api/public/stripe/webhook", content=body, headers={"stripe-signature": "forged"})
+    assert response.status_code == 400
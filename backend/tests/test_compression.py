@@ -0,0 +1,143 @@
+"""Accept-Encoding negotiation and CompressionMiddleware."""
+import gzip
+import zlib
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app import compression
+from app.compression import CompressionMiddleware, negotiate
+
+BIG = {"rows": [{"name": "Pozole rojo", "n": n} for n in range(200)]}
+
+
+async def big(request):
+    return JSONResponse(BIG, headers={"ETag": '"abc"'})
+
+
+async def small(request):
+    return JSONResponse({"ok": True})
+
+
+async def events(request):
+    async def feed():
+        for n in range(3):
+            yield f"id: {n}\nevent: order.created\ndata: {'x' * 2000}\n\n"
+
+    return StreamingResponse(feed(), media_type="text/event-stream")
+
+
+async def lines(request):
+    async def rows():
+        for n in range(3):
+            yield ("{\"n\": %d}\n" % n).encode() * 100
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+
+async def precompressed(request):
+    return Response(gzip.compress(b"x" * 4000), media_type="text/plain", headers={"Content-Encoding": "gzip"})
+
+
+async def png(request):
+    return Response(b"\x89PNG" + b"\0" * 4000, media_type="image/png")
+
+
+@pytest.fixture(scope="module")
+def mini_client():
+    app = Starlette(
+        routes=[
+            Route(f"/{endpoint.__name__}", endpoint)
+            for endpoint in (big, small, events, lines, precompressed, png)
+        ]
+    )
+    return TestClient(CompressionMiddleware(app, minimum_size=1024))
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("", None),
+        ("gzip", "gzip"),
+        ("gzip, br", "br"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("br;q=0, gzip;q=0", None),
+        ("*", "br"),
+        ("*;q=0.1, gzip", "gzip"),
+        ("identity", None),
+        ("gzip;q=bad, deflate", None),
+        ("GZIP", "gzip"),
+    ],
+)
+def test_negotiate(header, expected):
+    assert negotiate(header, offered=("br", "gzip")) == expected
+
+
+def test_without_brotli_only_gzip_is_offered(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression.supported_encodings() == ("gzip",)
+    assert negotiate("br, gzip;q=0.5") == "gzip"
+
+
+def get(client, path, accept_encoding):
+    # stream() leaves the body as sent, so we can check the encoding ourselves.
+    with client.stream("GET", f"/{path}", headers={"Accept-Encoding": accept_encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+
+def test_gzip_response(mini_client):
+    response, raw = get(mini_client, "big", "gzip")
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"abc"'
+    assert int(response.headers["content-length"]) == len(raw)
+    assert gzip.decompress(raw) == JSONResponse(BIG).body
+
+
+@pytest.mark.skipif(compression.brotli is None, reason="brotli is not installed")
+def test_brotli_is_preferred_when_accepted(mini_client):
+    response, raw = get(mini_client, "big", "gzip, deflate, br")
+
+    assert response.headers["content-encoding"] == "br"
+    assert compression.brotli.decompress(raw) == JSONResponse(BIG).body
+
+
+def test_streamed_body_is_compressed_chunk_by_chunk(mini_client):
+    response, raw = get(mini_client, "lines", "gzip")
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert zlib.decompress(raw, 31) == b"".join(("{\"n\": %d}\n" % n).encode() * 100 for n in range(3))
+
+
+@pytest.mark.parametrize("path", ["events", "small", "precompressed", "png"])
+def test_left_alone(mini_client, path):
+    response, raw = get(mini_client, path, "gzip, br")
+
+    assert response.headers.get("content-encoding") == ("gzip" if path == "precompressed" else None)
+    if path == "events":
+        assert raw.startswith(b"id: 0\nevent: order.created\n")
+        assert raw.count(b"\n\n") == 3
+
+
+def test_event_stream_is_not_compressible():
+    assert not compression.compressible("text/event-stream; charset=utf-8")
+    assert compression.compressible("text/csv; charset=utf-8")
+    assert not compression.compressible("image/jpeg")
+
+
+def test_app_compresses_the_export_stream(client, admin_headers, menu_items, place_order):
+    place_order(menu_items[:1], phone="5553301")
+    with client.stream(
+        "GET", "/api/admin/orders/export", headers={**admin_headers, "Accept-Encoding": "gzip"}
+    ) as response:
+        raw = b"".join(response.iter_raw())
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert zlib.decompress(raw, 31).decode().startswith("order_id,")
@@ -0,0 +1,173 @@
+"""Customer phone normalization, contact search and the explicit merge command."""
+import json
+
+import pytest
+from sqlalchemy import create_engine, select
+
+from app import contacts
+from app.db import Base, SessionLocal
+from app.db_migrations import _customer_contacts
+from app.models import Customer, CustomerContact, Order
+
+
+def search_ids(client, headers, q):
+    response = client.get("/api/admin/customers/search", params={"q": q}, headers=headers)
+    assert response.status_code == 200
+    return [customer["id"] for customer in response.json()]
+
+
+@pytest.mark.parametrize(
+    "raw", ["620-262-1073", "(620) 262-1073", "620.262.1073", "+1 620 262 1073", "16202621073", " 6202621073 "]
+)
+def test_phone_formats_normalize_to_digits(raw):
+    assert contacts.normalize_phone(raw) == "6202621073"
+
+
+def test_orders_in_any_phone_format_go_to_one_customer(client, admin_headers, menu_items, place_order):
+    first = place_order(menu_items[:1], phone="(316) 555-0142")
+    second = place_order(menu_items[:1], phone="+1 316 555 0142")
+
+    assert first["customer_id"] == second["customer_id"]
+    found = client.get("/api/admin/customers/search", params={"q": "3165550142"}, headers=admin_headers).json()
+    assert [(customer["id"], customer["phone"]) for customer in found] == [(first["customer_id"], "3165550142")]
+
+
+@pytest.mark.parametrize("q", ["316-555-01", "31655501", "(316) 555", "+1 316 555 0199"])
+def test_search_matches_phone_prefix_in_any_format(client, admin_headers, menu_items, place_order, q):
+    order = place_order(menu_items[:1], phone="316-555-0199")
+
+    assert order["customer_id"] in search_ids(client, admin_headers, q)
+
+
+def test_search_matches_name_words_and_email(client, admin_headers):
+    created = client.post(
+        "/api/admin/customers/",
+        json={"name": "María López", "phone": "913-555-0101", "email": " Maria.Lopez@Example.com "},
+        headers=admin_headers,
+    ).json()
+    assert created["email"] == "maria.lopez@example.com"
+
+    for q in ("mar lop", "lópez", "maria.lopez@"):
+        assert created["id"] in search_ids(client, admin_headers, q), q
+    assert created["id"] not in search_ids(client, admin_headers, "mar smith")
+
+
+@pytest.fixture
+def raw_duplicate(client, menu_items, place_order):
+    """A canonical customer plus one stored with the same number as typed, each with an order."""
+    canonical = place_order(menu_items[:1], phone="785-555-0177")
+    other = place_order(menu_items[:1], phone="785-555-0188")
+    db = SessionLocal()
+    try:
+        duplicate = Customer(
+            name="Old Record",
+            phone="785-555-0177",
+            email="old@example.com",
+            additional_phones=json.dumps(["785-555-0100"]),
+        )
+        db.add(duplicate)
+        db.flush()
+        contacts.sync_contacts(db, duplicate)
+        order = db.get(Order, other["id"])
+        order.customer_id = duplicate.id
+        db.commit()
+        return canonical["customer_id"], duplicate.id, order.id
+    finally:
+        db.close()
+
+
+def test_merge_is_listed_by_dry_run_then_applied(raw_duplicate, capsys):
+    survivor_id, duplicate_id, order_id = raw_duplicate
+
+    assert contacts.main(["merge", "--dry-run"]) == 0
+
+    output = capsys.readouterr().out
+    assert f"keep customer {survivor_id}" in output
+    assert f"merge customer {duplicate_id}, 1 order(s)" in output
+    assert "would merge 1 customer(s) into 1" in output
+    db = SessionLocal()
+    try:
+        assert db.get(Customer, duplicate_id) is not None
+    finally:
+        db.close()
+
+    assert contacts.main(["merge"]) == 0
+
+    assert "merged 1 customer(s) into 1" in capsys.readouterr().out
+    db = SessionLocal()
+    try:
+        assert db.get(Customer, duplicate_id) is None
+        assert db.get(Order, order_id).customer_id == survivor_id
+        survivor = db.get(Customer, survivor_id)
+        assert survivor.phone == "7855550177"
+        assert json.loads(survivor.additional_phones) == ["7855550100"]
+        assert json.loads(survivor.additional_emails) == ["old@example.com"]
+        indexed = set(
+            db.execute(select(CustomerContact.value).where(CustomerContact.customer_id == survivor_id)).scalars()
+        )
+        assert {"7855550177", "7855550100", "old@example.com"} <= indexed
+        assert contacts.phone_duplicates(db) == []
+    finally:
+        db.close()
+
+
+def test_migration_normalizes_but_never_merges(tmp_path, caplog):
+    engine = create_engine(f"sqlite:///{tmp_path / 'contacts.db'}")
+    Base.metadata.create_all(engine)
+    customers = Customer.__table__
+    with engine.begin() as conn:
+        conn.execute(
+            customers.insert(),
+            [
+                {"name": "Ana", "phone": "620-262-1073", "email": "Ana@Example.com"},
+                {"name": "Ana B", "phone": "(620) 262-1073", "email": None},
+                {"name": "Luis", "phone": "+1 316 555 0100", "email": None},
+            ],
+        )
+
+    _customer_contacts(engine, "sqlite")
+
+    with engine.connect() as conn:
+        rows = conn.execute(select(customers.c.name, customers.c.phone, customers.c.email).order_by(customers.c.id))
+        assert [tuple(row) for row in rows] == [
+            ("Ana", "6202621073", "ana@example.com"),
+            ("Ana B", "(620) 262-1073", None),
+            ("Luis", "3165550100", None),
+        ]
+        phones = conn.execute(
+            select(CustomerContact.customer_id).where(
+                CustomerContact.kind == contacts.PHONE, CustomerContact.value == "6202621073"
+            )
+        ).scalars()
+        assert sorted(phones) == [1, 2]
+    assert "python -m app.contacts merge --dry-run" in caplog.text
+    assert "2 -> 1" in caplog.text
+
+
+def order_ids(client, headers, q):
+    response = client.get("/api/admin/orders/", params={"q": q, "limit": 500}, headers=headers)
+    assert response.status_code == 200
+    return [order["id"] for order in response.json()]
+
+
+def test_order_stores_normalized_phone_and_is_found_in_any_format(client, admin_headers, menu_items, place_order):
+    order = place_order(menu_items[:1], phone="(402) 555-0123")
+
+    assert order["phone"] == "4025550123"
+    for q in ("4025550123", "402-555-0123", "+1 (402) 555-0123", "555-01"):
+        assert order["id"] in order_ids(client, admin_headers, q), q
+
+
+def test_order_with_phone_as_typed_is_found_through_its_customer(client, admin_headers, menu_items, place_order):
+    # Orders placed before phones were normalized on the order row.
+    order = place_order(menu_items[:1], phone="402-555-0177")
+    db = SessionLocal()
+    try:
+        db.get(Order, order["id"]).phone = "402-555-0177"
+        db.commit()
+    finally:
+        db.close()
+
+    assert order["id"] in order_ids(client, admin_headers, "4025550177")
+    assert order["id"] in order_ids(client, admin_headers, "402-555-0177")
+    assert order["id"] not in order_ids(client, admin_headers, "4025550199")
@@ -0,0 +1,104 @@
+"""GET /api/admin/orders/export: CSV and NDJSON, streamed in chunks."""
+import csv
+import io
+import json
+
+import pytest
+
+from app import order_export
+from app.db import SessionLocal
+
+from conftest import order_body
+
+
+@pytest.fixture(scope="module")
+def export_week(client, admin_headers):
+    """A week with five orders; the first has two lines and a comment that needs CSV quoting."""
+    week = client.post(
+        "/admin/menu/weeks/",
+        json={"selling_days": "Tue", "published": True, "starts_at": "2026-12-01T00:00:00"},
+        headers=admin_headers,
+    ).json()
+    items = [
+        client.post(
+            "/admin/menu/items/",
+            json={"menu_week_id": week["id"], "name": name, "price_cents": 700},
+            headers=admin_headers,
+        ).json()["id"]
+        for name in ("Enchiladas", "Sopa, fría")
+    ]
+    order_ids = []
+    for n in range(5):
+        body = order_body(items if n == 0 else items[:1], phone=f"555800{n}", qty=n + 1)
+        if n == 0:
+            body["comment"] = 'Name: Ana | "extra salsa", no onion'
+        response = client.post("/api/public/orders/", json=body)
+        assert response.status_code == 201
+        order_ids.append(response.json()["id"])
+    return week["id"], order_ids
+
+
+def export(client, headers, **params):
+    response = client.get("/api/admin/orders/export", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response
+
+
+def test_csv_per_order(client, admin_headers, export_week):
+    week_id, order_ids = export_week
+
+    response = export(client, admin_headers, week_id=week_id)
+
+    assert response.headers["content-type"] == "text/csv; charset=utf-8"
+    assert response.headers["content-disposition"] == f'attachment; filename="week-{week_id}.csv"'
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(row["order_id"]) for row in rows] == order_ids
+    assert rows[0]["comment"] == 'Name: Ana | "extra salsa", no onion'
+    assert rows[0]["items"] == "1x Enchiladas; 1x Sopa, fría"
+    assert rows[0]["phone"] == "5558000"
+    assert rows[0]["status"] == "PENDING"
+
+
+def test_csv_per_line(client, admin_headers, export_week):
+    week_id, order_ids = export_week
+
+    rows = list(csv.DictReader(io.StringIO(export(client, admin_headers, week_id=week_id, per="line").text)))
+
+    assert [int(row["order_id"]) for row in rows] == [order_ids[0], *order_ids]
+    assert [row["item_name"] for row in rows[:2]] == ["Enchiladas", "Sopa, fría"]
+    assert rows[2]["qty"] == "2"
+
+
+def test_ndjson_per_order(client, admin_headers, export_week):
+    week_id, order_ids = export_week
+
+    response = export(client, admin_headers, week_id=week_id, format="ndjson", q="5558003")
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [record["order_id"] for record in records] == [order_ids[3]]
+    assert records[0]["items"] == [
+        {"menu_item_id": records[0]["items"][0]["menu_item_id"], "item_name": "Enchiladas", "qty": 4,
+         "unit_price_cents": 700, "line_total_cents": 2800}
+    ]
+
+
+def test_rows_are_sent_in_chunks_and_the_session_is_closed(client, export_week, monkeypatch):
+    week_id, order_ids = export_week
+    monkeypatch.setattr(order_export, "CHUNK_ROWS", 2)
+    db = SessionLocal()
+    closed = []
+    monkeypatch.setattr(db, "close", lambda: closed.append(True))
+    query = order_export.export_query().where(order_export.Order.menu_week_id == week_id)
+
+    chunks = list(order_export.stream(db, query, "csv", "order"))
+
+    # The header goes out first, then two orders per chunk.
+    assert len(chunks) == 1 + 3
+    assert chunks[0].decode().startswith("order_id,created_at,")
+    assert [[int(row[0]) for row in csv.reader(io.StringIO(chunk.decode()))] for chunk in chunks[1:]] == [
+        order_ids[:2],
+        order_ids[2:4],
+        order_ids[4:],
+    ]
+    assert closed == [True]
@@ -0,0 +1,104 @@
+"""Idempotency-Key on POST /api/public/orders/ (app.idempotency)."""
+import threading
+import time
+
+import pytest
+
+from app import idempotency
+from app.db import SessionLocal
+from app.models import Order
+from app.schemas import OrderCreate
+
+from conftest import order_body
+
+
+def post_order(client, body, key):
+    return client.post("/api/public/orders/", json=body, headers={idempotency.HEADER: key})
+
+
+def orders_for_phone(phone):
+    db = SessionLocal()
+    try:
+        return db.query(Order).filter(Order.phone == phone).count()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def key():
+    return f"key-{time.time_ns()}"
+
+
+def test_retry_replays_the_stored_response(client, menu_items, key):
+    body = order_body(menu_items[:2], phone="5553101")
+
+    first = post_order(client, body, key)
+    retry = post_order(client, body, key)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.content == first.content
+    assert idempotency.REPLAYED_HEADER not in first.headers
+    assert retry.headers[idempotency.REPLAYED_HEADER] == "true"
+    assert orders_for_phone("5553101") == 1
+
+
+def test_key_reused_with_a_different_body_is_rejected(client, menu_items, key):
+    assert post_order(client, order_body(menu_items[:1], phone="5553102"), key).status_code == 201
+
+    response = post_order(client, order_body(menu_items[:1], phone="5553102", qty=2), key)
+
+    assert response.status_code == 422
+    assert orders_for_phone("5553102") == 1
+
+
+def test_failed_request_stores_nothing(client, menu_items, key):
+    body = order_body([999999], phone="5553103")
+    assert post_order(client, body, key).status_code == 404
+
+    body = order_body(menu_items[:1], phone="5553103")
+    assert post_order(client, body, key).status_code == 201
+
+
+def test_key_length_is_checked(client, menu_items):
+    response = post_order(client, order_body(menu_items[:1]), "k" * (idempotency.MAX_KEY_LENGTH + 1))
+    assert response.status_code == 400
+
+
+def hold_key(key, body):
+    """Claim ``key`` in an open transaction, as a request still being processed does."""
+    db = SessionLocal()
+    assert idempotency.claim(db, key, idempotency.fingerprint(OrderCreate(**body).json())) is None
+    return db
+
+
+def test_duplicate_waits_for_the_first_request_and_replays_it(client, menu_items, key):
+    body = order_body(menu_items[:1], phone="5553104")
+    holder = hold_key(key, body)
+    responses = []
+    thread = threading.Thread(target=lambda: responses.append(post_order(client, body, key)))
+    try:
+        thread.start()
+        time.sleep(0.3)
+        assert not responses  # blocked on the uncommitted key
+        idempotency.complete(holder, key, '{"id": 0, "stored": true}')
+        holder.commit()
+        thread.join(10)
+    finally:
+        holder.close()
+
+    assert responses[0].status_code == 201
+    assert responses[0].json() == {"id": 0, "stored": True}
+    assert orders_for_phone("5553104") == 0
+
+
+def test_duplicate_gives_up_with_409_while_the_first_is_still_running(client, menu_items, key):
+    body = order_body(menu_items[:1], phone="5553105")
+    holder = hold_key(key, body)
+    try:
+        response = post_order(client, body, key)
+    finally:
+        holder.rollback()
+        holder.close()
+
+    assert response.status_code == 409
+    assert orders_for_phone("5553105") == 0
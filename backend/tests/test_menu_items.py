@@ -0,0 +1,111 @@
+"""Bulk menu item upsert and menu week clone."""
+import json
+
+import pytest
+
+from app.db import SessionLocal
+from app.models import MenuItem
+
+VARIANTS = {"card": {"width": 640, "height": 480, "webp": "/media/menu_photos/a.webp", "fallback": "/x.jpg"}}
+
+
+@pytest.fixture
+def week(client, admin_headers):
+    return client.post(
+        "/admin/menu/weeks/",
+        json={"selling_days": "Thu", "published": False, "starts_at": "2026-09-03T00:00:00"},
+        headers=admin_headers,
+    ).json()
+
+
+def bulk(client, headers, items):
+    return client.post("/admin/menu/items/bulk", json=items, headers=headers)
+
+
+def test_bulk_returns_items_in_request_order(client, admin_headers, week):
+    existing = bulk(
+        client, admin_headers, [{"menu_week_id": week["id"], "name": n, "price_cents": 500} for n in ("A", "B")]
+    ).json()
+
+    response = bulk(
+        client,
+        admin_headers,
+        [
+            {"menu_week_id": week["id"], "name": "New 1", "price_cents": 700},
+            {"id": existing[1]["id"], "price_cents": 650},
+            {"menu_week_id": week["id"], "name": "New 2", "price_cents": 800, "available": False},
+            {"id": existing[0]["id"], "name": "A renamed"},
+            {"menu_week_id": week["id"], "name": "New 3", "price_cents": 900},
+        ],
+    )
+
+    assert response.status_code == 200, response.text
+    assert [(item["name"], item["price_cents"], item["available"]) for item in response.json()] == [
+        ("New 1", 700, True),
+        ("B", 650, True),
+        ("New 2", 800, False),
+        ("A renamed", 500, True),
+        ("New 3", 900, True),
+    ]
+    assert response.json()[1]["id"] == existing[1]["id"]
+
+
+def test_bulk_update_keeps_unsent_fields_and_variants(client, admin_headers, week):
+    item = bulk(client, admin_headers, [{"menu_week_id": week["id"], "name": "Soup", "price_cents": 400}]).json()[0]
+    db = SessionLocal()
+    try:
+        db.get(MenuItem, item["id"]).photo_variants = json.dumps(VARIANTS)
+        db.commit()
+    finally:
+        db.close()
+
+    updated = bulk(client, admin_headers, [{"id": item["id"], "price_cents": 450}]).json()[0]
+    assert (updated["name"], updated["price_cents"], updated["photo_variants"]) == ("Soup", 450, VARIANTS)
+
+    replaced = bulk(client, admin_headers, [{"id": item["id"], "photo_url": "https://example.com/soup.jpg"}]).json()[0]
+    assert replaced["photo_variants"] is None
+
+
+def test_bulk_new_item_needs_required_fields(client, admin_headers, week):
+    response = bulk(client, admin_headers, [{"menu_week_id": week["id"], "price_cents": 400}])
+    assert response.status_code == 422
+    assert "name" in response.text
+
+
+def test_bulk_writes_nothing_when_an_item_is_missing(client, admin_headers, week):
+    response = bulk(
+        client,
+        admin_headers,
+        [{"menu_week_id": week["id"], "name": "Ghost", "price_cents": 100}, {"id": 999999, "name": "Nope"}],
+    )
+
+    assert response.status_code == 404
+    items = client.get(f"/admin/menu/items/weeks/{week['id']}/items", headers=admin_headers).json()
+    assert "Ghost" not in [item["name"] for item in items]
+
+
+def test_clone_copies_items_with_photo_variants(client, admin_headers, week):
+    items = bulk(
+        client,
+        admin_headers,
+        [{"menu_week_id": week["id"], "name": n, "price_cents": 100 + i} for i, n in enumerate(("X", "Y"))],
+    ).json()
+    db = SessionLocal()
+    try:
+        db.get(MenuItem, items[0]["id"]).photo_variants = json.dumps(VARIANTS)
+        db.commit()
+    finally:
+        db.close()
+
+    response = client.post(f"/admin/menu/weeks/{week['id']}/clone", json={}, headers=admin_headers)
+
+    assert response.status_code == 201, response.text
+    clone = response.json()
+    assert clone["id"] != week["id"]
+    assert clone["starts_at"] == "2026-09-10T00:00:00"
+    assert clone["published"] is False
+    assert [(item["name"], item["price_cents"], item["photo_variants"]) for item in clone["items"]] == [
+        ("X", 100, VARIANTS),
+        ("Y", 101, None),
+    ]
+    assert {item["id"] for item in clone["items"]}.isdisjoint(item["id"] for item in items)
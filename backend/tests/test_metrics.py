@@ -0,0 +1,29 @@
+"""GET /metrics: token check, and staying off in production without a token."""
+from app.config import settings
+
+
+def test_metrics_served_without_token_outside_production(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "http_requests_total" in response.text
+
+
+def test_metrics_token_is_required_when_set(client, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-token")
+
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-token"})
+    assert response.status_code == 200
+
+
+def test_metrics_off_in_production_until_token_is_set(monkeypatch):
+    monkeypatch.setenv("NODE_ENV", "production")
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "")
+    assert not settings.metrics_exposed
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-token")
+    assert settings.metrics_exposed
+
+    monkeypatch.setattr(settings, "METRICS_ENABLED", False)
+    assert not settings.metrics_exposed
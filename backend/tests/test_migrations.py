@@ -0,0 +1,153 @@
+"""The migration runner against a database created by the baseline schema."""
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app import db_migrations
+from app.db import Base
+
+# The tables as the original create_all built them, before any migration.
+BASELINE_SCHEMA = """
+CREATE TABLE customers (
+    id INTEGER NOT NULL, name VARCHAR NOT NULL, phone VARCHAR NOT NULL, email VARCHAR,
+    address VARCHAR, city VARCHAR, zip_code VARCHAR, additional_phones TEXT, additional_emails TEXT,
+    sms_opt_in BOOLEAN NOT NULL, email_opt_in BOOLEAN NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (id), UNIQUE (phone), UNIQUE (email)
+);
+CREATE INDEX ix_customers_id ON customers (id);
+CREATE TABLE menu_weeks (
+    id INTEGER NOT NULL, selling_days VARCHAR NOT NULL, status VARCHAR(6) NOT NULL,
+    published BOOLEAN NOT NULL, starts_at DATETIME NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL, week_start_date DATETIME NOT NULL,
+    is_published BOOLEAN NOT NULL, PRIMARY KEY (id)
+);
+CREATE INDEX ix_menu_weeks_id ON menu_weeks (id);
+CREATE TABLE site_settings (
+    id INTEGER NOT NULL, "key" VARCHAR NOT NULL, value_json TEXT NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL, PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_site_settings_key ON site_settings ("key");
+CREATE INDEX ix_site_settings_id ON site_settings (id);
+CREATE TABLE stripe_webhook_events (
+    id INTEGER NOT NULL, event_id VARCHAR NOT NULL, event_type VARCHAR NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL, PRIMARY KEY (id)
+);
+CREATE INDEX ix_stripe_webhook_events_id ON stripe_webhook_events (id);
+CREATE UNIQUE INDEX ix_stripe_webhook_events_event_id ON stripe_webhook_events (event_id);
+CREATE TABLE menu_items (
+    id INTEGER NOT NULL, menu_week_id INTEGER NOT NULL, name VARCHAR NOT NULL, description VARCHAR,
+    photo_url VARCHAR, price_cents INTEGER NOT NULL, available BOOLEAN NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(menu_week_id) REFERENCES menu_weeks (id)
+);
+CREATE INDEX ix_menu_items_id ON menu_items (id);
+CREATE TABLE orders (
+    id INTEGER NOT NULL, customer_id INTEGER, customer_name VARCHAR, phone VARCHAR NOT NULL,
+    email VARCHAR, pickup_or_delivery VARCHAR NOT NULL, delivery_fee_cents INTEGER NOT NULL,
+    delivery_address VARCHAR, comment VARCHAR, total_cents INTEGER NOT NULL, status VARCHAR(9) NOT NULL,
+    stripe_session_id VARCHAR, payment_intent_id VARCHAR,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(customer_id) REFERENCES customers (id)
+);
+CREATE INDEX ix_orders_id ON orders (id);
+CREATE TABLE order_items (
+    id INTEGER NOT NULL, order_id INTEGER NOT NULL, menu_item_id INTEGER NOT NULL, qty INTEGER NOT NULL,
+    line_total_cents INTEGER NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(order_id) REFERENCES orders (id),
+    FOREIGN KEY(menu_item_id) REFERENCES menu_items (id)
+);
+CREATE INDEX ix_order_items_id ON order_items (id);
+"""
+
+BASELINE_ROWS = """
+INSERT INTO menu_weeks VALUES (1, 'Fri', 'OPEN', 1, '2025-01-03 00:00:00', '2025-01-01 00:00:00', '2025-01-03 00:00:00', 1);
+INSERT INTO menu_weeks VALUES (2, 'Fri', 'OPEN', 0, '2025-01-10 00:00:00', '2025-01-01 00:00:00', '2025-01-10 00:00:00', 0);
+INSERT INTO menu_items VALUES (1, 1, 'Pozole', NULL, NULL, 1200, 1, '2025-01-01 00:00:00');
+INSERT INTO menu_items VALUES (2, 2, 'Tamales', NULL, NULL, 900, 1, '2025-01-01 00:00:00');
+INSERT INTO customers VALUES (1, 'Ana', '620-262-1073', 'Ana@Example.com', NULL, NULL, NULL, NULL, NULL, 1, 0, '2025-01-01 00:00:00');
+INSERT INTO customers VALUES (2, 'Ana B', '(620) 262-1073', NULL, NULL, NULL, NULL, '["+1 316 555 0100"]', NULL, 1, 0, '2025-01-01 00:00:00');
+INSERT INTO orders VALUES (1, 1, 'Ana', '620-262-1073', NULL, 'pickup', 0, NULL, NULL, 3300, 'PAID', 'cs_1', NULL, '2025-01-02 00:00:00');
+INSERT INTO orders VALUES (2, 2, 'Ana B', '(620) 262-1073', NULL, 'pickup', 0, NULL, NULL, 0, 'PENDING', NULL, NULL, '2025-01-02 00:00:00');
+INSERT INTO order_items VALUES (1, 1, 1, 2, 2400);
+INSERT INTO order_items VALUES (2, 1, 2, 1, 900);
+INSERT INTO stripe_webhook_events VALUES (1, 'evt_1', 'checkout.session.completed', '2025-01-02 00:00:00');
+"""
+
+
+@pytest.fixture
+def baseline_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as conn:
+        for statement in (BASELINE_SCHEMA + BASELINE_ROWS).split(";"):
+            if statement.strip():
+                conn.execute(text(statement))
+    yield engine
+    engine.dispose()
+
+
+def rows(engine, sql):
+    with engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(text(sql))]
+
+
+def test_baseline_database_migrates_to_latest(baseline_engine):
+    applied = db_migrations.run_migrations(baseline_engine)
+
+    assert applied == len(db_migrations.MIGRATIONS)
+    assert db_migrations.current_version(baseline_engine) == db_migrations.LATEST_VERSION
+    # Warm start: nothing left to do.
+    assert db_migrations.run_migrations(baseline_engine) == 0
+
+
+def test_migrated_schema_matches_the_models(baseline_engine):
+    db_migrations.run_migrations(baseline_engine)
+
+    inspector = inspect(baseline_engine)
+    for table in Base.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        assert {column.name for column in table.columns} <= columns, table.name
+    assert db_migrations.index_report(baseline_engine)["missing"] == []
+
+
+def test_existing_rows_are_backfilled(baseline_engine):
+    db_migrations.run_migrations(baseline_engine)
+
+    # Latest week among the order's items; orders without items stay NULL.
+    assert rows(baseline_engine, "SELECT id, menu_week_id FROM orders ORDER BY id") == [(1, 2), (2, None)]
+    assert rows(baseline_engine, "SELECT item_name, unit_price_cents FROM order_items ORDER BY id") == [
+        ("Pozole", 1200),
+        ("Tamales", 900),
+    ]
+    # Events from before the inbox were already applied.
+    assert rows(baseline_engine, "SELECT status, attempts FROM stripe_webhook_events") == [("processed", 0)]
+
+
+def test_customer_phones_are_normalized_without_merging(baseline_engine):
+    db_migrations.run_migrations(baseline_engine)
+
+    assert rows(baseline_engine, "SELECT id, phone, email, additional_phones FROM customers ORDER BY id") == [
+        (1, "6202621073", "ana@example.com", "[]"),
+        (2, "(620) 262-1073", None, '["3165550100"]'),
+    ]
+    assert rows(baseline_engine, "SELECT id, customer_id FROM orders ORDER BY id") == [(1, 1), (2, 2)]
+    assert rows(
+        baseline_engine, "SELECT customer_id FROM customer_contacts WHERE kind = 'phone' ORDER BY customer_id, value"
+    ) == [(1,), (2,), (2,)]
+
+
+def test_interrupted_run_resumes(baseline_engine, monkeypatch):
+    step = db_migrations.MIGRATIONS[9]
+
+    def fail(engine, dialect):
+        raise db_migrations.SQLAlchemyError("boom")
+
+    failing = list(db_migrations.MIGRATIONS)
+    failing[9] = step._replace(apply=fail)
+    monkeypatch.setattr(db_migrations, "MIGRATIONS", failing)
+    with pytest.raises(RuntimeError, match=f"Migration {step.version}"):
+        db_migrations.run_migrations(baseline_engine)
+    assert db_migrations.current_version(baseline_engine) == step.version - 1
+
+    monkeypatch.undo()
+    assert db_migrations.run_migrations(baseline_engine) == len(db_migrations.MIGRATIONS) - 9
+    assert rows(baseline_engine, "SELECT item_name FROM order_items ORDER BY id") == [("Pozole",), ("Tamales",)]
@@ -0,0 +1,153 @@
+"""The admin order feed: resuming after an event id and ids that commit out of order."""
+import asyncio
+import json
+
+import pytest
+
+from app import order_events
+from app.config import settings
+from app.db import SessionLocal
+from app.models import Order, OrderEvent
+from app.routes import admin_orders
+
+from conftest import order_body
+
+
+def add_events(*ids):
+    db = SessionLocal()
+    try:
+        for event_id in ids:
+            db.add(OrderEvent(id=event_id, kind=order_events.UPDATED, order_id=0, data="{}"))
+        db.commit()
+    finally:
+        db.close()
+
+
+def record_update(order_id):
+    db = SessionLocal()
+    try:
+        order_events.record(db, order_events.UPDATED, db.get(Order, order_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def fetch(cursor):
+    db = SessionLocal()
+    try:
+        return [row.id for row in cursor.fetch(db)]
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def last_id(client):
+    db = SessionLocal()
+    try:
+        return order_events.latest_id(db)
+    finally:
+        db.close()
+
+
+def test_late_id_is_sent_once_it_commits(last_id):
+    cursor = order_events.Cursor(last_id)
+    add_events(last_id + 1, last_id + 3)
+
+    assert fetch(cursor) == [last_id + 1, last_id + 3]
+    assert list(cursor.gaps) == [last_id + 2]
+
+    add_events(last_id + 2)
+    assert fetch(cursor) == [last_id + 2]
+    assert cursor.gaps == {}
+    assert cursor.last_id == last_id + 3
+    assert fetch(cursor) == []
+
+
+def test_gaps_are_given_up_after_the_grace_period(last_id, monkeypatch):
+    cursor = order_events.Cursor(last_id)
+    add_events(last_id + 2)
+    assert fetch(cursor) == [last_id + 2]
+
+    monkeypatch.setattr(order_events, "GAP_GRACE_SECONDS", 0)
+    add_events(last_id + 1)
+    assert fetch(cursor) == []
+    assert cursor.gaps == {}
+
+
+def test_wide_gaps_are_not_tracked(last_id):
+    cursor = order_events.Cursor(last_id)
+    add_events(last_id + order_events.MAX_GAPS + 2)
+
+    assert fetch(cursor) == [last_id + order_events.MAX_GAPS + 2]
+    assert cursor.gaps == {}
+
+
+def parse(text):
+    """SSE text -> (id, event, data) for each event, skipping retry and comment lines."""
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n") if not line.startswith(":"))
+        if "id" in fields:
+            events.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_stream_resumes_after_the_given_id_then_sends_new_events(client, menu_items, last_id, monkeypatch):
+    monkeypatch.setattr(settings, "ORDER_FEED_KEEPALIVE_SECONDS", 5)
+    missed = client.post("/api/public/orders/", json=order_body(menu_items[:1], phone="5553201")).json()
+
+    async def run():
+        feed = order_events.stream(last_id)
+        try:
+            assert await feed.__anext__() == f"retry: {order_events.RETRY_MS}\n\n"
+            backlog = parse(await feed.__anext__())
+            pending = asyncio.ensure_future(feed.__anext__())
+            await asyncio.sleep(0.1)
+            assert not pending.done()
+            record_update(missed["id"])  # the commit wakes the stream
+            return backlog, parse(await asyncio.wait_for(pending, 5))
+        finally:
+            await feed.aclose()
+
+    backlog, live = asyncio.run(run())
+
+    assert [(kind, data["order_id"]) for _, kind, data in backlog] == [(order_events.CREATED, missed["id"])]
+    assert backlog[0][0] == last_id + 1
+    assert [(event_id, kind) for event_id, kind, _ in live] == [(last_id + 2, order_events.UPDATED)]
+
+
+def test_stream_without_a_resume_id_starts_at_the_latest_event(last_id, monkeypatch):
+    monkeypatch.setattr(settings, "ORDER_FEED_KEEPALIVE_SECONDS", 0.1)
+    add_events(last_id + 1)
+
+    async def run():
+        feed = order_events.stream()
+        try:
+            await feed.__anext__()
+            return await feed.__anext__()
+        finally:
+            await feed.aclose()
+
+    # The event already there is not sent.
+    assert asyncio.run(run()) == ": keep-alive\n\n"
+
+
+@pytest.mark.parametrize(
+    "headers, params, resume_from",
+    [({"Last-Event-ID": "41"}, {"after": 7}, 41), ({}, {"after": 7}, 7), ({}, {}, None)],
+)
+def test_route_resumes_from_last_event_id_or_after(client, admin_headers, monkeypatch, headers, params, resume_from):
+    calls = []
+
+    async def fake_stream(last_event_id=None):
+        calls.append(last_event_id)
+        yield "retry: 1\n\n"
+
+    monkeypatch.setattr(admin_orders.order_events, "stream", fake_stream)
+
+    response = client.get("/api/admin/orders/events", params=params, headers={**admin_headers, **headers})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    assert calls == [resume_from]
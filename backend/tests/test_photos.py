@@ -0,0 +1,77 @@
+"""Menu photo upload and its resized variants (app.photos)."""
+import functools
+import io
+
+import pytest
+from PIL import Image
+
+from app import photos
+from app.config import settings
+
+
+def image_bytes(size, mode="RGB", fmt="JPEG"):
+    buffer = io.BytesIO()
+    Image.new(mode, size, (200, 80, 40, 128)[: len(mode)]).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def photo_dir(tmp_path, monkeypatch):
+    """Uploads go to a temporary directory instead of media/."""
+    monkeypatch.setattr(photos, "create_variants", functools.partial(photos.create_variants, directory=tmp_path))
+    return tmp_path
+
+
+def stored(directory, url):
+    assert url.startswith(photos.PHOTO_URL_PREFIX)
+    path = directory / url[len(photos.PHOTO_URL_PREFIX):]
+    assert path.is_file()
+    return Image.open(path)
+
+
+def upload(client, headers, item_id, data, filename="photo.jpg"):
+    return client.post(
+        f"/admin/menu/items/{item_id}/photo", files={"photo": (filename, data, "image/jpeg")}, headers=headers
+    )
+
+
+def test_upload_stores_every_variant(client, admin_headers, menu_items, photo_dir):
+    response = upload(client, admin_headers, menu_items[0], image_bytes((2000, 1000)))
+
+    assert response.status_code == 200, response.text
+    item = response.json()
+    variants = item["photo_variants"]
+    assert set(variants) == set(photos.VARIANTS)
+    for name, max_width in photos.VARIANTS.items():
+        variant = variants[name]
+        assert (variant["width"], variant["height"]) == (max_width, max_width // 2)
+        assert stored(photo_dir, variant["webp"]).format == "WEBP"
+        fallback = stored(photo_dir, variant["fallback"])
+        assert (fallback.format, fallback.size) == ("JPEG", (max_width, max_width // 2))
+    assert item["photo_url"] == variants["card"]["fallback"]
+    # Nothing but the rendered files is left behind.
+    assert not [path for path in photo_dir.iterdir() if path.name.startswith(".")]
+
+    # Names follow the content, so the same photo again gives the same URLs.
+    again = upload(client, admin_headers, menu_items[1], image_bytes((2000, 1000))).json()
+    assert again["photo_variants"] == variants
+
+
+def test_small_transparent_photo_is_not_scaled_up_and_keeps_alpha(photo_dir):
+    variants = photos.create_variants(io.BytesIO(image_bytes((100, 50), mode="RGBA", fmt="PNG")))
+
+    assert {(v["width"], v["height"]) for v in variants.values()} == {(100, 50)}
+    # Identical renders share one file.
+    assert len({v["fallback"] for v in variants.values()}) == 1
+    assert stored(photo_dir, variants["thumb"]["fallback"]).format == "PNG"
+
+
+def test_bad_uploads_are_rejected(client, admin_headers, menu_items, photo_dir, monkeypatch):
+    assert upload(client, admin_headers, menu_items[0], b"not an image").status_code == 400
+    truncated = image_bytes((800, 600))[:400]
+    assert upload(client, admin_headers, menu_items[0], truncated).status_code == 400
+    assert upload(client, admin_headers, 999999, image_bytes((10, 10))).status_code == 404
+
+    monkeypatch.setattr(settings, "PHOTO_MAX_UPLOAD_MB", 0)
+    assert upload(client, admin_headers, menu_items[0], image_bytes((10, 10))).status_code == 413
+    assert list(photo_dir.iterdir()) == []
@@ -0,0 +1,109 @@
+"""
+Query budgets for the hot endpoints (app.query_audit.assert_max_queries).
+
+Each budget is the number of statements the endpoint needs today, measured
+with enough rows that a per-row query (an N+1) would blow it. Raise a budget
+only for a query that doesn't grow with the data.
+"""
+import pytest
+
+from app.cache import PUBLIC_MENU_KEY, public_cache
+from app.config import settings
+from app.query_audit import assert_max_queries
+
+from conftest import order_body
+
+ORDERS = 30
+
+
+@pytest.fixture
+def busy_week(client, admin_headers):
+    """A published week with eight items and ORDERS orders of four items each."""
+    week = client.post(
+        "/admin/menu/weeks/",
+        json={"selling_days": "Sat", "published": True, "starts_at": "2027-01-02T00:00:00"},
+        headers=admin_headers,
+    ).json()
+    item_ids = [
+        client.post(
+            "/admin/menu/items/",
+            json={"menu_week_id": week["id"], "name": f"Plate {n}", "price_cents": 900 + n},
+            headers=admin_headers,
+        ).json()["id"]
+        for n in range(8)
+    ]
+    for n in range(ORDERS):
+        body = order_body(item_ids[n % 4:n % 4 + 4], phone=f"555{n:04d}")
+        if n % 3 == 0:
+            body.update(pickup_or_delivery="delivery", delivery_address=f"{n} Main St")
+        assert client.post("/api/public/orders/", json=body).status_code == 201
+    return week["id"], item_ids
+
+
+def test_public_menu(client, busy_week):
+    public_cache.invalidate(PUBLIC_MENU_KEY)
+    # The published week, then its items.
+    with assert_max_queries(2):
+        response = client.get("/api/public/menu/")
+    assert response.status_code == 200
+    # Served from the cache until the menu changes.
+    with assert_max_queries(0):
+        assert client.get("/api/public/menu/").status_code == 200
+
+
+def test_order_creation_does_not_grow_with_items(client, busy_week):
+    _, item_ids = busy_week
+    # Menu lookup, customer upsert, contacts, order, items, tally, event.
+    with assert_max_queries(7):
+        response = client.post("/api/public/orders/", json=order_body(item_ids, phone="5559001"))
+    assert response.status_code == 201
+    assert len(response.json()["items"]) == len(item_ids)
+
+
+def test_idempotent_replay_skips_order_tables(client, busy_week):
+    _, item_ids = busy_week
+    headers = {"Idempotency-Key": "budget-replay"}
+    body = order_body(item_ids[:2], phone="5559002")
+    first = client.post("/api/public/orders/", json=body, headers=headers)
+    assert first.status_code == 201
+    # Expired-key delete, claim attempt, stored response.
+    with assert_max_queries(3) as log:
+        replay = client.post("/api/public/orders/", json=body, headers=headers)
+    assert replay.content == first.content
+    assert "orders" not in log.report() and "order_items" not in log.report()
+
+
+@pytest.mark.parametrize("fast", [False, True], ids=["orm", "fast_serialization"])
+def test_admin_order_list(client, admin_headers, busy_week, monkeypatch, fast):
+    monkeypatch.setattr(settings, "FAST_SERIALIZATION", fast)
+    week_id, _ = busy_week
+    # One page of orders, then all their items at once.
+    with assert_max_queries(2):
+        response = client.get("/api/admin/orders/", params={"week_id": week_id, "limit": 100}, headers=admin_headers)
+    assert response.status_code == 200
+    assert len(response.json()) == ORDERS
+
+
+def test_tally(client, admin_headers, busy_week):
+    week_id, _ = busy_week
+    with assert_max_queries(1):
+        response = client.get("/api/admin/orders/tally", params={"week_id": week_id}, headers=admin_headers)
+    assert response.json()["total_orders"] == ORDERS
+
+
+@pytest.mark.parametrize("path", ["special-requests", "deliveries"])
+def test_tally_lists(client, admin_headers, busy_week, path):
+    week_id, _ = busy_week
+    with assert_max_queries(1):
+        response = client.get(
+            f"/api/admin/orders/tally/{path}", params={"week_id": week_id, "limit": 500}, headers=admin_headers
+        )
+    assert response.status_code == 200
+    assert response.json()
+
+
+def test_admin_customer_list(client, admin_headers, busy_week):
+    # The page's ids, then those customers.
+    with assert_max_queries(2):
+        response = client.get("/api/admin/customers/", params={"limit": 500}, headers=admin_headers)
+    assert len(response.json()) >= ORDERS
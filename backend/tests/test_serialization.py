@@ -0,0 +1,87 @@
+"""FAST_SERIALIZATION sends exactly the bytes of the pydantic response path."""
+import json
+
+import pytest
+
+from app import serialization
+from app.config import settings
+from app.db import SessionLocal
+from app.models import MenuItem
+
+from conftest import order_body
+
+VARIANTS = {"thumb": {"width": 240, "height": 180, "webp": "/media/menu_photos/t.webp", "fallback": "/t.jpg"}}
+
+
+@pytest.fixture(scope="module")
+def varied_data(client, admin_headers):
+    """Orders, customers and items covering nulls, enums, non-ASCII text and JSON columns."""
+    week = client.post(
+        "/admin/menu/weeks/",
+        json={"selling_days": "Sáb", "published": True, "starts_at": "2026-11-07T10:30:00"},
+        headers=admin_headers,
+    ).json()
+    items = [
+        client.post(
+            "/admin/menu/items/",
+            json={"menu_week_id": week["id"], "name": name, "price_cents": 1250, "description": description},
+            headers=admin_headers,
+        ).json()["id"]
+        for name, description in (("Pozole rojo", "Con orégano 🌶"), ("Tamales", None), ("Flan \"casero\"", "\\n"))
+    ]
+    db = SessionLocal()
+    try:
+        db.get(MenuItem, items[0]).photo_variants = json.dumps(VARIANTS)
+        db.commit()
+    finally:
+        db.close()
+    for n in range(6):
+        body = order_body(items[: n % 3 + 1], phone=f"555700{n}", qty=n + 1)
+        body["comment"] = f"Name: Núñez {n} | sin cebolla"
+        if n % 2:
+            body.update(pickup_or_delivery="delivery", delivery_address=f"{n} Calle Ñandú", email=f"N{n}@Example.com")
+        assert client.post("/api/public/orders/", json=body).status_code == 201
+    client.post(
+        "/api/admin/customers/",
+        json={
+            "name": "José Ángel",
+            "phone": "555-700-9999",
+            "additional_phones": ["(555) 700-9998"],
+            "additional_emails": ["jose@example.com"],
+        },
+        headers=admin_headers,
+    )
+    return week["id"]
+
+
+@pytest.mark.parametrize(
+    "path, params",
+    [
+        ("/api/admin/orders/", {"limit": 4}),
+        ("/api/admin/orders/", {"limit": 500, "week_id": "WEEK"}),
+        ("/api/admin/customers/", {"limit": 3}),
+        ("/api/admin/customers/search", {"q": "555"}),
+        ("/api/admin/menu/", {}),
+        ("/admin/menu/weeks/", {}),
+    ],
+)
+def test_fast_path_is_byte_identical(client, admin_headers, varied_data, monkeypatch, path, params):
+    params = {name: varied_data if value == "WEEK" else value for name, value in params.items()}
+
+    monkeypatch.setattr(settings, "FAST_SERIALIZATION", False)
+    slow = client.get(path, params=params, headers=admin_headers)
+    monkeypatch.setattr(settings, "FAST_SERIALIZATION", True)
+    fast = client.get(path, params=params, headers=admin_headers)
+
+    assert slow.status_code == fast.status_code == 200
+    assert slow.json()
+    assert fast.content == slow.content
+    assert fast.headers["content-type"] == slow.headers["content-type"]
+    assert fast.headers.get("x-next-cursor") == slow.headers.get("x-next-cursor")
+
+
+def test_stdlib_encoder_matches_orjson(monkeypatch):
+    data = [{"name": "Ñandú 🌶", "n": 1, "x": None, "ok": True, "f": 1.5, "nested": {"a": ["\"\\\n"]}}]
+    with_orjson = serialization.dumps(data)
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert serialization.dumps(data) == with_orjson
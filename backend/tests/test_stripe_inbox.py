@@ -0,0 +1,89 @@
+"""The Stripe webhook inbox worker: outcomes are only written under a live lease."""
+import json
+import time
+
+import pytest
+
+from app import stripe_inbox
+from app.db import SessionLocal
+from app.models import StripeWebhookEvent
+
+
+@pytest.fixture
+def db(client):
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def event_id(db):
+    event_id = f"evt_inbox_{time.time_ns()}"
+    payload = json.dumps({"id": event_id, "type": "invoice.paid", "data": {"object": {}}})
+    assert stripe_inbox.enqueue_event(db, event_id, "invoice.paid", payload)
+    db.commit()
+    return event_id
+
+
+def stored(event_id):
+    db = SessionLocal()
+    try:
+        return db.query(StripeWebhookEvent).filter(StripeWebhookEvent.event_id == event_id).one()
+    finally:
+        db.close()
+
+
+def steal_lease(event_id):
+    """Another worker reclaims the event, as after our lease expired."""
+    db = SessionLocal()
+    try:
+        db.query(StripeWebhookEvent).filter(StripeWebhookEvent.event_id == event_id).update(
+            {"claimed_by": "another-worker"}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_processed_event_is_released(db, event_id):
+    stripe_inbox.drain_once(db)
+
+    event = stored(event_id)
+    assert event.status == stripe_inbox.PROCESSED
+    assert event.claimed_by is None
+    assert event.processed_at is not None
+
+
+def test_failure_backs_off(db, event_id, monkeypatch):
+    def fail(db, event_type, event):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(stripe_inbox, "apply_event", fail)
+    stripe_inbox.drain_once(db)
+
+    event = stored(event_id)
+    assert event.status == stripe_inbox.PENDING
+    assert event.attempts == 1
+    assert event.claimed_by is None
+    assert "boom" in event.last_error
+
+
+@pytest.mark.parametrize("outcome", ["processed", "failed"])
+def test_outcome_is_not_written_after_the_lease_was_lost(db, event_id, monkeypatch, outcome):
+    apply_event = stripe_inbox.apply_event
+
+    def slow_handler(db, event_type, event):
+        if event.get("id") == event_id:
+            steal_lease(event_id)
+            if outcome == "failed":
+                raise RuntimeError("boom")
+        apply_event(db, event_type, event)
+
+    monkeypatch.setattr(stripe_inbox, "apply_event", slow_handler)
+    stripe_inbox.drain_once(db)
+
+    event = stored(event_id)
+    assert event.status == stripe_inbox.PENDING
+    assert event.claimed_by == "another-worker"
+    assert event.attempts == 0
+    assert event.processed_at is None
@@ -2,6 +2,8 @@
 # smoke_test_api.sh — Local API smoke test
 # Usage: ADMIN_PASSWORD=yourpassword bash scripts/smoke_test_api.sh
 # Optional: BACKEND_URL=http://localhost:8010 (defaults to http://localhost:8010)
+# Optional: STRIPE_SECRET_KEY=sk_test_... to exercise checkout. Point the backend at
+#           stripe-mock (STRIPE_API_BASE=http://localhost:12111) to run this offline.
 set -euo pipefail
 
 BACKEND_URL=${BACKEND_URL:-http://localhost:${BACKEND_PORT:-8010}}
@@ -135,6 +137,16 @@ else
   [ -n "$stripe_url" ] && [ "$stripe_url" != "null" ] || fail "Stripe session creation failed: $stripe_resp"
   echo "$stripe_url" | grep -Eq '^https://checkout\.stripe\.com/' || fail "Expected Stripe checkout URL, got: $stripe_url"
   pass "Stripe checkout session created (session_id: $stripe_sid)"
+
+  # stripe-mock answers every create with the same fixture id, so this only
+  # checks the endpoint answers; backend/tests/test_checkout.py covers reuse.
+  info "Requesting checkout again for order $order_id (open session should be reused)"
+  stripe_resp2=$(curl -sf -X POST "$BACKEND_URL/api/public/checkout/session" \
+    -H "Content-Type: application/json" \
+    -d "{\"order_id\": $order_id}")
+  stripe_sid2=$(echo "$stripe_resp2" | jq -r '.session_id')
+  [ "$stripe_sid2" = "$stripe_sid" ] || fail "Expected session $stripe_sid to be reused, got: $stripe_resp2"
+  pass "Open Stripe checkout session reused"
 fi
 
 echo ""